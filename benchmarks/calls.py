@@ -0,0 +1,97 @@
+"""Function call overhead of each backend, in nanoseconds per Hoplite call.
+
+    python benchmarks/calls.py [backend ...]
+
+Every case is dominated by calls to small recursive functions, so the time
+per call is mostly the cost of the call and return protocol.
+"""
+import io
+import os
+import sys
+import time
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import Hoplite1
+
+FIB = 20
+FACTORIAL = 60
+FACTORIAL_RUNS = 300
+COUNTDOWN = 40
+COUNTDOWN_RUNS = 500
+
+
+def fib_calls(n):
+    a, b = 1, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return 2 * a - 1
+
+# name, program, number of Hoplite calls it makes
+CASES = [
+    ("fib", f"""
+mkfunc fib(n) {{
+    if (n < 2) {{
+        return n
+    }}
+    return fib(n - 1) + fib(n - 2)
+}}
+print(fib({FIB}))
+""", fib_calls(FIB)),
+    ("factorial", f"""
+mkfunc factorial(n) {{
+    if (n < 2) {{
+        return 1
+    }}
+    return n * factorial(n - 1)
+}}
+var i = 0
+while (i < {FACTORIAL_RUNS}) {{
+    factorial({FACTORIAL})
+    i += 1
+}}
+""", FACTORIAL * FACTORIAL_RUNS),
+    ("even_odd", f"""
+mkfunc is_even(n) {{
+    if (n == 0) {{
+        return true
+    }}
+    return is_odd(n - 1)
+}}
+mkfunc is_odd(n) {{
+    if (n == 0) {{
+        return false
+    }}
+    return is_even(n - 1)
+}}
+var i = 0
+while (i < {COUNTDOWN_RUNS}) {{
+    is_even({COUNTDOWN})
+    i += 1
+}}
+""", (COUNTDOWN + 1) * COUNTDOWN_RUNS),
+]
+
+
+def run(backend, program, repeat=3):
+    """Best wall time of `repeat` runs, parsing and optimizing excluded."""
+    best = None
+    for _ in range(repeat):
+        ast = Hoplite1.load_program(program, [])
+        evaluator = Hoplite1.BACKENDS[backend]()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            evaluator.execute(ast)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    backends = sys.argv[1:] or list(Hoplite1.BACKENDS)
+    print(f"{'case':<12}" + "".join(f"{backend:>12}" for backend in backends) + "   (ns/call)")
+    for name, program, calls in CASES:
+        row = f"{name:<12}"
+        for backend in backends:
+            row += f"{run(backend, program) / calls * 1e9:12.0f}"
+        print(row)
@@ -0,0 +1,124 @@
+"""Throughput of the streaming and memory-mapped I/O builtins, in MB/s.
+
+    python benchmarks/file_io.py [--size <MB>] [--file <path>] [backend ...]
+
+Without --file a log of --size megabytes (default 64) is generated in a
+temporary directory. Each case reads the whole file from a Hoplite program:
+line by line with read_lines, in 1 MB pieces with read_chunks, by searching a
+mapped file with find_bytes, and by copying it with write_lines. The direct
+column is the same work written directly in Python, for reference.
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import Hoplite1
+
+LEVELS = ["INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR"]
+
+def count_lines(path, out):
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+def count_bytes(path, out):
+    with open(path, "rb") as f:
+        return sum(len(chunk) for chunk in iter(lambda: f.read(1024 * 1024), b""))
+
+def count_errors(path, out):
+    with open(path, "rb") as f:
+        return f.read().count(b"ERROR")
+
+def copy_lines(path, out):
+    with open(path, encoding="utf-8") as source, open(out, "w", encoding="utf-8") as f:
+        f.writelines(source)
+
+# name, program (with PATH and OUT to fill in), plain Python doing the same
+CASES = [
+    ("lines", """
+var lines = read_lines(PATH)
+var count = 0
+while (has_next(lines)) {
+    next(lines)
+    count += 1
+}
+print(count)
+""", count_lines),
+    ("chunks", """
+var chunks = read_chunks(PATH, 1048576)
+var size = 0
+while (has_next(chunks)) {
+    size += length(next(chunks))
+}
+print(size)
+""", count_bytes),
+    ("mmap_find", """
+var log = mmap_file(PATH)
+var errors = 0
+var at = find_bytes(log, "ERROR", 0)
+while (at > -1) {
+    errors += 1
+    at = find_bytes(log, "ERROR", at + 1)
+}
+close(log)
+print(errors)
+""", count_errors),
+    ("write_lines", """
+print(write_lines(OUT, read_lines(PATH)))
+""", copy_lines),
+]
+
+
+def generate_log(path, megabytes):
+    size = megabytes * 1024 * 1024
+    written = 0
+    i = 0
+    with open(path, "w") as f:
+        while written < size:
+            line = f"2024-05-{i % 28 + 1:02d} 12:{i % 60:02d}:{i % 59:02d} {LEVELS[i % len(LEVELS)]} worker-{i % 16} request {i} took {i % 997} ms\n"
+            f.write(line)
+            written += len(line)
+            i += 1
+
+def best_time(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run(backend, program):
+    ast = Hoplite1.load_program(program, [])
+    evaluator = Hoplite1.BACKENDS[backend]()
+    with contextlib.redirect_stdout(io.StringIO()):
+        evaluator.execute(ast)
+
+
+def main(args):
+    size = int(Hoplite1.option_value(args, "--size", 64))
+    path = Hoplite1.option_value(args, "--file")
+    backends = [arg for arg in args if arg in Hoplite1.BACKENDS] or list(Hoplite1.BACKENDS)
+    with tempfile.TemporaryDirectory() as directory:
+        if path is None:
+            path = os.path.join(directory, "generated.log")
+            generate_log(path, size)
+        out = os.path.join(directory, "copy.log")
+        megabytes = os.path.getsize(path) / (1024 * 1024)
+        print(f"{path}: {megabytes:.1f} MB")
+        print(f"{'case':<12}" + "".join(f"{backend:>10}" for backend in backends + ["direct"]) + "   (MB/s)")
+        for name, program, direct in CASES:
+            program = program.replace("PATH", f'"{path}"').replace("OUT", f'"{out}"')
+            row = f"{name:<12}"
+            for backend in backends:
+                row += f"{megabytes / best_time(lambda: run(backend, program)):10.1f}"
+            row += f"{megabytes / best_time(lambda: direct(path, out)):10.1f}"
+            print(row)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,71 @@
+"""Memory used by the token list and the AST, in bytes per source line.
+
+    python benchmarks/memory.py [file.hpl ...]
+
+Without arguments a large program is generated from the shapes found in
+examples/stdlib.hpl.
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import Lexer
+import Parser
+
+
+def generated_program(functions=2000):
+    parts = []
+    for i in range(functions):
+        parts.append(f"""
+mkfunc helper_{i}(x, y) {{
+    var total = 0
+    var step = 1.5
+    while (total < x * {i % 7 + 1}) {{
+        total = total + step * y
+        if (total > 100) {{
+            return total - {i}
+        }} else {{
+            total += 1
+        }}
+    }}
+    return [total, "helper_{i % 10}", true]
+}}
+var result_{i} = helper_{i}({i}, 2)
+""")
+    return "".join(parts)
+
+
+def measure(program):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tokens = Lexer.tokenize(program)
+    token_bytes = tracemalloc.get_traced_memory()[0]
+    ast = Parser.parse_program(tokens)
+    total_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    lines = program.count("\n") + 1
+    return {
+        "lines": lines,
+        "tokens": len(tokens),
+        "token_bytes_per_line": token_bytes / lines,
+        "ast_bytes_per_line": (total_bytes - token_bytes) / lines,
+        "bytes_per_line": total_bytes / lines,
+        "bytes_per_token": total_bytes / len(tokens),
+    }
+
+
+def report(name, result):
+    print(f"{name}: {result['lines']} lines, {result['tokens']} tokens")
+    print(f"  tokens {result['token_bytes_per_line']:8.1f} B/line")
+    print(f"  AST    {result['ast_bytes_per_line']:8.1f} B/line")
+    print(f"  total  {result['bytes_per_line']:8.1f} B/line ({result['bytes_per_token']:.1f} B/token)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            with open(path, "r") as f:
+                report(path, measure(f.read()))
+    else:
+        report("generated", measure(generated_program()))
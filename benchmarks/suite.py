@@ -0,0 +1,276 @@
+"""Benchmark suite timing the lexer, parser, preparation and execution phases.
+
+    python benchmarks/suite.py [options] [case ...]
+
+    -b <backend>          backend to execute on (default tree)
+    --repeat <n>          timed runs of each case (default 5)
+    --warmup <n>          untimed runs before them (default 1)
+    --json <file>         write the results as JSON
+    --baseline <file>     baseline to compare against (default benchmarks/baseline.json)
+    --save-baseline       store these results as the baseline
+    --check               compare against the baseline, exit 1 on a regression
+    --tolerance <ratio>   slowdown allowed by --check (default 0.25, i.e. 25%)
+
+Other flags (-O0, --no-memo, --lazy, ...) are passed on as they would be to
+Hoplite1.py. Each phase reports the best time over the repeats, which is the
+least noisy figure on a busy machine, and the peak memory it allocated, from
+one extra run under tracemalloc. Baselines only mean something on the machine
+that recorded them, so none is checked in: save one before a change, then
+--check after it.
+"""
+import io
+import os
+import sys
+import json
+import time
+import platform
+import contextlib
+import tracemalloc
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "src"))
+sys.path.insert(0, BENCHMARKS)
+import Lexer
+import Parser
+import Hoplite1
+from memory import generated_program
+
+PHASES = ("lex", "parse", "prepare", "execute")
+DEFAULT_BASELINE = os.path.join(BENCHMARKS, "baseline.json")
+# phases faster than this are too noisy to fail a check on
+MIN_CHECKED_SECONDS = 0.001
+
+
+def include_programs(files=200):
+    # many small files, each defining a few functions, like a directory given to -i
+    programs = []
+    for i in range(files):
+        programs.append(f"""
+mkfunc area_{i}(w, h) {{
+    return w * h + {i}
+}}
+mkfunc scale_{i}(x) {{
+    if (x > {i}) {{
+        return x / 2
+    }}
+    return x * 2
+}}
+var loaded_{i} = scale_{i}(area_{i}(3, 4))
+""")
+    return programs
+
+def stdlib_program():
+    # the numeric routines of examples/stdlib.hpl, plus a loop with invariants
+    # in its body, for comparing -O1 with -O2
+    with open(os.path.join(BENCHMARKS, "..", "examples", "stdlib.hpl")) as f:
+        stdlib = f.read()
+    return stdlib + """
+mkfunc integrate_square(a, b, n) {
+    var total = 0.0
+    var i = 0
+    while (i < n) {
+        var step = (b - a) / n
+        var x = a + (i + 0.5) * step
+        total = total + (x ^ 2) * step
+        i += 1
+    }
+    return total
+}
+var angle = 0
+var acc = 0.0
+while (angle < 2000) {
+    acc = acc + sqrt(deg_to_rad(angle) + 1) + rad_to_deg(angle / 1000) + factorial(angle % 12)
+    angle += 1
+}
+print(acc)
+print(integrate_square(0, 3, 20000))
+"""
+
+def library_program(functions=500):
+    # a large library of which the program calls two functions, as with --lazy
+    declarations = "".join(line for line in generated_program(functions).splitlines(True)
+                           if not line.startswith("var result_"))
+    return declarations + f"print(helper_0(3, 2))\nprint(helper_{functions - 1}(5, 2))\n"
+
+# name, list of sources executed in order on one evaluator
+CASES = [
+    ("numeric_loop", ["""
+var total = 0.0
+var i = 0
+while (i < 20000) {
+    total = total + i * 0.5 - i % 7
+    i += 1
+}
+print(total)
+"""]),
+    ("counted_loop", ["""
+mkfunc grid(n) {
+    var total = 0
+    for (var i = 0; i < n; i += 1) {
+        for (var j = 0; j < n; j += 1) {
+            total = total + i * j
+        }
+    }
+    return total
+}
+print(grid(150))
+"""]),
+    ("recursion", ["""
+mkfunc ackermann(m, n) {
+    if (m == 0) {
+        return n + 1
+    }
+    if (n == 0) {
+        return ackermann(m - 1, 1)
+    }
+    return ackermann(m - 1, ackermann(m, n - 1))
+}
+mkfunc fib(n) {
+    if (n < 2) {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+print(fib(16))
+print(ackermann(2, 40))
+"""]),
+    ("arrays", ["""
+var items = []
+var i = 0
+while (i < 2000) {
+    items = items + [i, i * 2]
+    i += 1
+}
+print(items)
+"""]),
+    ("strings", ["""
+var text = ""
+var i = 0
+while (i < 5000) {
+    text = text + "ab"
+    if (i % 100 == 0) {
+        text = text + "\\n"
+    }
+    i += 1
+}
+print(text)
+"""]),
+    ("stdlib_numeric", [stdlib_program()]),
+    ("large_source", [generated_program(500)]),
+    ("library", [library_program()]),
+    ("includes", include_programs()),
+]
+
+
+def run_phases(programs, backend, args, timer):
+    """Runs each phase of every program through timer(function), totalling the measurements it returns."""
+    totals = dict.fromkeys(PHASES, 0)
+    evaluator = Hoplite1.BACKENDS[backend]()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for program in programs:
+            tokens, measured = timer(lambda: Lexer.tokenize(program))
+            totals["lex"] += measured
+            ast, measured = timer(lambda: Parser.parse_program(tokens, "--lazy" in args))
+            totals["parse"] += measured
+            ast, measured = timer(lambda: Hoplite1.prepare_program(ast, args))
+            totals["prepare"] += measured
+            _, measured = timer(lambda: evaluator.execute(ast))
+            totals["execute"] += measured
+    return totals
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def traced(function):
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function()
+    return result, tracemalloc.get_traced_memory()[1] - before
+
+def run_case(programs, backend, args, repeat, warmup):
+    for _ in range(warmup):
+        run_phases(programs, backend, args, timed)
+    runs = [run_phases(programs, backend, args, timed) for _ in range(repeat)]
+    tracemalloc.start()
+    try:
+        peaks = run_phases(programs, backend, args, traced)
+    finally:
+        tracemalloc.stop()
+    return {
+        phase: {
+            "best": min(run[phase] for run in runs),
+            "mean": sum(run[phase] for run in runs) / len(runs),
+            "peak_bytes": peaks[phase],
+        }
+        for phase in PHASES
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing each phase against the baseline, and whether any regressed."""
+    lines = []
+    regressed = False
+    for name, phases in results["cases"].items():
+        previous = baseline["cases"].get(name)
+        if previous is None:
+            continue
+        for phase, result in phases.items():
+            before = previous[phase]["best"]
+            ratio = result["best"] / before if before else 1.0
+            slower = ratio > 1 + tolerance and max(before, result["best"]) >= MIN_CHECKED_SECONDS
+            regressed = regressed or slower
+            lines.append(f"{name:<14}{phase:<9}{before * 1000:10.2f} ms{result['best'] * 1000:10.2f} ms"
+                         f"{ratio - 1:+9.1%}{'  REGRESSION' if slower else ''}")
+    return lines, regressed
+
+
+def main(args):
+    backend = Hoplite1.option_value(args, "-b", "tree")
+    repeat = int(Hoplite1.option_value(args, "--repeat", 5))
+    warmup = int(Hoplite1.option_value(args, "--warmup", 1))
+    tolerance = float(Hoplite1.option_value(args, "--tolerance", 0.25))
+    baseline_file = Hoplite1.option_value(args, "--baseline", DEFAULT_BASELINE)
+    names = [arg for arg in args if any(arg == name for name, _ in CASES)]
+    results = {
+        "backend": backend,
+        "args": [arg for arg in args if arg.startswith("-O") or arg in ("--no-memo", "--lazy")],
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "cases": {},
+    }
+    print(f"{'case':<14}" + "".join(f"{phase:>12}" for phase in PHASES) + "   (best ms / peak KB)")
+    for name, programs in CASES:
+        if names and name not in names:
+            continue
+        result = results["cases"][name] = run_case(programs, backend, args, repeat, warmup)
+        print(f"{name:<14}" + "".join(f"{result[phase]['best'] * 1000:12.2f}" for phase in PHASES))
+        print(f"{'':<14}" + "".join(f"{result[phase]['peak_bytes'] / 1024:12.0f}" for phase in PHASES))
+    if "--json" in args:
+        with open(Hoplite1.option_value(args, "--json"), "w") as f:
+            json.dump(results, f, indent=2)
+    if "--save-baseline" in args:
+        with open(baseline_file, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {baseline_file}")
+    if "--check" in args:
+        if not os.path.isfile(baseline_file):
+            print(f"no baseline at {baseline_file}, run with --save-baseline first")
+            return 1
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline["backend"] != backend or baseline["args"] != results["args"]:
+            print("warning: the baseline was recorded with different options")
+        lines, regressed = compare(results, baseline, tolerance)
+        print()
+        print(f"{'case':<14}{'phase':<9}{'baseline':>13}{'now':>13}{'change':>9}")
+        print("\n".join(lines))
+        if regressed:
+            print(f"slower than the baseline by more than {tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,72 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Numeric arrays, backed by NumPy.
+#
+# `[...]` still builds a Python list, so `+` on two of them concatenates.
+# array([...]), zeros(n) and range_array(a, b) build a NumPy array instead.
+# Every backend applies Hoplite's operators with Python's, so + - * / % ^ on
+# arrays run element-wise inside NumPy, comparisons give boolean masks and an
+# array mixed with a number broadcasts, with no interpreted loop per element.
+#
+# sum/min/max/dot reduce arrays in NumPy and lists in Python, so they work
+# without NumPy installed; building an array needs it.
+
+
+def require_numpy(name):
+    if numpy is None:
+        raise Exception(f"{name}() needs NumPy, which is not installed")
+
+def is_array(value):
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+def scalar(value):
+    # NumPy scalars become the Python numbers the rest of the interpreter expects
+    if numpy is not None and isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+def array(values):
+    require_numpy("array")
+    result = numpy.array(values)
+    if result.ndim != 1 or result.dtype.kind not in "biuf":
+        raise Exception("array() needs a list of numbers or booleans")
+    return result
+
+def zeros(length):
+    require_numpy("zeros")
+    return numpy.zeros(length)
+
+def range_array(start, stop):
+    require_numpy("range_array")
+    return numpy.arange(start, stop)
+
+
+def total(values):
+    if is_array(values):
+        return scalar(numpy.sum(values))
+    return sum(values)
+
+def minimum(values):
+    if len(values) == 0:
+        raise Exception("min() of an empty array")
+    if is_array(values):
+        return scalar(numpy.min(values))
+    return min(values)
+
+def maximum(values):
+    if len(values) == 0:
+        raise Exception("max() of an empty array")
+    if is_array(values):
+        return scalar(numpy.max(values))
+    return max(values)
+
+def dot(left, right):
+    if len(left) != len(right):
+        raise Exception(f"dot() of arrays of different lengths ({len(left)} and {len(right)})")
+    if is_array(left) or is_array(right):
+        return scalar(numpy.dot(left, right))
+    return sum(l * r for l, r in zip(left, right))
@@ -0,0 +1,302 @@
+import asyncio
+import inspect
+import operator
+import Parser_types as PTypes
+import Tokens as Token
+import Optimizer
+import Counted
+
+# async functions, `await` and the asyncio event loop.
+#
+# Calling an `async mkfunc` starts it as an asyncio task and gives the task
+# back straight away; `await` waits for a task (or any other awaitable) and
+# gives its value. Anything that is not awaitable awaits to itself.
+#
+# Programs that declare async functions, await or call the async builtins
+# run on the evaluator's event loop, one run_until_complete per execute(), so
+# the REPL and -f mode drive the same loop. Top-level statements without an
+# await still run on the evaluator's own backend; the ones with an await,
+# and the bodies of async functions, run here on a coroutine version of the
+# tree-walker that hands every await-free part back to the synchronous one.
+# Before execute() returns it waits for the tasks the program left running.
+#
+# `await` anywhere else (inside a function that is not async) is an error.
+
+AUGMENTED_OPERATIONS = {
+    Token.TOKENTYPE.PLUS_EQUAL: operator.iadd,
+    Token.TOKENTYPE.MINUS_EQUAL: operator.isub,
+    Token.TOKENTYPE.TIMES_EQUAL: operator.imul,
+    Token.TOKENTYPE.DIVIDE_EQUAL: operator.itruediv,
+    Token.TOKENTYPE.MODULO_EQUAL: operator.imod,
+    Token.TOKENTYPE.CARAT_EQUAL: operator.ipow,
+}
+
+
+def running_loop(name):
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        raise Exception(f"{name}() needs the event loop, which only runs for programs "
+                        "that use async functions or await") from None
+
+def sleep(seconds):
+    return running_loop("sleep").create_task(asyncio.sleep(seconds))
+
+def read_text(path):
+    with open(path, "r") as f:
+        return f.read()
+
+def read_file_async(path):
+    return running_loop("read_file_async").run_in_executor(None, read_text, path)
+
+def gather(*awaitables):
+    if len(awaitables) == 1 and isinstance(awaitables[0], list):
+        awaitables = awaitables[0]
+    running_loop("gather")
+    return asyncio.gather(*awaitables)
+
+BUILTINS = {
+    "sleep": sleep,
+    "read_file_async": read_file_async,
+    "gather": gather,
+}
+
+# Both answers are kept on the node (node.awaits, node.event_loop), so a
+# node is walked once however often it runs; mark_program works them out for
+# a whole program while it is prepared.
+
+def contains_await(node):
+    """Whether node awaits, outside the bodies of the functions it declares."""
+    found = getattr(node, "awaits", None)
+    if found is None:
+        # a declaration's body only runs when the function is called
+        found = node.awaits = not isinstance(node, PTypes.FunctionDeclaration) \
+            and any(isinstance(child, PTypes.Await) for child in PTypes.walk(node))
+    return found
+
+def needs_event_loop(statement):
+    """Whether a top-level statement awaits, declares an async function or calls an async builtin."""
+    found = getattr(statement, "event_loop", None)
+    if found is None:
+        found = statement.event_loop = any(
+            isinstance(node, PTypes.Await)
+            or isinstance(node, PTypes.FunctionDeclaration) and node.is_async
+            or isinstance(node, PTypes.FunctionCall) and node.name in BUILTINS
+            for node in PTypes.walk(statement))
+    return found
+
+def mark_program(ast):
+    for statement in ast:
+        if statement is not None:
+            needs_event_loop(statement)
+            contains_await(statement)
+    return ast
+
+
+class AsyncRunner:
+    """The event loop of one evaluator and the coroutine tree-walker."""
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.loop = None
+        self.running = False
+        self.tasks = set()
+
+    def contains_await(self, node):
+        return node is not None and contains_await(node)
+
+    def needed(self, ast):
+        """Whether a program has to run on the event loop."""
+        if self.running:
+            return False
+        if any(statement is not None and needs_event_loop(statement) for statement in ast):
+            return True
+        return any(isinstance(value, PTypes.FunctionDeclaration) and value.is_async
+                   for value in self.evaluator.global_symbol_table.values())
+
+    def execute(self, ast):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        limits = self.evaluator.limits
+        self.running = True
+        if limits is not None:
+            limits.start()
+        try:
+            program = self.run_program(ast)
+            if limits is not None and limits.timeout is not None:
+                program = asyncio.wait_for(program, limits.remaining_time())
+            try:
+                return self.loop.run_until_complete(program)
+            except asyncio.TimeoutError:
+                raise limits.timed_out() from None
+            except RecursionError:
+                if limits is None:
+                    raise
+                raise limits.too_deep() from None
+        finally:
+            self.running = False
+            if limits is not None:
+                limits.stop()
+            if self.tasks:
+                # an error ended the program: stop whatever it left running
+                tasks = list(self.tasks)
+                for task in tasks:
+                    task.cancel()
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.evaluator.output.flush()
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
+
+    def start(self, func, scope):
+        """Starts a call of the async function func with its parameters bound in scope."""
+        task = running_loop(func.name).create_task(self.run_function(func, scope))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def run_program(self, ast):
+        evaluator = self.evaluator
+        symbols = evaluator.global_symbol_table
+        results = []
+        chunk = []
+        for node in ast:
+            if not self.contains_await(node):
+                chunk.append(node)
+                continue
+            if chunk:
+                results += type(evaluator).execute(evaluator, chunk)
+                chunk = []
+            if isinstance(node, PTypes.Statement):
+                signal = await self.execute_statement(node, symbols)
+                if signal is not None:
+                    raise signal
+            else:
+                result = await self.evaluate(node, symbols)
+                if result is not None:
+                    results.append(result)
+        if chunk:
+            results += type(evaluator).execute(evaluator, chunk)
+        while self.tasks:
+            await asyncio.gather(*self.tasks)
+        return results
+
+    async def run_function(self, func, scope):
+        if self.evaluator.limits is not None:
+            self.evaluator.limits.tick()
+        signal = await self.execute_block(func.body, scope)
+        if signal is not None:
+            return signal.value
+        return None
+
+    async def execute_block(self, statements, scope):
+        for statement in statements:
+            signal = await self.execute_statement(statement, scope)
+            if signal is not None:
+                return signal
+        return None
+
+    async def execute_statement(self, node, scope):
+        evaluator = self.evaluator
+        limits = evaluator.limits
+        if not self.contains_await(node):
+            return evaluator.execute_statement(node, scope)
+        if isinstance(node, PTypes.ReturnStatement):
+            # the tree-walker builds the signal it expects back
+            value = await self.evaluate(node.value, scope)
+            return evaluator.execute_statement(PTypes.ReturnStatement(PTypes.Literal(value)), scope)
+        elif isinstance(node, PTypes.IfStatement):
+            if await self.evaluate(node.condition, scope):
+                return await self.execute_block(node.if_body, scope)
+            elif node.else_body is not None:
+                return await self.execute_block(node.else_body, scope)
+        elif isinstance(node, PTypes.WhileStatement):
+            while await self.evaluate(node.condition, scope):
+                if limits is not None:
+                    limits.tick()
+                signal = await self.execute_block(node.body, scope)
+                if signal is not None:
+                    return signal
+        elif isinstance(node, PTypes.ForStatement) and not node.parallel and Counted.counted_loop(node):
+            counted = Counted.counted_loop(node)
+            await self.execute_statement(node.init, scope)
+            values = counted.values(scope[counted.name], evaluator.evaluate(counted.bound, scope))
+            for value in values:
+                scope[counted.name] = value
+                if limits is not None:
+                    limits.tick()
+                signal = await self.execute_block(node.body, scope)
+                if signal is not None:
+                    return signal
+            scope[counted.name] = Counted.final(values)
+        elif isinstance(node, PTypes.ForStatement) and not node.parallel:
+            await self.execute_statement(node.init, scope)
+            while await self.evaluate(node.condition, scope):
+                if limits is not None:
+                    limits.tick()
+                signal = await self.execute_block(node.body, scope)
+                if signal is not None:
+                    return signal
+                await self.execute_statement(node.update, scope)
+        elif isinstance(node, PTypes.VariableDeclaration):
+            scope[node.name] = await self.evaluate(node.value, scope)
+        elif isinstance(node, PTypes.Assignment):
+            scope[node.variable] = await self.evaluate(node.value, scope)
+        elif isinstance(node, PTypes.AugmentedAssignment):
+            right = await self.evaluate(node.value, scope)
+            operation = AUGMENTED_OPERATIONS[node.op]
+            if limits is not None:
+                operation = {Token.TOKENTYPE.PLUS_EQUAL: limits.iadd,
+                             Token.TOKENTYPE.TIMES_EQUAL: limits.imultiply,
+                             Token.TOKENTYPE.CARAT_EQUAL: limits.ipower}.get(node.op, operation)
+            scope[node.variable] = operation(scope[node.variable], right)
+        elif isinstance(node, PTypes.Expression):
+            await self.evaluate(node, scope)
+        else:
+            raise Exception(f"'await' is not supported in {type(node).__name__}")
+        return None
+
+    async def evaluate(self, node, scope):
+        evaluator = self.evaluator
+        if not self.contains_await(node):
+            return evaluator.evaluate(node, scope)
+        if isinstance(node, PTypes.Await):
+            value = await self.evaluate(node.value, scope)
+            if inspect.isawaitable(value):
+                value = await value
+            return value
+        elif isinstance(node, PTypes.BinaryOperation):
+            left = await self.evaluate(node.left, scope)
+            right = await self.evaluate(node.right, scope)
+            return evaluator.perform_binary_operation(node.op, left, right)
+        elif isinstance(node, PTypes.ComparisonOperation):
+            left = await self.evaluate(node.left, scope)
+            right = await self.evaluate(node.right, scope)
+            return Optimizer.COMPARISON_OPERATIONS[node.op](left, right)
+        elif isinstance(node, PTypes.UnaryOperation):
+            return evaluator.perform_unary_operation(node.op, await self.evaluate(node.operand, scope))
+        elif isinstance(node, PTypes.ArrayLiteral):
+            return [await self.evaluate(element, scope) for element in node.elements]
+        elif isinstance(node, PTypes.FunctionCall):
+            arguments = [await self.evaluate(argument, scope) for argument in node.arguments]
+            return self.call(node.name, arguments)
+        elif isinstance(node, PTypes.MethodCall):
+            # the method gets its arguments as nodes, as from the tree-walker
+            arguments = [PTypes.Literal(await self.evaluate(argument, scope)) for argument in node.arguments]
+            return evaluator.handle_method_call(PTypes.MethodCall(node.variable, node.method, arguments), scope)
+        raise Exception(f"'await' is not supported in {type(node).__name__}")
+
+    def call(self, name, arguments):
+        """A call with evaluated arguments, as the tree-walker would make it."""
+        evaluator = self.evaluator
+        if name in evaluator.std_functions and evaluator.calls_builtin(name):
+            call = PTypes.FunctionCall(name, [PTypes.Literal(argument) for argument in arguments])
+            return evaluator.handle_std_function_call(call, {})
+        func = evaluator.global_symbol_table.get(name)
+        if not func:
+            raise Exception(f"Function '{name}' not defined")
+        if len(arguments) != len(func.parameters):
+            raise Exception(f"Expected {len(func.parameters)} arguments, got {len(arguments)}")
+        return evaluator.call_function(func, arguments)
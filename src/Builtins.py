@@ -0,0 +1,74 @@
+import inspect
+import functools
+import Arrays
+import Async
+import Streams
+import Parser_types as PTypes
+
+# Functions a Hoplite program can call without declaring them.
+#
+# print and time are compiled specially by every backend. Everything in
+# FUNCTIONS is an ordinary Python function taking the evaluated arguments;
+# those in EVALUATOR_FUNCTIONS also take the evaluator running them, first.
+# Each evaluator binds both into its `builtins` and the backends call those
+# directly. print and time are found before any mkfunc of the same name; the
+# other builtins only when no mkfunc of that name has been declared, so a
+# program's own `max` or `next` keeps working (see calls_builtin).
+
+FUNCTIONS = {
+    "array": Arrays.array,
+    "zeros": Arrays.zeros,
+    "range_array": Arrays.range_array,
+    "sum": Arrays.total,
+    "min": Arrays.minimum,
+    "max": Arrays.maximum,
+    "dot": Arrays.dot,
+    **Async.BUILTINS,
+    **Streams.BUILTINS,
+}
+
+
+
+def flush(evaluator):
+    evaluator.output.flush()
+
+def pmap(evaluator, function, values):
+    return evaluator.parallel.map(function, values)
+
+EVALUATOR_FUNCTIONS = {
+    "flush": flush,
+    "pmap": pmap,
+}
+
+COMPILED = frozenset(("print", "time"))
+CALLABLE = frozenset(FUNCTIONS) | frozenset(EVALUATOR_FUNCTIONS)
+NAMES = COMPILED | CALLABLE
+
+
+def calls_builtin(symbols, name):
+    """Whether a call to name, one of NAMES, runs the builtin rather than a mkfunc in symbols."""
+    return name in COMPILED or not isinstance(symbols.get(name), PTypes.FunctionDeclaration)
+
+
+def functions(evaluator):
+    """The builtins of one evaluator, by name."""
+    bound = dict(FUNCTIONS)
+    for name, function in EVALUATOR_FUNCTIONS.items():
+        bound[name] = functools.partial(function, evaluator)
+    if evaluator.limits is not None:
+        bound = {name: evaluator.limits.checked_builtin(name, function) for name, function in bound.items()}
+    return bound
+
+def arity_error(name, argument_count):
+    """The error for calling the builtin name with argument_count arguments, or None."""
+    if name in EVALUATOR_FUNCTIONS:
+        code = EVALUATOR_FUNCTIONS[name].__code__
+        expected = code.co_argcount - 1
+    else:
+        code = FUNCTIONS[name].__code__
+        expected = code.co_argcount
+    if code.co_flags & inspect.CO_VARARGS:
+        return None
+    if argument_count != expected:
+        return Exception(f"Expected {expected} arguments, got {argument_count}")
+    return None
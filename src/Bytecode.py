@@ -0,0 +1,442 @@
+import Parser_types as PTypes
+import Tokens as Token
+import Resolver
+import Lazy
+import Counted
+import Builtins
+
+# Bytecode for the stack VM in VM.py.
+#
+# A CodeObject holds a flat list of ints laid out as [op, arg, op, arg, ...],
+# a constant pool and a name table. Jump arguments are absolute offsets into
+# the instruction list. Every instruction has an argument (0 when unused), so
+# the program counter always advances by two.
+#
+# Functions the Resolver could give slots to use *_FAST instructions on a
+# list frame; CodeObject.local_names then names the slots. Everything else
+# runs on a dict scope with the *_NAME instructions.
+#
+# Code compiled for a limited evaluator (see Limits.py) has a TICK at the top
+# of every loop body and function, and the CHECKED_* instructions in place of
+# + * ^, of -O2's SQUARE and of augmented += *= ^=. The VM stops call chains deeper than the
+# limits' max_depth.
+#
+# A counted for loop (see Counted.py) keeps its values and their iterator on
+# the stack while it runs; each FOR_COUNTED stores the next value straight
+# into the counter.
+
+LOAD_NAME = 0              # push scope[names[arg]]
+LOAD_CONST = 1             # push consts[arg]
+STORE_NAME = 2             # scope[names[arg]] = pop()
+POP_JUMP_IF_FALSE = 3      # jump to arg if not pop()
+JUMP = 4                   # jump to arg
+ADD = 5
+SUBTRACT = 6
+MULTIPLY = 7
+DIVIDE = 8
+MODULO = 9
+POWER = 10
+LESS_THAN = 11
+GREATER_THAN = 12
+LESS_THAN_OR_EQUAL = 13
+GREATER_THAN_OR_EQUAL = 14
+IS_EQUAL = 15
+NOT_EQUAL = 16
+NEGATE = 17
+NOT = 18
+PREPARE_CALL = 19          # push the function named by consts[arg] = (name, argc), checking arity
+CALL = 20                  # call the function sitting below the top arg values
+RETURN_VALUE = 21          # pop the current frame, handing pop() back to the caller
+POP = 22                   # discard the top of the stack
+POP_RESULT = 23            # top-level expression statement: record pop() as a result
+BUILD_LIST = 24            # replace the top arg values with a list of them
+AUG_ADD = 25               # scope[names[arg]] op= pop()
+AUG_SUBTRACT = 26
+AUG_MULTIPLY = 27
+AUG_DIVIDE = 28
+AUG_MODULO = 29
+AUG_POWER = 30
+PRINT = 31                 # print(pop()), push None
+TIME = 32                  # push time.time()
+DECLARE_FUNCTION = 33      # declare the function consts[arg] in the global symbol table
+EVALUATE = 34              # push the tree-walker's value for the node consts[arg]
+RAISE_RETURN = 35          # `return` outside a function: raise Eval.ReturnValue(pop())
+LOAD_FAST = 36             # push frame[arg]
+STORE_FAST = 37            # frame[arg] = pop()
+AUG_ADD_FAST = 38          # frame[arg] op= pop()
+AUG_SUBTRACT_FAST = 39
+AUG_MULTIPLY_FAST = 40
+AUG_DIVIDE_FAST = 41
+AUG_MODULO_FAST = 42
+AUG_POWER_FAST = 43
+TAIL_CALL = 44             # `return f(...)` in a function: CALL reusing the current frame
+CALL_BUILTIN = 45          # replace the top argc values with name(*them), consts[arg] = (name, argc): the builtin, or a mkfunc declared under its name
+START_TASK = 46            # push the task of the async function consts[arg] called with the scope
+TICK = 47                  # count a step against the evaluator's limits
+CHECKED_ADD = 48           # ADD, MULTIPLY and the augmented +=, *= on the stack, size-checked
+CHECKED_MULTIPLY = 49
+CHECKED_IADD = 50
+CHECKED_IMULTIPLY = 51
+COUNTED_VALUES = 52        # replace start, bound with the values of the counted loop consts[arg] and an iterator over them
+FOR_COUNTED = 53           # push the iterator's next value; when it runs out, leave the final counter value and jump to arg
+CHECKED_POWER = 54         # POWER and the augmented ^= on the stack, size-checked
+CHECKED_IPOWER = 55
+SQUARE = 56                # -O2's x ^ 2: pop() * pop() for an int, ** 2 otherwise
+CHECKED_SQUARE = 57
+
+OPNAMES = {code: name for name, code in globals().items() if name.isupper() and isinstance(code, int)}
+
+JUMPS = (POP_JUMP_IF_FALSE, JUMP, FOR_COUNTED)
+NAME_OPERATIONS = (LOAD_NAME, STORE_NAME, AUG_ADD, AUG_SUBTRACT, AUG_MULTIPLY,
+                   AUG_DIVIDE, AUG_MODULO, AUG_POWER)
+FAST_OPERATIONS = (LOAD_FAST, STORE_FAST, AUG_ADD_FAST, AUG_SUBTRACT_FAST, AUG_MULTIPLY_FAST,
+                   AUG_DIVIDE_FAST, AUG_MODULO_FAST, AUG_POWER_FAST)
+
+BINARY_OPCODES = {
+    Token.TOKENTYPE.PLUS: ADD,
+    Token.TOKENTYPE.MINUS: SUBTRACT,
+    Token.TOKENTYPE.MUL: MULTIPLY,
+    Token.TOKENTYPE.DIV: DIVIDE,
+    Token.TOKENTYPE.MODULO: MODULO,
+    Token.TOKENTYPE.CARAT: POWER,
+}
+COMPARISON_OPCODES = {
+    Token.TOKENTYPE.LESS_THAN: LESS_THAN,
+    Token.TOKENTYPE.GREATER_THAN: GREATER_THAN,
+    Token.TOKENTYPE.LESS_THAN_OR_EQUAL: LESS_THAN_OR_EQUAL,
+    Token.TOKENTYPE.GREATER_THAN_OR_EQUAL: GREATER_THAN_OR_EQUAL,
+    Token.TOKENTYPE.IS_EQUAL: IS_EQUAL,
+    Token.TOKENTYPE.NOT_EQUAL: NOT_EQUAL,
+}
+AUGMENTED_OPCODES = {
+    Token.TOKENTYPE.PLUS_EQUAL: AUG_ADD,
+    Token.TOKENTYPE.MINUS_EQUAL: AUG_SUBTRACT,
+    Token.TOKENTYPE.TIMES_EQUAL: AUG_MULTIPLY,
+    Token.TOKENTYPE.DIVIDE_EQUAL: AUG_DIVIDE,
+    Token.TOKENTYPE.MODULO_EQUAL: AUG_MODULO,
+    Token.TOKENTYPE.CARAT_EQUAL: AUG_POWER,
+}
+AUGMENTED_FAST_OPCODES = {
+    Token.TOKENTYPE.PLUS_EQUAL: AUG_ADD_FAST,
+    Token.TOKENTYPE.MINUS_EQUAL: AUG_SUBTRACT_FAST,
+    Token.TOKENTYPE.TIMES_EQUAL: AUG_MULTIPLY_FAST,
+    Token.TOKENTYPE.DIVIDE_EQUAL: AUG_DIVIDE_FAST,
+    Token.TOKENTYPE.MODULO_EQUAL: AUG_MODULO_FAST,
+    Token.TOKENTYPE.CARAT_EQUAL: AUG_POWER_FAST,
+}
+CHECKED_OPCODES = {
+    ADD: CHECKED_ADD,
+    MULTIPLY: CHECKED_MULTIPLY,
+    POWER: CHECKED_POWER,
+    SQUARE: CHECKED_SQUARE,
+    Token.TOKENTYPE.PLUS_EQUAL: CHECKED_IADD,
+    Token.TOKENTYPE.TIMES_EQUAL: CHECKED_IMULTIPLY,
+    Token.TOKENTYPE.CARAT_EQUAL: CHECKED_IPOWER,
+}
+UNARY_OPCODES = {
+    Token.TOKENTYPE.MINUS: NEGATE,
+    Token.TOKENTYPE.BANG: NOT,
+    Token.TOKENTYPE.SQUARE: SQUARE,
+}
+
+
+class CodeObject:
+    def __init__(self, name, parameters=()):
+        self.name = name
+        self.parameters = list(parameters)
+        self.code = []
+        self.consts = []
+        self.names = []
+        self.local_names = None
+
+    def __repr__(self):
+        return f"CodeObject({self.name}, {len(self.code) // 2} instructions)"
+
+
+class NeedsScopeDict(Exception):
+    pass
+
+
+class Compiler:
+    def __init__(self, name="<module>", parameters=(), in_function=False, local_names=None, limited=False):
+        self.code_object = CodeObject(name, parameters)
+        self.code_object.local_names = local_names
+        self.in_function = in_function
+        self.use_slots = local_names is not None
+        self.limited = limited
+        self.const_index = {}
+        self.name_index = {}
+
+    def emit(self, op, arg=0):
+        self.code_object.code.extend((op, arg))
+        return len(self.code_object.code) - 2
+
+    def label(self):
+        return len(self.code_object.code)
+
+    def patch(self, position, target):
+        self.code_object.code[position + 1] = target
+
+    def const(self, value):
+        # keyed on type as well so 1, 1.0 and true stay distinct constants,
+        # and on repr for floats so 0.0 and -0.0 do too
+        try:
+            key = (type(value), repr(value) if isinstance(value, float) else value)
+            hash(key)
+        except TypeError:
+            key = id(value)
+        if key not in self.const_index:
+            self.const_index[key] = len(self.code_object.consts)
+            self.code_object.consts.append(value)
+        return self.const_index[key]
+
+    def name(self, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.code_object.names)
+            self.code_object.names.append(name)
+        return self.name_index[name]
+
+    def compile_program(self, statements, collect_results=True):
+        # like Evaluator.execute, only the program's own expression
+        # statements report their values
+        for statement in statements:
+            self.compile_statement(statement, collect_results)
+        self.emit(LOAD_CONST, self.const(None))
+        self.emit(RETURN_VALUE)
+        return self.code_object
+
+    def compile_block(self, statements):
+        for statement in statements:
+            self.compile_statement(statement)
+
+    def compile_loop_body(self, statements):
+        if self.limited:
+            self.emit(TICK)
+        self.compile_block(statements)
+
+    def load(self, name, slot):
+        if self.use_slots:
+            self.emit(LOAD_FAST, slot)
+        else:
+            self.emit(LOAD_NAME, self.name(name))
+
+    def evaluate(self, node):
+        if self.use_slots:
+            # the tree-walker needs a dict scope
+            raise NeedsScopeDict(node)
+        self.emit(EVALUATE, self.const(node))
+
+    def store(self, name, slot):
+        if self.use_slots:
+            self.emit(STORE_FAST, slot)
+        else:
+            self.emit(STORE_NAME, self.name(name))
+
+    def compile_statement(self, node, collect_result=False):
+        if isinstance(node, PTypes.FunctionDeclaration):
+            self.emit(DECLARE_FUNCTION, self.const(node))
+        elif isinstance(node, PTypes.VariableDeclaration):
+            self.compile_expression(node.value)
+            self.store(node.name, node.slot)
+        elif isinstance(node, PTypes.Assignment):
+            self.compile_expression(node.value)
+            self.store(node.variable, node.slot)
+        elif isinstance(node, PTypes.AugmentedAssignment):
+            if self.limited and node.op in CHECKED_OPCODES:
+                self.load(node.variable, node.slot)
+                self.compile_expression(node.value)
+                self.emit(CHECKED_OPCODES[node.op])
+                self.store(node.variable, node.slot)
+            elif node.op in AUGMENTED_OPCODES:
+                self.compile_expression(node.value)
+                if self.use_slots:
+                    self.emit(AUGMENTED_FAST_OPCODES[node.op], node.slot)
+                else:
+                    self.emit(AUGMENTED_OPCODES[node.op], self.name(node.variable))
+        elif isinstance(node, PTypes.ReturnStatement):
+            self.compile_expression(node.value)
+            code = self.code_object.code
+            if self.in_function and isinstance(node.value, PTypes.FunctionCall) and code[-2] == CALL:
+                # the caller gets the callee's value unchanged, so the callee
+                # can take over this frame instead of stacking a new one
+                code[-2] = TAIL_CALL
+            else:
+                self.emit(RETURN_VALUE if self.in_function else RAISE_RETURN)
+        elif isinstance(node, PTypes.IfStatement):
+            self.compile_expression(node.condition)
+            jump_to_else = self.emit(POP_JUMP_IF_FALSE)
+            self.compile_block(node.if_body)
+            if node.else_body is not None:
+                jump_to_end = self.emit(JUMP)
+                self.patch(jump_to_else, self.label())
+                self.compile_block(node.else_body)
+                self.patch(jump_to_end, self.label())
+            else:
+                self.patch(jump_to_else, self.label())
+        elif isinstance(node, PTypes.WhileStatement):
+            start = self.label()
+            self.compile_expression(node.condition)
+            jump_to_end = self.emit(POP_JUMP_IF_FALSE)
+            self.compile_loop_body(node.body)
+            self.emit(JUMP, start)
+            self.patch(jump_to_end, self.label())
+        elif isinstance(node, PTypes.ForStatement) and not node.parallel and Counted.counted_loop(node):
+            self.compile_counted_loop(node, Counted.counted_loop(node))
+        elif isinstance(node, PTypes.ForStatement) and not node.parallel:
+            self.compile_statement(node.init)
+            start = self.label()
+            self.compile_expression(node.condition)
+            jump_to_end = self.emit(POP_JUMP_IF_FALSE)
+            self.compile_loop_body(node.body)
+            self.compile_statement(node.update)
+            self.emit(JUMP, start)
+            self.patch(jump_to_end, self.label())
+        elif isinstance(node, PTypes.Expression):
+            self.compile_expression(node)
+            self.emit(POP_RESULT if collect_result else POP)
+        else:
+            # stray nodes (e.g. the None left by a top-level comment) raise
+            # the tree-walker's error when reached
+            self.evaluate(node)
+            self.emit(POP)
+
+    def compile_counted_loop(self, node, counted):
+        slot = node.init.slot
+        self.compile_statement(node.init)
+        self.load(counted.name, slot)
+        self.compile_expression(counted.bound)
+        self.emit(COUNTED_VALUES, self.const(counted))
+        start = self.label()
+        jump_to_end = self.emit(FOR_COUNTED)
+        self.store(counted.name, slot)
+        self.compile_loop_body(node.body)
+        self.emit(JUMP, start)
+        self.patch(jump_to_end, self.label())
+        self.store(counted.name, slot)
+
+    def compile_expression(self, node):
+        if isinstance(node, PTypes.Literal):
+            self.emit(LOAD_CONST, self.const(node.value))
+        elif isinstance(node, PTypes.NumberLiteral):
+            value = int(node.value) if node.type == 'int' else float(node.value)
+            self.emit(LOAD_CONST, self.const(value))
+        elif isinstance(node, PTypes.StringLiteral):
+            self.emit(LOAD_CONST, self.const(node.value))
+        elif isinstance(node, PTypes.BooleanLiteral):
+            self.emit(LOAD_CONST, self.const(node.value == 'true'))
+        elif isinstance(node, PTypes.Variable):
+            self.load(node.name, node.slot)
+        elif isinstance(node, PTypes.BinaryOperation) and node.op in BINARY_OPCODES:
+            self.compile_expression(node.left)
+            self.compile_expression(node.right)
+            op = BINARY_OPCODES[node.op]
+            self.emit(CHECKED_OPCODES.get(op, op) if self.limited else op)
+        elif isinstance(node, PTypes.ComparisonOperation) and node.op in COMPARISON_OPCODES:
+            self.compile_expression(node.left)
+            self.compile_expression(node.right)
+            self.emit(COMPARISON_OPCODES[node.op])
+        elif isinstance(node, PTypes.UnaryOperation) and node.op in UNARY_OPCODES:
+            self.compile_expression(node.operand)
+            op = UNARY_OPCODES[node.op]
+            self.emit(CHECKED_OPCODES.get(op, op) if self.limited else op)
+        elif isinstance(node, PTypes.ArrayLiteral):
+            for element in node.elements:
+                self.compile_expression(element)
+            self.emit(BUILD_LIST, len(node.elements))
+        elif isinstance(node, PTypes.FunctionCall) and node.name == "print" and node.arguments:
+            self.compile_expression(node.arguments[0])
+            self.emit(PRINT)
+        elif isinstance(node, PTypes.FunctionCall) and node.name == "time":
+            self.emit(TIME)
+        elif isinstance(node, PTypes.FunctionCall) and node.name in Builtins.CALLABLE \
+                and Builtins.arity_error(node.name, len(node.arguments)) is None:
+            for argument in node.arguments:
+                self.compile_expression(argument)
+            self.emit(CALL_BUILTIN, self.const((node.name, len(node.arguments))))
+        elif isinstance(node, PTypes.FunctionCall) and node.name not in Builtins.COMPILED:
+            # a builtin name with arguments the builtin does not take can
+            # only be a call to a mkfunc of that name
+            self.emit(PREPARE_CALL, self.const((node.name, len(node.arguments))))
+            for argument in node.arguments:
+                self.compile_expression(argument)
+            self.emit(CALL, len(node.arguments))
+        else:
+            self.evaluate(node)
+
+
+def compile_program(ast, limited=False):
+    return Compiler(limited=limited).compile_program(ast)
+
+def compile_function(func, limited=False):
+    Lazy.load_body(func)
+    if func.is_async:
+        # the body runs in Async.py; a call only starts its task
+        compiler = Compiler(func.name, func.parameters, in_function=True)
+        compiler.emit(START_TASK, compiler.const(func))
+        compiler.emit(RETURN_VALUE)
+        return compiler.code_object
+    Resolver.resolve_function(func)
+    if func.local_names is not None:
+        compiler = Compiler(func.name, func.parameters, in_function=True, local_names=func.local_names,
+                            limited=limited)
+        try:
+            return compile_body(compiler, func)
+        except NeedsScopeDict:
+            pass
+    compiler = Compiler(func.name, func.parameters, in_function=True, limited=limited)
+    return compile_body(compiler, func)
+
+def compile_body(compiler, func):
+    # a tail call jumps back to the TICK at the top, so it counts as a call
+    if compiler.limited:
+        compiler.emit(TICK)
+    return compiler.compile_program(func.body, collect_results=False)
+
+
+def disassemble(code_object):
+    lines = [f"{code_object.name}({', '.join(code_object.parameters)}):"]
+    code = code_object.code
+    targets = {code[pc + 1] for pc in range(0, len(code), 2) if code[pc] in JUMPS}
+    for pc in range(0, len(code), 2):
+        op, arg = code[pc], code[pc + 1]
+        marker = ">>" if pc in targets else "  "
+        detail = ""
+        if op in NAME_OPERATIONS:
+            detail = f"({code_object.names[arg]})"
+        elif op in FAST_OPERATIONS:
+            detail = f"({code_object.local_names[arg]})"
+        elif op in (LOAD_CONST, PREPARE_CALL, CALL_BUILTIN, COUNTED_VALUES):
+            detail = f"({code_object.consts[arg]!r})"
+        elif op in (DECLARE_FUNCTION, START_TASK):
+            detail = f"({code_object.consts[arg].name})"
+        elif op == EVALUATE:
+            detail = f"({code_object.consts[arg]})"
+        elif op in JUMPS:
+            detail = f"(to {arg})"
+        lines.append(f"{marker}{pc:6} {OPNAMES[op]:<24}{arg:<6}{detail}".rstrip())
+    return "\n".join(lines)
+
+def disassemble_program(ast):
+    """Disassembly of a program and every function it declares."""
+    listings = [disassemble(compile_program(ast))]
+    for node in ast:
+        if isinstance(node, PTypes.FunctionDeclaration):
+            listings.append(disassemble(compile_function(node)))
+    return "\n\n".join(listings)
+
+
+if __name__ == "__main__":
+    import Lexer
+    import Parser
+    program = """
+    mkfunc factorial(n) {
+        var result = 1
+        while (n > 0) {
+            result = result * n
+            n = n - 1
+        }
+        return result
+    }
+    print(factorial(10))
+    """
+    print(disassemble_program(Parser.parse_program(Lexer.tokenize(program))))
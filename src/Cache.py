@@ -0,0 +1,111 @@
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+
+# On-disk cache of parsed programs, in the spirit of __pycache__.
+#
+# An entry is the pickled AST of one source file, stored as
+#   <cache dir>/<file name>.<key>.ast
+# where key hashes the source text together with VERSION (and whether function
+# bodies were left unparsed, see Lazy.py). VERSION covers the
+# Python version and the source of the front end modules, so editing either
+# the program or the lexer/parser invalidates old entries on its own.
+#
+# Entries are written to a temporary file and renamed into place, so
+# processes sharing a cache directory only ever see complete entries; anything
+# that fails to load is treated as a miss and rewritten.
+
+CACHE_DIRECTORY = "__hplcache__"
+FRONT_END = ("Tokens.py", "Lexer.py", "Parser_types.py", "Parser.py")
+
+
+def interpreter_version():
+    digest = hashlib.sha256(f"hoplite {sys.version_info[0]}.{sys.version_info[1]}".encode())
+    source_directory = os.path.dirname(os.path.abspath(__file__))
+    for name in FRONT_END:
+        with open(os.path.join(source_directory, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+VERSION = interpreter_version()
+
+
+class ProgramCache:
+    """Loads and stores parsed programs.
+
+    With no directory, entries go to a __hplcache__ directory next to each
+    source file."""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    def key(self, source, lazy=False):
+        variant = "lazy" if lazy else ""
+        return hashlib.sha256((VERSION + variant + "\0" + source).encode()).hexdigest()[:32]
+
+    def entry_path(self, file_name, source, lazy=False):
+        directory = self.directory
+        if directory is None:
+            directory = os.path.join(os.path.dirname(os.path.abspath(file_name)), CACHE_DIRECTORY)
+        return os.path.join(directory, f"{os.path.basename(file_name)}.{self.key(source, lazy)}.ast")
+
+    def load(self, file_name, source, lazy=False):
+        """The cached AST for the source, or None."""
+        path = self.entry_path(file_name, source, lazy)
+        try:
+            with open(path, "rb") as f:
+                ast = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # truncated or unreadable entry, rebuilt by the next store
+            self.errors += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return ast
+
+    def store(self, file_name, source, ast, lazy=False):
+        path = self.entry_path(file_name, source, lazy)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            data = pickle.dumps(ast, protocol=pickle.HIGHEST_PROTOCOL)
+            handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(handle, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        except (OSError, RecursionError, pickle.PicklingError):
+            # a read-only directory or a very deeply nested program just
+            # goes uncached
+            self.errors += 1
+            return False
+        self.writes += 1
+        self.remove_stale(path)
+        return True
+
+    def remove_stale(self, path):
+        # drop the entries of older versions of the same file
+        directory, entry = os.path.split(path)
+        prefix = entry[:-len(".ast")].rsplit(".", 1)[0] + "."
+        try:
+            for name in os.listdir(directory):
+                if name != entry and name.startswith(prefix) and name.endswith(".ast") \
+                        and len(name) == len(entry):
+                    os.unlink(os.path.join(directory, name))
+        except OSError:
+            pass
+
+    def stats(self):
+        return f"cache: {self.hits} hits, {self.misses} misses, {self.writes} writes, {self.errors} errors"
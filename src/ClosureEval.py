@@ -0,0 +1,493 @@
+import time
+import operator
+import Parser_types as PTypes
+import Tokens as Token
+import Eval
+import Resolver
+import Lazy
+import Counted
+import Memo
+import Builtins
+from Resolver import UNBOUND
+
+# Closure compilation backend.
+#
+# Every AST node is compiled once into a Python closure taking the current
+# scope dict. Operators are resolved at compile time, so running a node is a
+# single call instead of the isinstance/op-string chain in Evaluator.evaluate.
+#
+# Statement closures return None to fall through, or a 1-tuple holding the
+# value of a `return`, which blocks and loops pass straight up to the caller.
+#
+# Function bodies are resolved first (see Resolver.py): their variables are
+# read and written by slot in a list frame, so `scope` is a list there and
+# the global symbol table dict everywhere else.
+
+BINARY_OPERATIONS = {
+    Token.TOKENTYPE.PLUS: (lambda l, r: lambda s: l(s) + r(s), lambda l, c: lambda s: l(s) + c),
+    Token.TOKENTYPE.MINUS: (lambda l, r: lambda s: l(s) - r(s), lambda l, c: lambda s: l(s) - c),
+    Token.TOKENTYPE.MUL: (lambda l, r: lambda s: l(s) * r(s), lambda l, c: lambda s: l(s) * c),
+    Token.TOKENTYPE.DIV: (lambda l, r: lambda s: l(s) / r(s), lambda l, c: lambda s: l(s) / c),
+    Token.TOKENTYPE.MODULO: (lambda l, r: lambda s: l(s) % r(s), lambda l, c: lambda s: l(s) % c),
+    Token.TOKENTYPE.CARAT: (lambda l, r: lambda s: l(s) ** r(s), lambda l, c: lambda s: l(s) ** c),
+}
+
+COMPARISON_OPERATIONS = {
+    Token.TOKENTYPE.IS_EQUAL: (lambda l, r: lambda s: l(s) == r(s), lambda l, c: lambda s: l(s) == c),
+    Token.TOKENTYPE.NOT_EQUAL: (lambda l, r: lambda s: l(s) != r(s), lambda l, c: lambda s: l(s) != c),
+    Token.TOKENTYPE.GREATER_THAN: (lambda l, r: lambda s: l(s) > r(s), lambda l, c: lambda s: l(s) > c),
+    Token.TOKENTYPE.GREATER_THAN_OR_EQUAL: (lambda l, r: lambda s: l(s) >= r(s), lambda l, c: lambda s: l(s) >= c),
+    Token.TOKENTYPE.LESS_THAN: (lambda l, r: lambda s: l(s) < r(s), lambda l, c: lambda s: l(s) < c),
+    Token.TOKENTYPE.LESS_THAN_OR_EQUAL: (lambda l, r: lambda s: l(s) <= r(s), lambda l, c: lambda s: l(s) <= c),
+}
+
+AUGMENTED_OPERATIONS = {
+    Token.TOKENTYPE.PLUS_EQUAL: operator.iadd,
+    Token.TOKENTYPE.MINUS_EQUAL: operator.isub,
+    Token.TOKENTYPE.TIMES_EQUAL: operator.imul,
+    Token.TOKENTYPE.DIVIDE_EQUAL: operator.itruediv,
+    Token.TOKENTYPE.MODULO_EQUAL: operator.imod,
+    Token.TOKENTYPE.CARAT_EQUAL: operator.ipow,
+}
+
+LITERALS = (PTypes.Literal, PTypes.NumberLiteral, PTypes.StringLiteral, PTypes.BooleanLiteral)
+
+
+class NeedsScopeDict(Exception):
+    pass
+
+
+class ClosureEvaluator(Eval.Evaluator):
+    def __init__(self):
+        super().__init__()
+        self.compiled_functions = {}
+        self.use_slots = False
+        self.compilers = {
+            PTypes.FunctionDeclaration: self.compile_function_declaration,
+            PTypes.VariableDeclaration: self.compile_variable_declaration,
+            PTypes.Assignment: self.compile_assignment,
+            PTypes.AugmentedAssignment: self.compile_augmented_assignment,
+            PTypes.BinaryOperation: self.compile_binary_operation,
+            PTypes.ComparisonOperation: self.compile_comparison_operation,
+            PTypes.UnaryOperation: self.compile_unary_operation,
+            PTypes.Literal: self.compile_literal,
+            PTypes.NumberLiteral: self.compile_literal,
+            PTypes.StringLiteral: self.compile_literal,
+            PTypes.BooleanLiteral: self.compile_literal,
+            PTypes.Variable: self.compile_variable,
+            PTypes.ArrayLiteral: self.compile_array_literal,
+            PTypes.FunctionCall: self.compile_function_call,
+            PTypes.IfStatement: self.compile_if_statement,
+            PTypes.ReturnStatement: self.compile_return_statement,
+            PTypes.WhileStatement: self.compile_while_statement,
+            PTypes.ForStatement: self.compile_for_statement,
+        }
+
+    def compile(self, node):
+        compiler = self.compilers.get(type(node))
+        if compiler is None:
+            # anything without a specialised closure (method calls, stray
+            # comment placeholders, ...) runs on the tree-walker
+            return self.fallback(node)
+        return compiler(node)
+
+    def fallback(self, node):
+        if self.use_slots:
+            # the tree-walker needs a dict scope, so the function being
+            # compiled has to give up its list frame
+            raise NeedsScopeDict(node)
+        return lambda scope: self.evaluate(node, scope)
+
+    def compile_statement(self, node):
+        # expression statements throw their value away so that only
+        # `return` produces a non-None result
+        code = self.compile(node)
+        if isinstance(node, PTypes.Expression):
+            def statement(scope):
+                code(scope)
+            return statement
+        return code
+
+    def compile_block(self, statements):
+        codes = [self.compile_statement(statement) for statement in statements]
+        if len(codes) == 1:
+            return codes[0]
+
+        def block(scope):
+            for code in codes:
+                result = code(scope)
+                if result is not None:
+                    return result
+        return block
+
+    def literal_value(self, node):
+        if isinstance(node, PTypes.Literal):
+            return node.value
+        elif isinstance(node, PTypes.NumberLiteral):
+            return int(node.value) if node.type == 'int' else float(node.value)
+        elif isinstance(node, PTypes.BooleanLiteral):
+            return node.value == 'true'
+        return node.value
+
+    def compile_literal(self, node):
+        value = self.literal_value(node)
+        return lambda scope: value
+
+    def compile_variable(self, node):
+        name = node.name
+        slot = node.slot
+        if self.use_slots:
+            def local_variable(frame):
+                value = frame[slot]
+                if value is UNBOUND:
+                    raise Exception(f"Undefined variable '{name}'")
+                return value
+            return local_variable
+
+        def variable(scope):
+            try:
+                return scope[name]
+            except KeyError:
+                raise Exception(f"Undefined variable '{name}'") from None
+        return variable
+
+    def set_limits(self, limits):
+        super().set_limits(limits)
+        self.compiled_functions.clear()
+
+    def compile_function_declaration(self, node):
+        declare_function = self.declare_function
+
+        def declare(scope):
+            declare_function(node)
+        return declare
+
+    def compile_store(self, name, slot, value_node):
+        # `slot` is a list index inside resolved functions, the name otherwise
+        value = self.compile(value_node)
+        key = slot if self.use_slots else name
+
+        def store(scope):
+            scope[key] = value(scope)
+        return store
+
+    def compile_variable_declaration(self, node):
+        return self.compile_store(node.name, node.slot, node.value)
+
+    def compile_assignment(self, node):
+        return self.compile_store(node.variable, node.slot, node.value)
+
+    def compile_augmented_assignment(self, node):
+        name = node.variable
+        value = self.compile(node.value)
+        operation = AUGMENTED_OPERATIONS.get(node.op)
+        if self.limits is not None:
+            if node.op == Token.TOKENTYPE.PLUS_EQUAL:
+                operation = self.limits.iadd
+            elif node.op == Token.TOKENTYPE.TIMES_EQUAL:
+                operation = self.limits.imultiply
+            elif node.op == Token.TOKENTYPE.CARAT_EQUAL:
+                operation = self.limits.ipower
+        if operation is None:
+            # the tree-walker silently ignores unknown augmented operators
+            return lambda scope: None
+        slot = node.slot
+        if self.use_slots:
+            def local_augmented_assign(frame):
+                right = value(frame)
+                current = frame[slot]
+                if current is UNBOUND:
+                    raise KeyError(name)
+                frame[slot] = operation(current, right)
+            return local_augmented_assign
+
+        def augmented_assign(scope):
+            right = value(scope)
+            scope[name] = operation(scope[name], right)
+        return augmented_assign
+
+    def compile_operation(self, node, operations):
+        factories = operations.get(node.op)
+        if factories is None:
+            return self.fallback(node)
+        generic, constant_right = factories
+        left = self.compile(node.left)
+        if isinstance(node.right, LITERALS):
+            return constant_right(left, self.literal_value(node.right))
+        return generic(left, self.compile(node.right))
+
+    def compile_binary_operation(self, node):
+        checked = None
+        if self.limits is not None:
+            checked = {Token.TOKENTYPE.PLUS: self.limits.add, Token.TOKENTYPE.MUL: self.limits.multiply,
+                       Token.TOKENTYPE.CARAT: self.limits.power}.get(node.op)
+        if checked is not None:
+            left = self.compile(node.left)
+            right = self.compile(node.right)
+            return lambda scope: checked(left(scope), right(scope))
+        return self.compile_operation(node, BINARY_OPERATIONS)
+
+    def compile_comparison_operation(self, node):
+        return self.compile_operation(node, COMPARISON_OPERATIONS)
+
+    def compile_unary_operation(self, node):
+        operand = self.compile(node.operand)
+        if node.op == Token.TOKENTYPE.MINUS:
+            return lambda scope: -operand(scope)
+        elif node.op == Token.TOKENTYPE.BANG:
+            return lambda scope: not operand(scope)
+        elif node.op == Token.TOKENTYPE.SQUARE:
+            if self.limits is not None:
+                power = self.limits.power
+                return lambda scope: power(operand(scope), 2)
+            # as in Transpile.py: ** 2 beats a type check and a multiply here
+            return lambda scope: operand(scope) ** 2
+        return self.fallback(node)
+
+    def compile_array_literal(self, node):
+        elements = [self.compile(element) for element in node.elements]
+        return lambda scope: [element(scope) for element in elements]
+
+    def compile_function_call(self, node):
+        if node.name in Builtins.COMPILED:
+            return self.compile_std_function_call(node)
+        elif node.name in self.std_functions:
+            # decided per call: a later mkfunc of the same name replaces the builtin
+            builtin = self.compile_std_function_call(node)
+            user_call = self.compile_user_call(node)
+            name = node.name
+            symbols = self.global_symbol_table
+
+            def call_either(scope):
+                if isinstance(symbols.get(name), PTypes.FunctionDeclaration):
+                    return user_call(scope)
+                return builtin(scope)
+            return call_either
+        return self.compile_user_call(node)
+
+    def compile_user_call(self, node):
+        name = node.name
+        symbols = self.global_symbol_table
+        memo = self.memo
+        arguments = [self.compile(argument) for argument in node.arguments]
+        argument_count = len(arguments)
+
+        def call(scope):
+            func = symbols.get(name)
+            if not func:
+                raise Exception(f"Function '{name}' not defined")
+            parameters = func.parameters
+            if argument_count != len(parameters):
+                raise Exception(f"Expected {len(parameters)} arguments, got {argument_count}")
+            compiled = self.compiled_functions.get(func)
+            if compiled is None:
+                compiled = self.compile_function(func)
+            cache = memo.cache(func)
+            if cache is not None:
+                values = [argument(scope) for argument in arguments]
+                try:
+                    key = Memo.memo_key(values)
+                except TypeError:
+                    return self.run_compiled(compiled, parameters, values)
+                value = cache.lookup(key)
+                if value is Memo.MISSING:
+                    value = self.run_compiled(compiled, parameters, values)
+                    cache.store(key, value)
+                return value
+            body, padding = compiled
+            if padding is None:
+                local_scope = {param: argument(scope) for param, argument in zip(parameters, arguments)}
+            else:
+                local_scope = [argument(scope) for argument in arguments]
+                local_scope.extend(padding)
+            result = body(local_scope)
+            if result is not None:
+                return result[0]
+        return call
+
+    def call_function(self, func, arguments):
+        compiled = self.compiled_functions.get(func)
+        if compiled is None:
+            compiled = self.compile_function(func)
+        return self.run_compiled(compiled, func.parameters, list(arguments))
+
+    def run_compiled(self, compiled, parameters, values):
+        body, padding = compiled
+        if padding is None:
+            local_scope = dict(zip(parameters, values))
+        else:
+            local_scope = values + padding
+        result = body(local_scope)
+        if result is not None:
+            return result[0]
+
+    def compile_function(self, func):
+        Lazy.load_body(func)
+        if func.is_async:
+            start = self.async_runner.start
+            compiled = self.compiled_functions[func] = (lambda scope: (start(func, scope),), None)
+            return compiled
+        Resolver.resolve_function(func)
+        padding = None
+        body = None
+        if func.local_names is not None:
+            padding = [UNBOUND] * (len(func.local_names) - len(func.parameters))
+            self.use_slots = True
+            try:
+                body = self.compile_block(func.body)
+            except NeedsScopeDict:
+                padding = None
+            finally:
+                self.use_slots = False
+        if body is None:
+            body = self.compile_block(func.body)
+        if self.limits is not None:
+            body = self.limits.calling(body)
+        compiled = self.compiled_functions[func] = (body, padding)
+        return compiled
+
+    def compile_std_function_call(self, node):
+        if node.name == "print" and node.arguments:
+            argument = self.compile(node.arguments[0])
+
+            def print_value(scope):
+                self.output.print(argument(scope))
+            return print_value
+        elif node.name == "time":
+            return lambda scope: time.time()
+        elif node.name in self.builtins:
+            function = self.builtins[node.name]
+            error = Builtins.arity_error(node.name, len(node.arguments))
+            arguments = [self.compile(argument) for argument in node.arguments]
+
+            def call_builtin(scope):
+                if error is not None:
+                    raise error
+                return function(*[argument(scope) for argument in arguments])
+            return call_builtin
+        return self.fallback(node)
+
+    def compile_if_statement(self, node):
+        condition = self.compile(node.condition)
+        if_body = self.compile_block(node.if_body)
+        if node.else_body is None:
+            def if_statement(scope):
+                if condition(scope):
+                    return if_body(scope)
+            return if_statement
+        else_body = self.compile_block(node.else_body)
+
+        def if_else_statement(scope):
+            if condition(scope):
+                return if_body(scope)
+            return else_body(scope)
+        return if_else_statement
+
+    def compile_return_statement(self, node):
+        value = self.compile(node.value)
+        return lambda scope: (value(scope),)
+
+    def ticking(self, body):
+        # limited mode: count a step every time body runs
+        tick = self.limits.tick
+
+        def ticking_body(scope):
+            tick()
+            return body(scope)
+        return ticking_body
+
+    def compile_while_statement(self, node):
+        condition = self.compile(node.condition)
+        body = self.compile_block(node.body)
+        if self.limits is not None:
+            body = self.ticking(body)
+
+        def while_statement(scope):
+            while condition(scope):
+                result = body(scope)
+                if result is not None:
+                    return result
+        return while_statement
+
+    def compile_for_statement(self, node):
+        if node.parallel:
+            return self.fallback(node)
+        init = self.compile_statement(node.init)
+        body = self.compile_block(node.body)
+        if self.limits is not None:
+            body = self.ticking(body)
+        counted = Counted.counted_loop(node)
+        if counted is not None:
+            return self.compile_counted_loop(counted, node.init.slot, init, body)
+        condition = self.compile(node.condition)
+        update = self.compile_statement(node.update)
+
+        def for_statement(scope):
+            init(scope)
+            while condition(scope):
+                result = body(scope)
+                if result is not None:
+                    return result
+                update(scope)
+        return for_statement
+
+    def compile_counted_loop(self, counted, slot, init, body):
+        # the counter lives in the frame slot (or under its name at the top
+        # level), stored straight from the range, see Counted.py
+        key = slot if self.use_slots else counted.name
+        bound = self.compile(counted.bound)
+        counted_values = counted.values
+        final = Counted.final
+
+        def counted_loop(scope):
+            init(scope)
+            values = counted_values(scope[key], bound(scope))
+            for value in values:
+                scope[key] = value
+                result = body(scope)
+                if result is not None:
+                    return result
+            scope[key] = final(values)
+        return counted_loop
+
+    def execute(self, ast):
+        if self.async_runner.needed(ast):
+            return self.async_runner.execute(ast)
+        results = []
+        if self.limits is not None:
+            self.limits.start()
+        try:
+            for node in ast:
+                result = self.compile(node)(self.global_symbol_table)
+                if isinstance(node, PTypes.Statement):
+                    if result is not None:
+                        # top-level `return` escapes like it does in the tree-walker
+                        raise Eval.ReturnValue(result[0])
+                elif result is not None:
+                    results.append(result)
+        except RecursionError:
+            if self.limits is None:
+                raise
+            raise self.limits.too_deep() from None
+        finally:
+            if self.limits is not None:
+                self.limits.stop()
+            self.output.flush()
+        return results
+
+
+if __name__ == "__main__":
+    import Lexer
+    import Parser
+    program = """
+    mkfunc square(x) {
+        return x * x
+    }
+    var total = 0
+    for (var i = 0; i < 10; i += 1) {
+        total += square(i)
+    }
+    print(total)
+    """
+    ast = Parser.parse_program(Lexer.tokenize(program))
+    ClosureEvaluator().execute(ast)
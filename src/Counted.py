@@ -0,0 +1,183 @@
+import operator
+import Parser_types as PTypes
+import Tokens as Token
+import Optimizer
+
+# Counted for loops.
+#
+# A `for` loop of the shape
+#
+#   for (var i = start; i < bound; i += step) { ... }
+#
+# (or `i = start`, any of < <= > >=, `i -= step`, `i = i + step` or
+# `i = i - step`, with step a nonzero int literal going towards the bound)
+# whose body never assigns i, and whose bound is operators on literals and
+# variables the body never assigns, is a counted loop. Backends run it by
+# evaluating the bound once and taking the counter's values from values():
+# a native range when start and bound are ints, so the condition and the
+# update no longer run as AST nodes each iteration. The counter is still
+# stored in the scope (or frame slot) before every iteration, and gets the
+# value that failed the condition when the loop runs out, as it would have.
+#
+# Any other start or bound (a float, a string, ...) gets a Stepping, which
+# compares and steps the counter with the loop's own operators, so the values
+# and any error come out exactly as the loop would produce them.
+#
+# counted_loop() analyses a loop the first time it runs and keeps the result
+# on the node.
+
+COMPARISONS = {
+    Token.TOKENTYPE.LESS_THAN: operator.lt,
+    Token.TOKENTYPE.LESS_THAN_OR_EQUAL: operator.le,
+    Token.TOKENTYPE.GREATER_THAN: operator.gt,
+    Token.TOKENTYPE.GREATER_THAN_OR_EQUAL: operator.ge,
+}
+
+# update operator -> (how it steps the counter, sign of the step)
+UPDATES = {
+    Token.TOKENTYPE.PLUS_EQUAL: (operator.iadd, 1),
+    Token.TOKENTYPE.MINUS_EQUAL: (operator.isub, -1),
+    Token.TOKENTYPE.PLUS: (operator.add, 1),
+    Token.TOKENTYPE.MINUS: (operator.sub, -1),
+}
+
+LITERALS = (PTypes.Literal, PTypes.NumberLiteral, PTypes.StringLiteral, PTypes.BooleanLiteral)
+
+
+class Stepping:
+    """The values of a counted loop whose start or bound is not an int."""
+
+    def __init__(self, start, bound, op, update, amount):
+        self.counter = start
+        self.bound = bound
+        self.compare = COMPARISONS[op]
+        self.advance = UPDATES[update][0]
+        self.amount = amount
+
+    def __iter__(self):
+        while self.compare(self.counter, self.bound):
+            yield self.counter
+            self.counter = self.advance(self.counter, self.amount)
+
+
+def values(start, bound, op, update, amount):
+    """The values the counter takes, in order."""
+    if type(start) is not int or type(bound) is not int:
+        return Stepping(start, bound, op, update, amount)
+    step = amount * UPDATES[update][1]
+    if op == Token.TOKENTYPE.LESS_THAN_OR_EQUAL:
+        bound += 1
+    elif op == Token.TOKENTYPE.GREATER_THAN_OR_EQUAL:
+        bound -= 1
+    return range(start, bound, step)
+
+def final(values):
+    """The counter's value once the loop has run through values."""
+    if isinstance(values, range):
+        return values.start + len(values) * values.step
+    return values.counter
+
+
+class CountedLoop:
+    __slots__ = ("name", "bound", "op", "update", "amount")
+
+    def __init__(self, name, bound, op, update, amount):
+        self.name = name
+        self.bound = bound
+        self.op = op
+        self.update = update
+        self.amount = amount
+
+    def values(self, start, bound):
+        return values(start, bound, self.op, self.update, self.amount)
+
+    def __repr__(self):
+        return f"CountedLoop({self.name}, {self.op}, {self.bound}, {self.update} {self.amount})"
+
+
+def int_literal(node):
+    if isinstance(node, PTypes.Literal) and type(node.value) is int:
+        return node.value
+    elif isinstance(node, PTypes.NumberLiteral) and node.type == 'int':
+        return int(node.value)
+    return None
+
+def invariant(node, assigned):
+    """Whether node computes the same value every time the loop checks it."""
+    if isinstance(node, LITERALS):
+        return True
+    elif isinstance(node, PTypes.Variable):
+        return node.name not in assigned
+    elif isinstance(node, PTypes.BinaryOperation):
+        return node.op in Optimizer.BINARY_OPERATIONS and invariant(node.left, assigned) \
+            and invariant(node.right, assigned)
+    elif isinstance(node, PTypes.ComparisonOperation):
+        return node.op in Optimizer.COMPARISON_OPERATIONS and invariant(node.left, assigned) \
+            and invariant(node.right, assigned)
+    elif isinstance(node, PTypes.UnaryOperation):
+        return node.op in Optimizer.UNARY_OPERATIONS and invariant(node.operand, assigned)
+    return False
+
+def update_step(update, name):
+    """(operator, amount) of an update stepping name by an int literal, or None."""
+    if isinstance(update, PTypes.AugmentedAssignment) and update.variable == name:
+        op, amount = update.op, int_literal(update.value)
+    elif isinstance(update, PTypes.Assignment) and update.variable == name \
+            and isinstance(update.value, PTypes.BinaryOperation) \
+            and isinstance(update.value.left, PTypes.Variable) and update.value.left.name == name:
+        op, amount = update.value.op, int_literal(update.value.right)
+    else:
+        return None
+    if op not in UPDATES or not amount:
+        return None
+    return op, amount
+
+def analyse(loop):
+    init, condition = loop.init, loop.condition
+    if isinstance(init, PTypes.VariableDeclaration):
+        name = init.name
+    elif isinstance(init, PTypes.Assignment):
+        name = init.variable
+    else:
+        return None
+    if not isinstance(condition, PTypes.ComparisonOperation) or condition.op not in COMPARISONS \
+            or not isinstance(condition.left, PTypes.Variable) or condition.left.name != name:
+        return None
+    step = update_step(loop.update, name)
+    if step is None:
+        return None
+    op, amount = step
+    ascending = amount * UPDATES[op][1] > 0
+    if ascending != (condition.op in (Token.TOKENTYPE.LESS_THAN, Token.TOKENTYPE.LESS_THAN_OR_EQUAL)):
+        return None
+    assigned = set(Optimizer.assignment_counts(loop.body))
+    if name in assigned:
+        return None
+    assigned.add(name)
+    if not invariant(condition.right, assigned):
+        return None
+    return CountedLoop(name, condition.right, condition.op, op, amount)
+
+def counted_loop(loop):
+    """The CountedLoop for a `for` statement, or None if it is not one."""
+    counted = loop.counted
+    if counted is None:
+        counted = loop.counted = analyse(loop) or False
+    return counted or None
+
+
+if __name__ == "__main__":
+    import Lexer
+    import Parser
+    program = """
+    for (var i = 0; i < 10; i += 3) { print(i) }
+    for (var j = 10; j >= 0; j = j - 4) { print(j) }
+    for (var k = 0; k < 10; k += 1) { k = k + 1 }
+    """
+    for loop in Parser.parse_program(Lexer.tokenize(program)):
+        counted = counted_loop(loop)
+        print(counted)
+        if counted is not None:
+            start = int_literal(loop.init.value)
+            steps = counted.values(start, int_literal(counted.bound))
+            print(list(steps), final(steps), list(counted.values(0.5, 10)))
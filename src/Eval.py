@@ -2,6 +2,14 @@ import Parser_types as PTypes
 import Tokens as Token
 import Lexer as Lexer
 import Parser as Parser
+import Memo
+import Builtins
+import Output
+import Parallel
+import Async
+import Lazy
+import Counted
+import Optimizer
 class ReturnValue(Exception):
     def __init__(self, value):
         self.value = value
@@ -9,12 +17,41 @@ class ReturnValue(Exception):
 class Evaluator:
     def __init__(self):
         self.global_symbol_table = {}
+        self.memo = Memo.Memoizer()
+        self.output = Output.BufferedOutput()
+        self.limits = None # see Limits.py and set_limits
+        self.quickener = None # a Quicken.Quickener with --quicken
+        self.builtins = Builtins.functions(self)
+        self.parallel = Parallel.ParallelRunner(self)
+        self.async_runner = Async.AsyncRunner(self)
+
+    def set_limits(self, limits):
+        """Runs every later execute() under limits, a Limits.Limits (None for no limits).
+
+        Backends that compile functions override this to drop what they
+        compiled, since limited mode compiles to checked code."""
+        self.limits = limits
+        self.builtins = Builtins.functions(self)
+        if self.quickener is not None:
+            self.quickener.set_limited(limits is not None)
 
     def evaluate(self, node, local_scope=None):
         scope = local_scope if local_scope is not None else self.global_symbol_table
 
-        if isinstance(node, PTypes.FunctionDeclaration):
-            self.global_symbol_table[node.name] = node
+        # the most frequent nodes (every argument, operand and call) first
+        if isinstance(node, PTypes.Variable):
+            if node.name in scope:
+                return scope[node.name]
+            else:
+                raise Exception(f"Undefined variable '{node.name}'")
+        elif isinstance(node, PTypes.Literal):
+            return node.value
+
+        elif isinstance(node, PTypes.FunctionCall):
+            return self.handle_function_call(node, scope)
+
+        elif isinstance(node, PTypes.FunctionDeclaration):
+            self.declare_function(node)
 
         elif isinstance(node, PTypes.VariableDeclaration):
             scope[node.name] = self.evaluate(node.value, scope)
@@ -25,23 +62,69 @@ class Evaluator:
         elif isinstance(node, PTypes.AugmentedAssignment):
             
             right = self.evaluate(node.value, scope)
+            site = node.site
+            if site is not None:
+                left = scope[node.variable]
+                if type(left) is site.left and type(right) is site.right:
+                    site.hits += 1
+                    scope[node.variable] = site.fast(left, right)
+                    return None
+            if self.quickener is not None:
+                self.quickener.site(node).miss(scope[node.variable], right)
             if node.op == Token.TOKENTYPE.PLUS_EQUAL:
-                scope[node.variable] += right
+                if self.limits is not None:
+                    scope[node.variable] = self.limits.iadd(scope[node.variable], right)
+                else:
+                    scope[node.variable] += right
             elif node.op == Token.TOKENTYPE.MINUS_EQUAL:
                 scope[node.variable] -= right
             elif node.op == Token.TOKENTYPE.TIMES_EQUAL:
-                scope[node.variable] *= right
+                if self.limits is not None:
+                    scope[node.variable] = self.limits.imultiply(scope[node.variable], right)
+                else:
+                    scope[node.variable] *= right
             elif node.op == Token.TOKENTYPE.DIVIDE_EQUAL:
                 scope[node.variable] /= right
             elif node.op == Token.TOKENTYPE.MODULO_EQUAL:
                 scope[node.variable] %= right
             elif node.op == Token.TOKENTYPE.CARAT_EQUAL:
-                scope[node.variable] **= right
+                if self.limits is not None:
+                    scope[node.variable] = self.limits.ipower(scope[node.variable], right)
+                else:
+                    scope[node.variable] **= right
         elif isinstance(node, PTypes.BinaryOperation):
             left = self.evaluate(node.left, scope)
             right = self.evaluate(node.right, scope)
+            site = node.site
+            if site is not None and type(left) is site.left and type(right) is site.right:
+                site.hits += 1
+                return site.fast(left, right)
+            if self.quickener is not None:
+                self.quickener.site(node).miss(left, right)
             return self.perform_binary_operation(node.op, left, right)
 
+        elif isinstance(node, PTypes.ComparisonOperation):
+            left = self.evaluate(node.left, scope)
+            right = self.evaluate(node.right, scope)
+            site = node.site
+            if site is not None and type(left) is site.left and type(right) is site.right:
+                site.hits += 1
+                return site.fast(left, right)
+            if self.quickener is not None:
+                self.quickener.site(node).miss(left, right)
+            if node.op == Token.TOKENTYPE.IS_EQUAL:
+                return left == right
+            elif node.op == Token.TOKENTYPE.NOT_EQUAL:
+                return left != right
+            elif node.op == Token.TOKENTYPE.GREATER_THAN:
+                return left > right
+            elif node.op == Token.TOKENTYPE.GREATER_THAN_OR_EQUAL:
+                return left >= right
+            elif node.op == Token.TOKENTYPE.LESS_THAN:
+                return left < right
+            elif node.op == Token.TOKENTYPE.LESS_THAN_OR_EQUAL:
+                return left <= right
+
         elif isinstance(node, PTypes.UnaryOperation):
             operand = self.evaluate(node.operand, scope)
             return self.perform_unary_operation(node.op, operand)
@@ -55,75 +138,42 @@ class Evaluator:
         elif isinstance(node, PTypes.BooleanLiteral):
             return node.value == 'true'
 
-        elif isinstance(node, PTypes.Variable):
-            if node.name in scope:
-                return scope[node.name]
-            else:
-                raise Exception(f"Undefined variable '{node.name}'")
         elif isinstance(node, PTypes.ArrayLiteral):
             return [self.evaluate(element, scope) for element in node.elements]
-        elif isinstance(node, PTypes.FunctionCall):
-            return self.handle_function_call(node, scope)
-        elif isinstance(node, PTypes.IfStatement):
-            condition_value = self.evaluate(node.condition, local_scope)
-            if condition_value:
-                for statement in node.if_body:
-                    result = self.evaluate(statement, local_scope)
-                    if isinstance(statement, PTypes.ReturnStatement):
-                        return result
-            elif node.else_body is not None:
-                for statement in node.else_body:
-                    result = self.evaluate(statement, local_scope)
-                    if isinstance(statement, PTypes.ReturnStatement):
-                        return result
-        elif isinstance(node, PTypes.ReturnStatement):
-            raise ReturnValue(self.evaluate(node.value, scope))
-        elif isinstance(node, PTypes.WhileStatement):
-            while self.evaluate(node.condition, local_scope):
-                for statement in node.body:
-                    result = self.evaluate(statement, local_scope)
-                    if isinstance(statement, PTypes.ReturnStatement):
-                        return result
-        elif isinstance(node, PTypes.ForStatement):
-            self.evaluate(node.init, local_scope)
-            while self.evaluate(node.condition, local_scope):
-                for statement in node.body:
-                    result = self.evaluate(statement, local_scope)
-                    if isinstance(statement, PTypes.ReturnStatement):
-                        return result
-                self.evaluate(node.update, local_scope)
+        elif isinstance(node, (PTypes.IfStatement, PTypes.ReturnStatement,
+                               PTypes.WhileStatement, PTypes.ForStatement)):
+            # only reached outside function bodies (top level, or a backend
+            # falling back to the tree-walker), where `return` still escapes
+            # as an exception
+            signal = self.execute_statement(node, scope)
+            if signal is not None:
+                raise signal
         elif isinstance(node, PTypes.MethodCall):
             return self.handle_method_call(node, scope)
-        elif isinstance(node, PTypes.ComparisonOperation):
-            left = self.evaluate(node.left, scope)
-            right = self.evaluate(node.right, scope)
-            if node.op == Token.TOKENTYPE.IS_EQUAL:
-                return left == right
-            elif node.op == Token.TOKENTYPE.NOT_EQUAL:
-                return left != right
-            elif node.op == Token.TOKENTYPE.GREATER_THAN:
-                return left > right
-            elif node.op == Token.TOKENTYPE.GREATER_THAN_OR_EQUAL:
-                return left >= right
-            elif node.op == Token.TOKENTYPE.LESS_THAN:
-                return left < right
-            elif node.op == Token.TOKENTYPE.LESS_THAN_OR_EQUAL:
-                return left <= right
+        elif isinstance(node, PTypes.Await):
+            # async function bodies and top-level awaits run in Async.py
+            raise Exception("'await' is only allowed in async functions and at the top level")
         else:
             raise Exception(f"Unknown node type '{node}'")
 
     def perform_binary_operation(self, op, left, right):
         if op == Token.TOKENTYPE.PLUS:
+            if self.limits is not None:
+                return self.limits.add(left, right)
             return left + right
         elif op == Token.TOKENTYPE.MINUS:
             return left - right
         elif op == Token.TOKENTYPE.MUL:
+            if self.limits is not None:
+                return self.limits.multiply(left, right)
             return left * right
         elif op == Token.TOKENTYPE.DIV:
             return left / right
         elif op == Token.TOKENTYPE.MODULO:
             return left % right
         elif op == Token.TOKENTYPE.CARAT:
+            if self.limits is not None:
+                return self.limits.power(left, right)
             return left ** right
         else:
             raise Exception(f"Unsupported binary operation '{op}'")
@@ -133,16 +183,29 @@ class Evaluator:
             return -operand
         elif op == Token.TOKENTYPE.BANG:
             return not operand
+        elif op == Token.TOKENTYPE.SQUARE:
+            if self.limits is not None:
+                return self.limits.power(operand, 2)
+            return Optimizer.square(operand)
         else:
             raise Exception(f"Unsupported unary operation '{op}'")
 
-    std_functions = ["print","time"]
+    std_functions = Builtins.NAMES
+    def calls_builtin(self, name):
+        """Whether a call to name, one of std_functions, runs the builtin."""
+        return Builtins.calls_builtin(self.global_symbol_table, name)
+
     def handle_std_function_call(self, node, scope):
         if node.name == "print":
-            print(self.evaluate(node.arguments[0], scope))
+            self.output.print(self.evaluate(node.arguments[0], scope))
         elif node.name == "time":
             import time
             return time.time()
+        elif node.name in self.builtins:
+            error = Builtins.arity_error(node.name, len(node.arguments))
+            if error is not None:
+                raise error
+            return self.builtins[node.name](*[self.evaluate(argument, scope) for argument in node.arguments])
         else:
             raise Exception(f"Unknown standard function '{node.name}'")
     def handle_method_call(self, node: PTypes.MethodCall, scope):
@@ -159,32 +222,146 @@ class Evaluator:
             raise Exception(f"Variable '{variable.name}' does not have method '{method}'")
 
 
-    def handle_function_call(self, node, scope):
-        if node.name in self.std_functions:
-            return self.handle_std_function_call(node, scope)
+    def execute_statement(self, node, scope):
+        """Runs one statement of a function body or block.
 
-        func = self.global_symbol_table.get(node.name)
+        A `return` does not raise here: its ReturnValue is handed back as
+        the completion signal and passed up by every enclosing block until
+        run_function takes the value out. Any other statement gives None."""
+        if isinstance(node, PTypes.ReturnStatement):
+            return ReturnValue(self.evaluate(node.value, scope))
+        elif isinstance(node, PTypes.IfStatement):
+            if self.evaluate(node.condition, scope):
+                return self.execute_block(node.if_body, scope)
+            elif node.else_body is not None:
+                return self.execute_block(node.else_body, scope)
+        elif isinstance(node, PTypes.WhileStatement):
+            limits = self.limits
+            while self.evaluate(node.condition, scope):
+                if limits is not None:
+                    limits.tick()
+                signal = self.execute_block(node.body, scope)
+                if signal is not None:
+                    return signal
+        elif isinstance(node, PTypes.ForStatement):
+            if node.parallel:
+                self.parallel.run_for(node, scope)
+                return None
+            limits = self.limits
+            self.evaluate(node.init, scope)
+            counted = Counted.counted_loop(node)
+            if counted is not None:
+                name = counted.name
+                values = counted.values(scope[name], self.evaluate(counted.bound, scope))
+                for value in values:
+                    scope[name] = value
+                    if limits is not None:
+                        limits.tick()
+                    signal = self.execute_block(node.body, scope)
+                    if signal is not None:
+                        return signal
+                scope[name] = Counted.final(values)
+                return None
+            while self.evaluate(node.condition, scope):
+                if limits is not None:
+                    limits.tick()
+                signal = self.execute_block(node.body, scope)
+                if signal is not None:
+                    return signal
+                self.evaluate(node.update, scope)
+        else:
+            self.evaluate(node, scope)
+        return None
+
+    def execute_block(self, statements, scope):
+        for statement in statements:
+            signal = self.execute_statement(statement, scope)
+            if signal is not None:
+                return signal
+        return None
+
+    def bind_call(self, node, func):
+        # name and arity checks run once per call site and callee; later
+        # calls only compare the callee with the one bound here
         if not func:
             raise Exception(f"Function '{node.name}' not defined")
-
         if len(node.arguments) != len(func.parameters):
             raise Exception(f"Expected {len(func.parameters)} arguments, got {len(node.arguments)}")
+        Lazy.load_body(func)
+        node.callee = func
+
+    def handle_function_call(self, node, scope):
+        if node.name in self.std_functions and self.calls_builtin(node.name):
+            return self.handle_std_function_call(node, scope)
+
+        func = self.global_symbol_table.get(node.name)
+        if func is not node.callee or func is None:
+            self.bind_call(node, func)
 
+        cache = self.memo.cache(func)
+        if cache is not None:
+            # inlined rather than going through Memoizer.call, to keep deep
+            # recursion from costing extra Python frames per Hoplite call
+            arguments = [self.evaluate(arg, scope) for arg in node.arguments]
+            try:
+                key = Memo.memo_key(arguments)
+            except TypeError:
+                return self.run_function(func, dict(zip(func.parameters, arguments)))
+            value = cache.lookup(key)
+            if value is Memo.MISSING:
+                value = self.run_function(func, dict(zip(func.parameters, arguments)))
+                cache.store(key, value)
+            return value
         local_scope = {param: self.evaluate(arg, scope) for param, arg in zip(func.parameters, node.arguments)}
-        try:
-            for statement in func.body:
-                result = self.evaluate(statement, local_scope)
-                if isinstance(statement, PTypes.ReturnStatement):
-                    return result
-        except ReturnValue as returnValue:
-            return returnValue.value
+        return self.run_function(func, local_scope)
+
+    def declare_function(self, func):
+        symbols = self.global_symbol_table
+        previous = symbols.get(func.name)
+        if isinstance(previous, PTypes.FunctionDeclaration) and previous is not func:
+            self.memo.redeclared(symbols.values())
+        symbols[func.name] = func
+
+    def call_function(self, func, arguments):
+        """func called on Python values; the caller checks the argument count."""
+        Lazy.load_body(func)
+        return self.run_function(func, dict(zip(func.parameters, arguments)))
+
+    def run_function(self, func, local_scope):
+        if func.is_async:
+            return self.async_runner.start(func, local_scope)
+        limits = self.limits
+        if limits is not None:
+            limits.enter()
+            try:
+                signal = self.execute_block(func.body, local_scope)
+            finally:
+                limits.leave()
+        else:
+            signal = self.execute_block(func.body, local_scope)
+        if signal is not None:
+            return signal.value
+        return None
 
     def execute(self, ast):
+        if self.async_runner.needed(ast):
+            return self.async_runner.execute(ast)
         results = []
-        for node in ast:
-            result = self.evaluate(node)
-            if result is not None:
-                results.append(result)
+        if self.limits is not None:
+            self.limits.start()
+        try:
+            for node in ast:
+                result = self.evaluate(node)
+                if result is not None:
+                    results.append(result)
+        except RecursionError:
+            if self.limits is None:
+                raise
+            raise self.limits.too_deep() from None
+        finally:
+            if self.limits is not None:
+                self.limits.stop()
+            self.output.flush()
         return results
 
 # Example usage
@@ -1,65 +1,262 @@
 import sys
 import os
+import time
 import Lexer
 import Parser
 import Eval
-def use_file(file_name: str, e: Eval.Evaluator,args: list):
+import Async
+import ClosureEval
+import Bytecode
+import VM
+import Transpile
+import Resolver
+import Cache
+import Optimizer
+import Memo
+import Profiler
+import Output
+import Include
+import Lazy
+import Limits
+import Quicken
+
+# execution engines selectable with -b
+BACKENDS = {
+    "tree": Eval.Evaluator,
+    "closure": ClosureEval.ClosureEvaluator,
+    "vm": VM.VirtualMachine,
+    "python": Transpile.PythonEvaluator,
+}
+
+def option_value(args: list, flag: str, default=None):
+    if flag in args and args.index(flag) + 1 < len(args):
+        return args[args.index(flag) + 1]
+    return default
+
+def optimization_level(args: list):
+    # -O0, -O1, ...; the last one given wins
+    level = 1
+    for arg in args:
+        if arg.startswith("-O") and arg[2:].isdigit():
+            level = int(arg[2:])
+    return level
+
+def load_program(program: str, args: list, file_name=None, cache=None):
+    # source -> tokens -> AST -> resolved AST, skipping the first two steps
+    # when the file's AST is in the cache
+    ast = None
+    lazy = "--lazy" in args
+    if cache is not None and file_name is not None:
+        ast = cache.load(file_name, program, lazy)
+    try:
+        if ast is None:
+            tokens = Lexer.tokenize(program)
+            ast = Parser.parse_program(tokens, lazy)
+            if cache is not None and file_name is not None:
+                cache.store(file_name, program, ast, lazy)
+        if lazy:
+            Lazy.locate(ast, program, file_name)
+        return prepare_program(ast, args)
+    except Parser.SyntaxErrors as ex:
+        # every syntax error in the file, each with its line and column
+        errors = ex.errors
+        if "--check-syntax" in args and ex.statements is not None:
+            try:
+                Lazy.check_syntax(ex.statements)
+            except Parser.SyntaxErrors as lazy_errors:
+                errors = sorted(errors + lazy_errors.errors)
+        raise Parser.SyntaxErrors(errors, program, file_name) from None
+
+def prepare_program(ast: list, args: list):
+    # optimize, resolve and mark memoizable functions, in place
+    if "--check-syntax" in args:
+        Lazy.check_syntax(ast)
+    optimizer = Optimizer.Optimizer(optimization_level(args))
+    ast = optimizer.optimize_program(ast)
+    if "--opt-report" in args:
+        print(optimizer.report(), file=sys.stderr)
+    for diagnostic in Resolver.resolve_program(ast):
+        print("Warning: " + diagnostic, file=sys.stderr)
+    if "--no-memo" not in args:
+        Memo.mark_pure_functions(ast, Eval.Evaluator.std_functions)
+    Async.mark_program(ast)
+    return ast
+
+def run_program(e: Eval.Evaluator, program: str, args: list, file_name=None, cache=None, profiler=None):
+    ast = load_program(program, args, file_name, cache)
+    execute_program(e, program, ast, file_name, profiler)
+
+def execute_program(e: Eval.Evaluator, program: str, ast: list, file_name=None, profiler=None):
+    if profiler is not None:
+        profiler.add_program(file_name, program, ast)
+    e.execute(ast)
+
+def run_includes(e: Eval.Evaluator, include_name: str, args: list, cache=None, profiler=None):
+    # parse every include file (in parallel), then prepare and run them in order
+    file_names = Include.include_files(include_name)
+    for file in file_names:
+        if not os.path.isfile(file):
+            print("Include file does not exist")
+            return False
+    loader = Include.IncludeLoader(e.parallel.workers, cache, "--lazy" in args)
+    files = loader.load(file_names)
+    for included in files:
+        start = time.perf_counter()
+        if loader.lazy:
+            Lazy.locate(included.ast, included.source, included.file_name)
+        try:
+            ast = prepare_program(included.ast, args)
+        except Parser.SyntaxErrors as ex:
+            raise Parser.SyntaxErrors(ex.errors, included.source, included.file_name) from None
+        included.prepare_time = time.perf_counter() - start
+        start = time.perf_counter()
+        execute_program(e, included.source, ast, included.file_name, profiler)
+        included.execute_time = time.perf_counter() - start
+    if "--include-times" in args:
+        print(Include.timing_report(files), file=sys.stderr)
+    return True
+
+def use_file(file_name: str, e: Eval.Evaluator,args: list, cache=None, profiler=None):
     if not os.path.isfile(file_name):
         print("File does not exist")
         return
     # args format = [file_name, -f, file_name, -i (optional), include_file_name (optional)]
     # -f = file to use
     # -i = include file
+    # -b = backend to run on (tree, closure, vm, python)
+    # -S = print the bytecode disassembly of the file instead of running it
+    # --no-cache = always lex and parse, never read or write the AST cache
+    # --cache-dir = directory for the AST cache (default: __hplcache__ next to each file)
+    # --cache-stats = print cache hits and misses to stderr when done
+    # -O0 / -O1 / -O2 = optimization level (default -O1), see Optimizer.py
+    # --opt-report = print what the optimizer changed to stderr
+    # --max-depth = deepest allowed chain of Hoplite calls (vm backend only,
+    #               which keeps its frames on the heap and eliminates tail calls)
+    # --memo-size = entries in each memoized function's LRU cache (default 1024,
+    #               0 memoizes only functions declared with `memo mkfunc`)
+    # --no-memo = never memoize, not even `memo mkfunc` functions
+    # --memo-stats = print each memoized function's cache hit rate to stderr at exit
+    # --profile = sample the Hoplite call stack, print a report of the hottest
+    #             functions and lines to stderr and write collapsed stacks for
+    #             flamegraph tools to --profile-out (default profile.collapsed)
+    # --profile-interval = milliseconds between samples (default 1)
+    # --output-buffer = characters of printed output collected before writing
+    #                   them out (default 65536), see Output.py
+    # --unbuffered = write every printed line straight away
+    # --workers = processes used by pmap and `parallel for` (default: one per CPU)
+    # --chunk-size = items sent to a worker at a time (default: about four
+    #                chunks per worker), see Parallel.py
+    # --include-times = print how long each -i file took to parse, prepare and
+    #                   run to stderr, slowest first; --workers also sets how
+    #                   many processes parse them, see Include.py
+    # --lazy = parse the body of each function the first time it is called,
+    #          see Lazy.py
+    # --check-syntax = with --lazy, still parse every body at load time to
+    #                  report syntax errors before the program runs
+    # --max-steps = stop the program after this many loop iterations and
+    #               function calls, see Limits.py
+    # --timeout = stop the program after this many seconds
+    # --max-size = stop the program when it builds a string, list or array
+    #              longer than this
+    # --max-call-depth = stop the program when its calls nest deeper than this
+    # --allow-files = with the flags above, still let the program use the file
+    #                 builtins (read_lines, write_lines, ...)
+    #              (each -i file and each REPL line gets the limits afresh)
+    # --quicken = specialize the tree-walker's operators to the operand types
+    #             they see, see Quicken.py
+    # --quicken-stats = with --quicken, print the hits, misses and state of
+    #                   each operator site to stderr at exit
 
+    if "-S" in args:
+        with open(file_name, "r") as f:
+            program = f.read()
+        print(Bytecode.disassemble_program(load_program(program, args, file_name, cache)))
+        return
     # if -i is in args, then include the file/directory
     if "-i" in args:
-        include_name = args[args.index("-i") + 1]
-        include_files = []
-        if os.path.isdir(include_name):
-            for file in os.listdir(include_name):
-                if file.endswith(".hop"):
-                    include_files.append(file)
-        else:
-            include_files.append(include_name)
-        for file in include_files:
-            if not os.path.isfile(file):
-                print("Include file does not exist")
-                return
-            with open(file, "r") as f:
-                include_file = f.read()
-            tokens = Lexer.tokenize(include_file)
-            ast = Parser.parse_program(tokens)
-            e.execute(ast)
+        if not run_includes(e, args[args.index("-i") + 1], args, cache, profiler):
+            return
     with open(file_name, "r") as f:
 
         program = f.read()
-    tokens = Lexer.tokenize(program)
-    ast = Parser.parse_program(tokens)
-    e.execute(ast)
-def use_as_repl(e: Eval.Evaluator):
+    run_program(e, program, args, file_name, cache, profiler)
+def use_as_repl(e: Eval.Evaluator, args: list):
     while True:
+        e.output.flush()
         program = input(">>> ")
         if program == "quit()":
             break
         try:
-            tokens = Lexer.tokenize(program)
-            ast = Parser.parse_program(tokens)
-            e.execute(ast)
+            e.execute(load_program(program, args))
         except Exception as ex:
             print(ex)
 
 def main():
     REPL_MODE = False
-    ev = Eval.Evaluator()
+    backend = option_value(sys.argv, "-b", "tree")
+    if backend not in BACKENDS:
+        print(f"Unknown backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+        return
+    ev = BACKENDS[backend]()
+    if "--max-depth" in sys.argv:
+        if not hasattr(ev, "max_depth"):
+            print("--max-depth is only supported by the vm backend", file=sys.stderr)
+            return
+        ev.max_depth = int(option_value(sys.argv, "--max-depth"))
+    ev.memo.capacity = int(option_value(sys.argv, "--memo-size", Memo.DEFAULT_CAPACITY))
+    ev.memo.enabled = "--no-memo" not in sys.argv
+    ev.output.buffer_size = int(option_value(sys.argv, "--output-buffer", Output.DEFAULT_BUFFER_SIZE))
+    if "--unbuffered" in sys.argv:
+        ev.output.buffer_size = 0
+    if "--workers" in sys.argv:
+        ev.parallel.workers = int(option_value(sys.argv, "--workers"))
+    if "--chunk-size" in sys.argv:
+        ev.parallel.chunk_size = int(option_value(sys.argv, "--chunk-size"))
+    if "--quicken" in sys.argv:
+        ev.quickener = Quicken.Quickener()
+    if any(flag in sys.argv for flag in ("--max-steps", "--timeout", "--max-size", "--max-call-depth")):
+        max_steps = option_value(sys.argv, "--max-steps")
+        timeout = option_value(sys.argv, "--timeout")
+        max_size = option_value(sys.argv, "--max-size")
+        max_depth = option_value(sys.argv, "--max-call-depth")
+        ev.set_limits(Limits.Limits(int(max_steps) if max_steps is not None else None,
+                                    float(timeout) if timeout is not None else None,
+                                    int(max_size) if max_size is not None else None,
+                                    int(max_depth) if max_depth is not None else None,
+                                    "--allow-files" in sys.argv))
     if len(sys.argv) > 1:
-        if sys.argv[1] == "-r":
-            REPL_MODE = True
-        elif sys.argv[1] == "-f":
-            use_file(sys.argv[2], ev, sys.argv)
+        if "-f" in sys.argv:
+            cache = None
+            if "--no-cache" not in sys.argv:
+                cache = Cache.ProgramCache(option_value(sys.argv, "--cache-dir"))
+            profiler = None
+            if "--profile" in sys.argv:
+                profiler = Profiler.Profiler(float(option_value(sys.argv, "--profile-interval", 1)) / 1000)
+                profiler.start()
+            try:
+                use_file(option_value(sys.argv, "-f"), ev, sys.argv, cache, profiler)
+            except (Limits.LimitExceeded, Parser.SyntaxErrors) as ex:
+                print(ex, file=sys.stderr)
+                sys.exit(1)
+            finally:
+                if profiler is not None:
+                    profiler.stop()
+                    print(profiler.report(), file=sys.stderr)
+                    with open(option_value(sys.argv, "--profile-out", "profile.collapsed"), "w") as f:
+                        f.write(profiler.collapsed() + "\n")
+                if cache is not None and "--cache-stats" in sys.argv:
+                    print(cache.stats(), file=sys.stderr)
+                if "--memo-stats" in sys.argv:
+                    print(ev.memo.stats(), file=sys.stderr)
+                if ev.quickener is not None and "--quicken-stats" in sys.argv:
+                    print(ev.quickener.stats(), file=sys.stderr)
+                ev.parallel.close()
+                ev.async_runner.close()
             return
+        REPL_MODE = True
     else: 
         REPL_MODE = True
-    if REPL_MODE: use_as_repl(ev)
+    if REPL_MODE: use_as_repl(ev, sys.argv)
     
 
 
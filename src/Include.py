@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import concurrent.futures
+import Lexer
+import Parser
+
+# Loading the files given with -i.
+#
+# A directory includes every .hop file in it, in sorted name order, so the
+# order the files run in does not depend on the file system. The files are
+# lexed and parsed in a pool of worker processes (ASTs already in the cache
+# are not parsed at all) and come back in that same order; the parent then
+# prepares and runs them one after another, so declarations and top-level
+# statements happen exactly as if the files were loaded one at a time.
+#
+# Every file records how long each step took, for --include-times.
+
+INCLUDE_EXTENSION = ".hop"
+
+
+def include_files(include_name):
+    """The files an -i argument names, as paths."""
+    if os.path.isdir(include_name):
+        return [os.path.join(include_name, name) for name in sorted(os.listdir(include_name))
+                if name.endswith(INCLUDE_EXTENSION) and os.path.isfile(os.path.join(include_name, name))]
+    return [include_name]
+
+def parse_source(source, lazy=False, file_name=None):
+    start = time.perf_counter()
+    try:
+        ast = Parser.parse_program(Lexer.tokenize(source), lazy)
+    except Parser.SyntaxErrors as ex:
+        raise Parser.SyntaxErrors(ex.errors, source, file_name) from None
+    return ast, time.perf_counter() - start
+
+
+class IncludedFile:
+    def __init__(self, file_name, source):
+        self.file_name = file_name
+        self.source = source
+        self.ast = None
+        self.cached = False
+        self.parse_time = 0.0
+        self.prepare_time = 0.0
+        self.execute_time = 0.0
+
+    def total_time(self):
+        return self.parse_time + self.prepare_time + self.execute_time
+
+
+class IncludeLoader:
+    """Reads and parses include files, in parallel when there are several
+    to parse and more than one worker.
+
+    workers defaults to the number of CPUs; lazy leaves function bodies
+    unparsed, see Lazy.py."""
+
+    def __init__(self, workers=None, cache=None, lazy=False):
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.cache = cache
+        self.lazy = lazy
+
+    def load(self, file_names):
+        """IncludedFiles with their ASTs, in the order of file_names."""
+        files = []
+        for file_name in file_names:
+            with open(file_name, "r") as f:
+                files.append(IncludedFile(file_name, f.read()))
+        unparsed = []
+        for included in files:
+            if self.cache is not None:
+                included.ast = self.cache.load(included.file_name, included.source, self.lazy)
+                included.cached = included.ast is not None
+            if included.ast is None:
+                unparsed.append(included)
+        if self.workers > 1 and len(unparsed) > 1:
+            self.parse_parallel(unparsed)
+        for included in unparsed:
+            if included.ast is None:
+                # parsed here when there is no pool, and again when a worker
+                # failed, so a syntax error is raised from this process
+                included.ast, included.parse_time = parse_source(included.source, self.lazy, included.file_name)
+            if self.cache is not None:
+                self.cache.store(included.file_name, included.source, included.ast, self.lazy)
+        return files
+
+    def parse_parallel(self, files):
+        sys.stdout.flush()
+        with concurrent.futures.ProcessPoolExecutor(min(self.workers, len(files))) as pool:
+            futures = [pool.submit(parse_source, included.source, self.lazy, included.file_name)
+                       for included in files]
+            for included, future in zip(files, futures):
+                try:
+                    included.ast, included.parse_time = future.result()
+                except Exception:
+                    # a syntax error, or an AST too deeply nested to send back
+                    pass
+
+
+def timing_report(files):
+    """Per-file times, slowest first."""
+    lines = [f"{'total ms':>10}{'parse':>10}{'prepare':>10}{'execute':>10}  file"]
+    for included in sorted(files, key=lambda included: -included.total_time()):
+        parse = "cached" if included.cached else f"{included.parse_time * 1000:.2f}"
+        lines.append(f"{included.total_time() * 1000:10.2f}{parse:>10}{included.prepare_time * 1000:10.2f}"
+                     f"{included.execute_time * 1000:10.2f}  {included.file_name}")
+    lines.append(f"{sum(included.total_time() for included in files) * 1000:10.2f}"
+                 f"  in {len(files)} files")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(4):
+            with open(os.path.join(directory, f"lib_{i}{INCLUDE_EXTENSION}"), "w") as f:
+                f.write(f"mkfunc square_{i}(x) {{\n    return x * x + {i}\n}}\n")
+        files = IncludeLoader(workers=2).load(include_files(directory))
+        for included in files:
+            print(os.path.basename(included.file_name), included.ast)
+        print(timing_report(files))
@@ -0,0 +1,94 @@
+import Parser
+import Optimizer
+import Parser_types as PTypes
+
+# Lazy parsing of function bodies (--lazy).
+#
+# With Parser(tokens, lazy=True) a `mkfunc` is parsed up to its `{` and the
+# rest of the declaration is skipped by matching braces: the function keeps
+# its name and parameters and, in lazy_body, the tokens of its body. The body
+# is parsed, and optimized at the level the rest of the program was, the
+# first time the function is called; every backend calls load_body before it
+# runs or compiles a function. A library of many functions then costs little
+# more than lexing for each function the program never calls.
+#
+# Until then the body is None, so the preparation passes leave the function
+# alone: it is resolved when a backend first compiles it and it is memoized
+# only when declared with `memo mkfunc`.
+#
+# A syntax error inside a lazy body only shows at the first call. Lazy.locate
+# gives each lazy body the source and file name it was read from, so such an
+# error has the same file:line:column as one found by an eager parse.
+# --check-syntax
+# parses every body at load time to report the errors of all of them up front
+# (and throws the result away, so the program still runs lazily).
+
+
+def locate(ast, source, file_name=None):
+    """Records the source of every lazy body in the program, for its syntax errors."""
+    for node in ast:
+        if isinstance(node, PTypes.FunctionDeclaration) and node.lazy_body is not None:
+            node.lazy_body.source = source
+            node.lazy_body.file_name = file_name
+    return ast
+
+def parse_body(func):
+    lazy_body = func.lazy_body
+    try:
+        return Parser.PrattParser(lazy_body.tokens).parse_body()
+    except Parser.SyntaxErrors as ex:
+        raise Parser.SyntaxErrors([(pos, f"In function '{func.name}': {message}") for pos, message in ex.errors],
+                                  lazy_body.source, lazy_body.file_name) from None
+
+def load_body(func):
+    """Parses the body of func, if it is still lazy."""
+    lazy_body = func.lazy_body
+    if lazy_body is not None:
+        func.body = parse_body(func)
+        func.lazy_body = None
+        if lazy_body.level:
+            Optimizer.Optimizer(lazy_body.level).optimize_statement(func)
+    return func
+
+def check_syntax(ast):
+    """Parses every lazy body in the program, raising the syntax errors of all of them."""
+    errors = []
+    source = file_name = None
+    for node in ast:
+        if isinstance(node, PTypes.FunctionDeclaration) and node.lazy_body is not None:
+            try:
+                parse_body(node)
+            except Parser.SyntaxErrors as ex:
+                errors.extend(ex.errors)
+                source, file_name = node.lazy_body.source, node.lazy_body.file_name
+    if errors:
+        raise Parser.SyntaxErrors(errors, source, file_name)
+    return ast
+
+
+if __name__ == "__main__":
+    import Lexer
+    program = """
+    mkfunc used(x) {
+        if (x > 1) {
+            return x * 2 + 1
+        }
+        return 0
+    }
+    mkfunc broken(x) {
+        return x +
+    }
+    mkfunc also_broken(x) {
+        var y = (x
+        return y
+    }
+    print(used(3))
+    """
+    ast = locate(Parser.parse_program(Lexer.tokenize(program), lazy=True), program, "demo.hpl")
+    print(ast)
+    load_body(ast[0])
+    print(ast[0])
+    try:
+        check_syntax(ast)
+    except Exception as ex:
+        print(ex)
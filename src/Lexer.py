@@ -1,3 +1,5 @@
+import re
+from sys import intern
 import Tokens as token
 
 class Lexer:
@@ -34,7 +36,7 @@ class Lexer:
                     else:
                         self.current_char = self.text[self.pos]
                     if match.group(0) is not None:
-                        return token.Token(token_type, match.group(0))
+                        return token.Token(token_type, match.group(0), match.start())
             self.error(self.current_char)
 
     def tokenize(self):
@@ -44,19 +46,134 @@ class Lexer:
             if NEXT:
                 self.tokens.append(NEXT)
             else:
-                self.tokens.append(token.Token(token.TOKENTYPE.EOF, ""))
+                self.tokens.append(token.Token(token.TOKENTYPE.EOF, "", self.pos))
             #print(self.tokens)
         return self.tokens
     
+
+WHITESPACE = re.compile(r"\s*")
+UNINTERNED = {token.TOKENTYPE.STRING, token.TOKENTYPE.COMMENT, token.TOKENTYPE.INTEGER, token.TOKENTYPE.FLOAT}
+
+
+class MasterLexer:
+    """Single-pass lexer.
+
+    Every rule in TOKEN_PRIORITY is folded into one alternation of named
+    groups. Python's regex alternation is ordered (first alternative wins),
+    so the priority order is kept and the token stream is identical to the
+    one produced by Lexer.
+    """
+    _pattern = None
+
+    def __init__(self, text=None):
+        self.text = text
+        self.tokens = []
+
+    @classmethod
+    def master_pattern(cls):
+        if cls._pattern is None:
+            alternatives = "|".join(
+                f"(?P<{token_type}>{token.TOKEN_RULES[token_type].pattern})"
+                for token_type in token.TOKEN_PRIORITY
+            )
+            cls._pattern = re.compile(r"\s*(?:" + alternatives + ")")
+        return cls._pattern
+
+    def error(self, character=''):
+        raise Exception("Invalid character: " + character)
+
+    def tokenize(self):
+        text = self.text
+        end = len(text)
+        pos = 0
+        match = self.master_pattern().match
+        skip_whitespace = WHITESPACE.match
+        tokens = self.tokens
+        append = tokens.append
+        Token = token.Token
+        while pos < end:
+            m = match(text, pos)
+            if m is None:
+                pos = skip_whitespace(text, pos).end()
+                if pos >= end:
+                    append(Token(token.TOKENTYPE.EOF, "", pos))
+                    break
+                self.error(text[pos])
+            token_type = m.lastgroup
+            value = m.group(token_type)
+            if token_type not in UNINTERNED:
+                # names, keywords and operators repeat all over a program;
+                # interning makes every occurrence share one string
+                value = intern(value)
+            append(Token(token_type, value, m.start(token_type)))
+            pos = m.end()
+        return tokens
+
+
 def tokenize(text):
+    lexer = MasterLexer(text)
+    return lexer.tokenize()
+
+def reference_tokenize(text):
     lexer = Lexer(text)
     return lexer.tokenize()
 
+def compare_lexers(text):
+    """Differential check of MasterLexer against Lexer.
+
+    Returns None when both produce the same tokens (or the same error),
+    otherwise a message describing the first difference."""
+    def run(lex):
+        try:
+            return [(t.type, t.value, t.pos) for t in lex(text)]
+        except Exception as ex:
+            return str(ex)
+    expected = run(reference_tokenize)
+    actual = run(tokenize)
+    if expected == actual:
+        return None
+    if isinstance(expected, str) or isinstance(actual, str):
+        return f"expected {expected!r}, got {actual!r}"
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        if want != got:
+            return f"token {i}: expected {want}, got {got}"
+    return f"expected {len(expected)} tokens, got {len(actual)}"
+
+def random_source(length, seed=0):
+    # token soup built from fragments of every rule, glued with and without
+    # whitespace so prefix/priority interactions are exercised
+    import random
+    rng = random.Random(seed)
+    fragments = [
+        "for", "format", "var", "variable", "if", "iffy", "else", "while",
+        "return", "mkfunc", "true", "falsehood", "x", "_y1", "12", "3.25",
+        "4.", ".5", "\"str ing\"", "\"", "'", "// comment", "%=", "*=", "/=",
+        "+=", "-=", "^=", "!=", "!", "==", "=", "<=", ">=", "<", ">", "+", "-",
+        "*", "/", "%", "^", "(", ")", "{", "}", "[", "]", ",", ";", ".",
+    ]
+    separators = ["", " ", "\n", "\t", "  "]
+    parts = []
+    for _ in range(length):
+        parts.append(rng.choice(fragments))
+        parts.append(rng.choice(separators))
+    return "".join(parts)
+
+def lex_throughput(text, lex=tokenize, repeat=3):
+    """Best-of-`repeat` lexing speed in MB/s."""
+    import time
+    size = len(text.encode("utf-8")) / (1024 * 1024)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lex(text)
+        best = min(best, time.perf_counter() - start)
+    return size / best if best > 0 else float("inf")
+
 if __name__ == "__main__":
-    print(
-        tokenize(
-            """for(var i = 0, i < 10, i += 1) {
-                print(i)
-            }"""
-        )
-    )
\ No newline at end of file
+    # the differential check against Lexer is in tests/test_lexer.py
+    import os
+    examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+    with open(os.path.join(examples, "stdlib.hpl"), "r") as f:
+        corpus = f.read() * 200
+    print(f"Lexer:       {lex_throughput(corpus, reference_tokenize, 1):8.2f} MB/s")
+    print(f"MasterLexer: {lex_throughput(corpus):8.2f} MB/s")
@@ -0,0 +1,239 @@
+import math
+import time
+import operator
+import functools
+import Arrays
+
+# Limits for running untrusted programs (--max-steps, --timeout, --max-size).
+#
+#   max_steps    loop iterations plus function calls one execute() may make
+#   timeout      seconds one execute() may run for
+#   max_size     longest string, list or array a program may build
+#   max_depth    deepest chain of active function calls
+#   allow_files  whether the file builtins (FILE_FUNCTIONS) may be called
+#
+# evaluator.set_limits(Limits(...)) puts an evaluator in limited mode; every
+# execute() after that gets the whole budget and deadline afresh, so one warm
+# evaluator can run many programs. A program that goes over a limit raises
+# LimitExceeded, an ordinary Exception, and the evaluator stays usable.
+#
+# Backends only pay for limits in limited mode: they compile a tick() into
+# every loop iteration, enter() and leave() around every function call, and
+# + * ^ (plain and augmented) into the checked versions below. tick() just
+# counts down; the step count and the clock are only looked at every
+# CHECK_INTERVAL ticks. Repetition ("a" * n, [0] * n) is checked before it
+# allocates, as are the sizes given to zeros() and range_array(), and an
+# integer product or power is refused up front when its result would have more
+# than MAX_INT_DIGITS digits; everything else that makes a string, list or
+# array is checked once it is built.
+#
+# Recursion deeper than max_depth (or, without one, deeper than the Python
+# stack of the tree-walker, closure and python backends allows) is a
+# LimitExceeded too, never a RecursionError.
+#
+# Time spent in one step (a long builtin call, say) is not interrupted; the
+# deadline is noticed at the next check. `await` is the exception: the event
+# loop is stopped at the deadline.
+
+CHECK_INTERVAL = 1000
+
+# the most decimal digits a checked integer product or power may produce
+MAX_INT_DIGITS = 100000
+LOG10_2 = math.log10(2)
+
+# builtins that touch the file system, refused unless allow_files
+FILE_FUNCTIONS = frozenset(("read_lines", "read_chunks", "mmap_file", "write_lines", "read_file_async"))
+
+# how many elements builtins that take a size will allocate, before they do
+SIZE_ARGUMENTS = {
+    "zeros": lambda length: length,
+    "range_array": lambda start, stop: stop - start,
+}
+
+
+class LimitExceeded(Exception):
+    pass
+
+
+def size(value):
+    if isinstance(value, (str, list, bytes)) or Arrays.is_array(value):
+        return len(value)
+    return 0
+
+
+class Limits:
+    def __init__(self, max_steps=None, timeout=None, max_size=None, max_depth=None, allow_files=False):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.allow_files = allow_files
+        self.calls = 0 # active function calls
+        self.depth = 0
+        self.steps = 0
+        self.window = 0
+        self.countdown = 0
+        self.deadline = None
+
+    def start(self):
+        """Begins an execute(); nested ones share the outermost budget."""
+        if self.depth == 0:
+            self.steps = 0
+            self.calls = 0
+            self.deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+            self.window = self.countdown = self.next_window()
+        self.depth += 1
+
+    def stop(self):
+        self.depth -= 1
+
+    def next_window(self):
+        if self.max_steps is None:
+            return CHECK_INTERVAL
+        return min(CHECK_INTERVAL, self.max_steps - self.steps)
+
+    def remaining_time(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def steps_taken(self):
+        return self.steps + self.window - self.countdown
+
+    def tick(self):
+        self.countdown -= 1
+        if self.countdown < 0:
+            self.check()
+
+    def check(self):
+        # the first tick after a window: count the window, then this tick
+        self.steps += self.window
+        self.window = self.countdown = 0
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            raise LimitExceeded(f"Step limit of {self.max_steps} exceeded")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise self.timed_out()
+        self.window = self.next_window()
+        self.countdown = self.window - 1
+
+    def enter(self):
+        """A function call starts: one step, and one level deeper."""
+        self.tick()
+        if self.max_depth is not None and self.calls >= self.max_depth:
+            raise self.too_deep()
+        self.calls += 1
+
+    def leave(self):
+        self.calls -= 1
+
+    def calling(self, function):
+        """function, run as a call between enter() and leave()."""
+        enter = self.enter
+        leave = self.leave
+
+        def call(*arguments):
+            enter()
+            try:
+                return function(*arguments)
+            finally:
+                leave()
+        return call
+
+    def too_deep(self):
+        if self.max_depth is None:
+            return LimitExceeded("Call depth limit exceeded: the program recursed too deeply")
+        return LimitExceeded(f"Call depth limit of {self.max_depth} exceeded")
+
+    def timed_out(self):
+        return LimitExceeded(f"Time limit of {self.timeout:g} s exceeded")
+
+    def check_size(self, value):
+        if self.max_size is not None and size(value) > self.max_size:
+            raise self.too_large(size(value))
+        return value
+
+    def too_large(self, length):
+        return LimitExceeded(f"Size limit of {self.max_size} exceeded: a value of {length} elements")
+
+    def check_repetition(self, left, right):
+        if self.max_size is not None:
+            if isinstance(right, int) and size(left):
+                length = size(left) * right
+            elif isinstance(left, int) and size(right):
+                length = left * size(right)
+            else:
+                return
+            if length > self.max_size:
+                raise self.too_large(length)
+
+    def add(self, left, right):
+        return self.check_size(left + right)
+
+    def check_product(self, left, right):
+        if type(left) is int and type(right) is int and left and right:
+            # the product has at least bit_length(left) + bit_length(right) - 1 bits
+            self.check_digits("product", int((abs(left).bit_length() + abs(right).bit_length() - 1) * LOG10_2))
+
+    def check_digits(self, kind, digits):
+        if digits > MAX_INT_DIGITS:
+            raise LimitExceeded(f"Size limit of {MAX_INT_DIGITS} digits exceeded: a {kind} of over {digits} digits")
+
+    def multiply(self, left, right):
+        self.check_repetition(left, right)
+        self.check_product(left, right)
+        return self.check_size(left * right)
+
+    def iadd(self, left, right):
+        return self.check_size(operator.iadd(left, right))
+
+    def imultiply(self, left, right):
+        self.check_repetition(left, right)
+        self.check_product(left, right)
+        return self.check_size(operator.imul(left, right))
+
+    def check_power(self, left, right):
+        if type(left) is int and type(right) is int and right > 1 and abs(left) > 1:
+            # the result has at least (bit_length - 1) * right bits
+            self.check_digits("power", int((abs(left).bit_length() - 1) * right * LOG10_2))
+
+    def power(self, left, right):
+        self.check_power(left, right)
+        return left ** right
+
+    def ipower(self, left, right):
+        self.check_power(left, right)
+        return operator.ipow(left, right)
+
+    def checked_builtin(self, name, function):
+        """function, checking the size of what it builds."""
+        if name in FILE_FUNCTIONS and not self.allow_files:
+            def refused(*arguments):
+                raise LimitExceeded(f"'{name}' uses files, which a limited program may not do")
+            return functools.wraps(function)(refused)
+        size_argument = SIZE_ARGUMENTS.get(name)
+
+        @functools.wraps(function)
+        def checked(*arguments):
+            if size_argument is not None and self.max_size is not None:
+                length = size_argument(*arguments)
+                if length > self.max_size:
+                    raise self.too_large(length)
+            return self.check_size(function(*arguments))
+        return checked
+
+
+if __name__ == "__main__":
+    limits = Limits(max_steps=2500, max_size=10)
+    limits.start()
+    try:
+        while True:
+            limits.tick()
+    except LimitExceeded as ex:
+        print(ex, "after", limits.steps_taken(), "steps")
+    limits.stop()
+    for operation, left, right in [(limits.multiply, "ab", 6), (limits.multiply, 3 ** 300000, 3 ** 300000),
+                                   (limits.power, 9, 99999999)]:
+        try:
+            operation(left, right)
+        except LimitExceeded as ex:
+            print(ex)
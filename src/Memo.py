@@ -0,0 +1,245 @@
+from collections import OrderedDict
+import Parser_types as PTypes
+import Arrays
+
+# Memoization of pure Hoplite functions.
+#
+# A function is pure when calling it can only compute a value: its body makes
+# no print/time (or other builtin) calls, no method calls, and only calls
+# functions that are pure themselves. Hoplite functions cannot see globals,
+# so that is enough for the result to depend on the arguments alone. The
+# analysis runs over one program at a time and only trusts callees declared
+# exactly once in it, under a name the program never assigns to.
+#
+# `memo mkfunc f(...)` memoizes f whatever the analysis says.
+#
+# Every memoized function gets its own LRU cache. Calls with a list argument
+# are not cached (lists are mutable), and neither are list or array results,
+# which the caller could change in place. A function memoized only because it is pure
+# stops being memoized if, after PROBATION lookups, fewer than MIN_HIT_RATE of
+# them hit: caching cheap functions that are rarely called with the same
+# arguments costs more than it saves.
+#
+# A function redeclared under a name already holding one (by an include
+# file, a later REPL line, ...) can change what every cached result was
+# computed from, and the analysis of one program cannot see that. So every
+# cache is emptied and automatic memoization stops for the functions declared
+# so far; see Memoizer.redeclared.
+
+DEFAULT_CAPACITY = 1024
+PROBATION = 1000
+MIN_HIT_RATE = 0.25
+MISSING = object()
+
+
+def declared_functions(ast):
+    functions = {}
+    for node in ast:
+        if isinstance(node, PTypes.FunctionDeclaration):
+            functions.setdefault(node.name, []).append(node)
+    return functions
+
+def assigned_names(ast):
+    """Names the top level of the program assigns, function bodies excluded."""
+    names = set()
+    stack = [node for node in ast if not isinstance(node, PTypes.FunctionDeclaration)]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, PTypes.VariableDeclaration):
+            names.add(node.name)
+        elif isinstance(node, (PTypes.Assignment, PTypes.AugmentedAssignment)):
+            names.add(node.variable)
+        if node is not None:
+            stack.extend(PTypes.child_nodes(node))
+    return names
+
+def function_callees(func, builtins):
+    """Names func calls, or None when its body does something impure."""
+    if func.lazy_body is not None:
+        # not parsed yet, see Lazy.py
+        return None
+    callees = set()
+    for statement in func.body:
+        for node in PTypes.walk(statement):
+            if isinstance(node, (PTypes.MethodCall, PTypes.FunctionDeclaration, PTypes.Await)):
+                return None
+            elif isinstance(node, PTypes.FunctionCall):
+                if node.name in builtins:
+                    return None
+                callees.add(node.name)
+    return callees
+
+def pure_functions(ast, builtins):
+    """The FunctionDeclarations of the program that are pure."""
+    functions = declared_functions(ast)
+    trusted = {name: funcs[0] for name, funcs in functions.items() if len(funcs) == 1}
+    for name in assigned_names(ast):
+        trusted.pop(name, None)
+    candidates = {}
+    for name, func in trusted.items():
+        if func.is_async:
+            # a call starts a task, which must not come from a cache
+            continue
+        callees = function_callees(func, builtins)
+        if callees is not None and callees <= trusted.keys():
+            candidates[name] = callees
+    # recursion is fine: drop functions with an impure callee until nothing
+    # changes, and whatever is left only calls pure functions
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in list(candidates.items()):
+            if not callees <= candidates.keys():
+                del candidates[name]
+                changed = True
+    return [trusted[name] for name in candidates]
+
+def mark_pure_functions(ast, builtins):
+    for func in pure_functions(ast, builtins):
+        func.pure = True
+    return ast
+
+
+def memo_key(arguments):
+    # keyed on type too: f(1), f(1.0) and f(true) can return different
+    # values, and repr keeps 0.0 and -0.0 apart. Lists make it unhashable.
+    key = tuple(repr(value) if type(value) is float else (type(value), value) for value in arguments)
+    hash(key)
+    return key
+
+
+class LRUCache:
+    def __init__(self, capacity, automatic=False):
+        self.capacity = capacity
+        self.automatic = automatic
+        self.retired = False
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        value = self.entries.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+            if self.automatic and self.hits + self.misses == PROBATION \
+                    and self.hit_rate() < MIN_HIT_RATE:
+                self.retired = True
+                self.entries.clear()
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        if isinstance(value, list) or Arrays.is_array(value):
+            return
+        self.entries[key] = value
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+
+class Memoizer:
+    """The memo caches of one evaluator.
+
+    capacity 0 turns automatic memoization off; functions annotated with
+    `memo` still get a cache (of DEFAULT_CAPACITY entries) unless enabled
+    is False."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, enabled=True):
+        self.capacity = capacity
+        self.enabled = enabled
+        self.caches = {}
+
+    def cache(self, func):
+        """The cache for func, or None when calls to it are not memoized."""
+        cache = self.caches.get(func, MISSING)
+        if cache is MISSING:
+            cache = None
+            if self.enabled and func.memo:
+                cache = LRUCache(self.capacity or DEFAULT_CAPACITY)
+            elif self.enabled and func.pure and self.capacity > 0:
+                cache = LRUCache(self.capacity, automatic=True)
+            self.caches[func] = cache
+        if cache is not None and cache.retired:
+            return None
+        return cache
+
+    def redeclared(self, functions):
+        """Forgets cached results once a global function has been replaced.
+
+        functions are the values of the global symbol table: they keep `memo`
+        caches, emptied, but lose the purity they were given alongside the
+        old declaration."""
+        for func in functions:
+            if isinstance(func, PTypes.FunctionDeclaration):
+                func.pure = False
+        for cache in self.caches.values():
+            if cache is not None:
+                cache.entries.clear()
+                if cache.automatic:
+                    cache.retired = True
+
+    def call(self, cache, arguments, run):
+        """run(arguments) through the cache."""
+        try:
+            key = memo_key(arguments)
+        except TypeError:
+            return run(arguments)
+        value = cache.lookup(key)
+        if value is MISSING:
+            value = run(arguments)
+            cache.store(key, value)
+        return value
+
+    def wrap(self, func, function):
+        """function, a Python callable running func, behind func's cache."""
+        cache = self.cache(func)
+        if cache is None:
+            return function
+
+        def memoized(*arguments):
+            if cache.retired:
+                return function(*arguments)
+            return self.call(cache, arguments, lambda arguments: function(*arguments))
+        return memoized
+
+    def stats(self):
+        lines = []
+        for func, cache in self.caches.items():
+            if cache is not None:
+                state = "retired" if cache.retired else f"{len(cache.entries)}/{cache.capacity} entries"
+                lines.append(f"memo {func.name}: {cache.hits} hits, {cache.misses} misses "
+                             f"({cache.hit_rate():.1%}), {state}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import Lexer
+    import Parser
+    program = """
+    mkfunc factorial(n) {
+        if (n < 2) {
+            return 1
+        }
+        return n * factorial(n - 1)
+    }
+    mkfunc sin(x) {
+        var result = 0
+        var n = 0
+        while (n < 10) {
+            result = result + (0 - 1) ^ n * x ^ (2 * n + 1) / factorial(2 * n + 1)
+            n = n + 1
+        }
+        return result
+    }
+    mkfunc log_sin(x) {
+        print(x)
+        return sin(x)
+    }
+    """
+    ast = Parser.parse_program(Lexer.tokenize(program))
+    print([func.name for func in pure_functions(ast, ["print", "time"])])
@@ -0,0 +1,454 @@
+import copy
+import math
+from collections import Counter
+import Parser_types as PTypes
+import Tokens as Token
+
+# AST optimizer, run between parsing and execution.
+#
+# -O0  leaves the AST alone
+# -O1  converts NumberLiteral/StringLiteral/BooleanLiteral into Literal nodes
+#      holding the runtime value, folds operations whose operands are all
+#      literals, drops if/while statements whose condition is a literal and
+#      removes statements that follow a `return` in the same block.
+# -O2  also optimizes loops and the locals of functions:
+#      - a local that a function sets once, at the top of its body, to a
+#        literal is replaced by the literal (`var PI = 3.14159` in deg_to_rad)
+#      - `x ^ 2` becomes the unary SQUARE operation, square(): x * x when x
+#        is an int, which is exact, and x ** 2 for anything else, so a float
+#        still overflows with an error and other types fail as they did
+#      - loop-invariant code motion: operations in a loop's condition, and
+#        at the top of its body, that only read variables the loop never
+#        assigns are computed once before the loop, into a new variable
+#        (`while (i < n * 2)`, `y = y + x / 2`), as are leading statements
+#        such as `var half = x / 2` that set a variable only they assign
+#
+# Hoisting keeps the order side effects happen in. Only operators on
+# variables and literals move, and only out of a condition without calls and
+# the statements at the top of the body before the first one that could do
+# more than compute a value. What moves out of the body runs under
+# `if (condition)`, so it still only runs if the loop does; a `for` loop's
+# init, which has to be pure, runs once before that guard and again when the
+# loop itself starts. Hoisted values are only ever used as operands, so
+# iterations cannot tell that they now share one list or array (unless it is
+# a literal, which cannot change anyway).
+#
+# Only operations that produce the same value every run are folded: anything
+# that raises (1 / 0, "a" - 1, ...) is left for the backend so the error
+# still happens at runtime, as do results that would be huge to build.
+#
+# The optimizer rewrites statement lists and child fields in place and builds
+# new Literal nodes, so literal nodes shared by the parser are never mutated.
+
+BINARY_OPERATIONS = {
+    Token.TOKENTYPE.PLUS: lambda l, r: l + r,
+    Token.TOKENTYPE.MINUS: lambda l, r: l - r,
+    Token.TOKENTYPE.MUL: lambda l, r: l * r,
+    Token.TOKENTYPE.DIV: lambda l, r: l / r,
+    Token.TOKENTYPE.MODULO: lambda l, r: l % r,
+    Token.TOKENTYPE.CARAT: lambda l, r: l ** r,
+}
+
+COMPARISON_OPERATIONS = {
+    Token.TOKENTYPE.IS_EQUAL: lambda l, r: l == r,
+    Token.TOKENTYPE.NOT_EQUAL: lambda l, r: l != r,
+    Token.TOKENTYPE.GREATER_THAN: lambda l, r: l > r,
+    Token.TOKENTYPE.GREATER_THAN_OR_EQUAL: lambda l, r: l >= r,
+    Token.TOKENTYPE.LESS_THAN: lambda l, r: l < r,
+    Token.TOKENTYPE.LESS_THAN_OR_EQUAL: lambda l, r: l <= r,
+}
+
+def square(value):
+    return value * value if type(value) is int else value ** 2
+
+UNARY_OPERATIONS = {
+    Token.TOKENTYPE.MINUS: lambda operand: -operand,
+    Token.TOKENTYPE.BANG: lambda operand: not operand,
+    Token.TOKENTYPE.SQUARE: square,
+}
+
+# largest folded string length / integer bit length
+MAX_FOLDED_SIZE = 4096
+
+LEVELS = (0, 1, 2)
+LOOP_LEVEL = 2
+TEMPORARY_PREFIX = "_invariant"
+OPERATIONS = (PTypes.BinaryOperation, PTypes.ComparisonOperation, PTypes.UnaryOperation)
+
+
+def foldable(value):
+    if isinstance(value, bool) or isinstance(value, int):
+        return isinstance(value, bool) or value.bit_length() <= MAX_FOLDED_SIZE
+    elif isinstance(value, float):
+        # inf and nan have no literal spelling in the transpiled source
+        return math.isfinite(value)
+    elif isinstance(value, str):
+        return len(value) <= MAX_FOLDED_SIZE
+    return False
+
+def cheap_operation(op, left, right):
+    # refuse operations whose result could be too big to compute up front
+    if op == Token.TOKENTYPE.CARAT and isinstance(right, (int, float)):
+        return abs(right) <= 64 or not isinstance(left, (int, float)) or abs(left) <= 1
+    if op == Token.TOKENTYPE.MUL and (isinstance(left, str) or isinstance(right, str)):
+        count = right if isinstance(left, str) else left
+        return not isinstance(count, int) or count <= MAX_FOLDED_SIZE
+    return True
+
+def statement_nodes(node):
+    """Every node under node (itself included), without looking into function declarations."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, PTypes.FunctionDeclaration):
+            stack.extend(PTypes.child_nodes(node))
+
+def assignment_counts(nodes):
+    counts = Counter()
+    for root in nodes:
+        for node in statement_nodes(root):
+            if isinstance(node, PTypes.VariableDeclaration):
+                counts[node.name] += 1
+            elif isinstance(node, (PTypes.Assignment, PTypes.AugmentedAssignment)):
+                counts[node.variable] += 1
+    return counts
+
+def read_names(nodes):
+    return {node.name for root in nodes for node in statement_nodes(root) if isinstance(node, PTypes.Variable)}
+
+def bare_reads(nodes):
+    """Names read other than as the operand of an operator."""
+    operands = set()
+    variables = []
+    for root in nodes:
+        for node in statement_nodes(root):
+            if isinstance(node, OPERATIONS):
+                operands.update(id(child) for child in PTypes.child_nodes(node))
+            elif isinstance(node, PTypes.AugmentedAssignment):
+                operands.add(id(node.value))
+            elif isinstance(node, PTypes.Variable):
+                variables.append(node)
+    return {node.name for node in variables if id(node) not in operands}
+
+def scope_names(nodes):
+    names = read_names(nodes)
+    names.update(assignment_counts(nodes))
+    return names
+
+def pure(node):
+    """Whether node is operators on variables and literals, which can only compute a value (or raise)."""
+    if isinstance(node, (PTypes.Literal, PTypes.Variable)):
+        return True
+    elif isinstance(node, PTypes.BinaryOperation):
+        return node.op in BINARY_OPERATIONS and pure(node.left) and pure(node.right)
+    elif isinstance(node, PTypes.ComparisonOperation):
+        return node.op in COMPARISON_OPERATIONS and pure(node.left) and pure(node.right)
+    elif isinstance(node, PTypes.UnaryOperation):
+        return node.op in UNARY_OPERATIONS and pure(node.operand)
+    return False
+
+def substitute(node, name, replacement):
+    """Replaces every read of the variable name under node, in place."""
+    for field in PTypes.fields(node):
+        value = getattr(node, field)
+        if isinstance(value, list):
+            value[:] = [replaced(item, name, replacement) for item in value]
+        elif isinstance(value, (PTypes.Statement, PTypes.Expression)):
+            setattr(node, field, replaced(value, name, replacement))
+
+def replaced(node, name, replacement):
+    if isinstance(node, PTypes.Variable) and node.name == name:
+        return replacement
+    if isinstance(node, (PTypes.Statement, PTypes.Expression)) and not isinstance(node, PTypes.FunctionDeclaration):
+        substitute(node, name, replacement)
+    return node
+
+def placed(node, like):
+    # new nodes standing in for a loop take its place in profiles
+    position = PTypes.position(like)
+    if position is not None:
+        node.pos = position
+    return node
+
+
+class Optimizer:
+    def __init__(self, level=1):
+        self.level = level
+        self.literals = {}
+        self.counts = {
+            "literals converted": 0,
+            "expressions folded": 0,
+            "dead branches removed": 0,
+            "unreachable statements removed": 0,
+        }
+        if level >= LOOP_LEVEL:
+            self.counts.update({
+                "constants propagated": 0,
+                "powers reduced": 0,
+                "invariants hoisted": 0,
+            })
+        self.names = set()
+        self.temporaries = 0
+
+    def optimize_program(self, ast):
+        if self.level < 1:
+            return ast
+        self.names = scope_names(ast)
+        return self.optimize_block(ast)
+
+    def literal(self, value):
+        # one Literal per distinct value, like the parser's literal nodes
+        key = (type(value), repr(value))
+        node = self.literals.get(key)
+        if node is None:
+            node = self.literals[key] = PTypes.Literal(value)
+        return node
+
+    def optimize_block(self, statements):
+        optimized = []
+        for index, statement in enumerate(statements):
+            replacement = self.optimize_statement(statement)
+            if isinstance(replacement, list):
+                optimized.extend(replacement)
+            else:
+                optimized.append(replacement)
+            if optimized and isinstance(optimized[-1], PTypes.ReturnStatement):
+                # nothing after a return in the same block can run
+                self.counts["unreachable statements removed"] += len(statements) - index - 1
+                break
+        statements[:] = optimized
+        return statements
+
+    def optimize_statement(self, node):
+        """The optimized node, or a list of statements to splice in its place."""
+        if isinstance(node, PTypes.FunctionDeclaration):
+            if node.lazy_body is not None:
+                # optimized at this level once it is parsed, see Lazy.py
+                node.lazy_body.level = self.level
+            else:
+                outer = self.names
+                self.names = scope_names(node.body) | set(node.parameters)
+                if self.level >= LOOP_LEVEL:
+                    self.propagate_constants(node)
+                self.optimize_block(node.body)
+                self.names = outer
+        elif isinstance(node, (PTypes.VariableDeclaration, PTypes.Assignment,
+                               PTypes.AugmentedAssignment, PTypes.ReturnStatement)):
+            node.value = self.optimize_expression(node.value)
+        elif isinstance(node, PTypes.IfStatement):
+            node.condition = self.optimize_expression(node.condition)
+            if isinstance(node.condition, PTypes.Literal):
+                self.counts["dead branches removed"] += 1
+                if node.condition.value:
+                    return self.optimize_block(node.if_body)
+                elif node.else_body is not None:
+                    return self.optimize_block(node.else_body)
+                return []
+            self.optimize_block(node.if_body)
+            if node.else_body is not None:
+                self.optimize_block(node.else_body)
+        elif isinstance(node, PTypes.WhileStatement):
+            node.condition = self.optimize_expression(node.condition)
+            if isinstance(node.condition, PTypes.Literal) and not node.condition.value:
+                self.counts["dead branches removed"] += 1
+                return []
+            self.optimize_block(node.body)
+            if self.level >= LOOP_LEVEL:
+                return self.hoist_invariants(node)
+        elif isinstance(node, PTypes.ForStatement):
+            node.init = self.optimize_statement(node.init)
+            node.condition = self.optimize_expression(node.condition)
+            if isinstance(node.condition, PTypes.Literal) and not node.condition.value:
+                self.counts["dead branches removed"] += 1
+                return node.init
+            node.update = self.optimize_statement(node.update)
+            self.optimize_block(node.body)
+            if self.level >= LOOP_LEVEL and not node.parallel:
+                return self.hoist_invariants(node)
+        elif isinstance(node, PTypes.Expression):
+            return self.optimize_expression(node)
+        return node
+
+    def optimize_expression(self, node):
+        if isinstance(node, PTypes.NumberLiteral):
+            self.counts["literals converted"] += 1
+            return self.literal(int(node.value) if node.type == 'int' else float(node.value))
+        elif isinstance(node, PTypes.StringLiteral):
+            self.counts["literals converted"] += 1
+            return self.literal(node.value)
+        elif isinstance(node, PTypes.BooleanLiteral):
+            self.counts["literals converted"] += 1
+            return self.literal(node.value == 'true')
+        elif isinstance(node, (PTypes.BinaryOperation, PTypes.ComparisonOperation)):
+            node.left = self.optimize_expression(node.left)
+            node.right = self.optimize_expression(node.right)
+            operations = BINARY_OPERATIONS if isinstance(node, PTypes.BinaryOperation) else COMPARISON_OPERATIONS
+            operation = operations.get(node.op)
+            if operation is not None and isinstance(node.left, PTypes.Literal) \
+                    and isinstance(node.right, PTypes.Literal) \
+                    and cheap_operation(node.op, node.left.value, node.right.value):
+                folded = self.fold(node, operation, node.left.value, node.right.value)
+                if folded is not node:
+                    return folded
+            if self.level >= LOOP_LEVEL and node.op == Token.TOKENTYPE.CARAT \
+                    and isinstance(node.right, PTypes.Literal) and type(node.right.value) is int \
+                    and node.right.value == 2:
+                self.counts["powers reduced"] += 1
+                return placed(PTypes.UnaryOperation(Token.TOKENTYPE.SQUARE, node.left), node)
+        elif isinstance(node, PTypes.UnaryOperation):
+            node.operand = self.optimize_expression(node.operand)
+            operation = UNARY_OPERATIONS.get(node.op)
+            if operation is not None and isinstance(node.operand, PTypes.Literal):
+                return self.fold(node, operation, node.operand.value)
+        elif isinstance(node, PTypes.ArrayLiteral):
+            node.elements = [self.optimize_expression(element) for element in node.elements]
+        elif isinstance(node, PTypes.FunctionCall):
+            node.arguments = [self.optimize_expression(argument) for argument in node.arguments]
+        elif isinstance(node, PTypes.MethodCall):
+            node.arguments = [self.optimize_expression(argument) for argument in node.arguments]
+        elif isinstance(node, PTypes.Await):
+            node.value = self.optimize_expression(node.value)
+        return node
+
+    def propagate_constants(self, func):
+        counts = assignment_counts(func.body)
+        for statement in list(func.body):
+            if not isinstance(statement, PTypes.VariableDeclaration) or counts[statement.name] != 1 \
+                    or statement.name in func.parameters:
+                continue
+            position = func.body.index(statement)
+            if statement.name in read_names(func.body[:position]):
+                continue
+            statement.value = self.optimize_expression(statement.value)
+            if isinstance(statement.value, PTypes.Literal):
+                # every read comes after the only assignment, so the local
+                # always holds this value when read
+                del func.body[position]
+                func.body[position:] = [replaced(later, statement.name, statement.value) for later in func.body[position:]]
+                self.counts["constants propagated"] += 1
+
+    def temporary(self):
+        while True:
+            name = f"{TEMPORARY_PREFIX}{self.temporaries}"
+            self.temporaries += 1
+            if name not in self.names:
+                self.names.add(name)
+                return name
+
+    def hoisted(self, node, variant, hoisted):
+        """node with its loop-invariant operations replaced by new variables declared in hoisted."""
+        if isinstance(node, OPERATIONS) and pure(node) and not read_names([node]) & variant:
+            name = self.temporary()
+            hoisted.append(PTypes.VariableDeclaration(name, node))
+            self.counts["invariants hoisted"] += 1
+            return PTypes.Variable(name)
+        return self.hoisted_operands(node, variant, hoisted)
+
+    def hoisted_operands(self, node, variant, hoisted):
+        if isinstance(node, (PTypes.BinaryOperation, PTypes.ComparisonOperation)):
+            node.left = self.hoisted(node.left, variant, hoisted)
+            node.right = self.hoisted(node.right, variant, hoisted)
+        elif isinstance(node, PTypes.UnaryOperation):
+            node.operand = self.hoisted(node.operand, variant, hoisted)
+        return node
+
+    def hoist_invariants(self, loop):
+        """The loop, or statements to splice in its place, with its invariants computed before it."""
+        is_for = isinstance(loop, PTypes.ForStatement)
+        if not pure(loop.condition):
+            # the condition runs once more before the loop, and must not
+            # have side effects to do so
+            return loop
+        if is_for and not (isinstance(loop.init, (PTypes.VariableDeclaration, PTypes.Assignment))
+                           and pure(loop.init.value)):
+            return loop
+        parts = [loop.condition] + loop.body + ([loop.init, loop.update] if is_for else [])
+        counts = assignment_counts(parts)
+        variant = set(counts)
+        bare = bare_reads(parts)
+        condition_reads = read_names([loop.condition])
+        if is_for:
+            # the init runs again after the guard, see below
+            condition_reads |= read_names([loop.init])
+        before = []
+        loop.condition = self.hoisted_operands(loop.condition, variant, before)
+
+        guard = []
+        body = []
+        reads = set()
+        for index, statement in enumerate(loop.body):
+            if isinstance(statement, (PTypes.VariableDeclaration, PTypes.Assignment)) and pure(statement.value):
+                name = statement.name if isinstance(statement, PTypes.VariableDeclaration) else statement.variable
+                if counts[name] == 1 and name not in condition_reads and name not in reads \
+                        and not read_names([statement.value]) & variant \
+                        and (isinstance(statement.value, PTypes.Literal) or name not in bare):
+                    guard.append(statement)
+                    variant.discard(name)
+                    self.counts["invariants hoisted"] += 1
+                    continue
+                statement.value = self.hoisted_operands(statement.value, variant, guard)
+            elif isinstance(statement, PTypes.AugmentedAssignment) and pure(statement.value):
+                statement.value = self.hoisted(statement.value, variant, guard)
+            else:
+                body.extend(loop.body[index:])
+                break
+            body.append(statement)
+            reads |= read_names([statement])
+
+        if not guard:
+            loop.body[:] = body
+            return before + [loop] if before else loop
+        loop.body[:] = body
+        # a for loop keeps its init, condition and update, so it can still be
+        # a counted loop (see Counted.py); its pure init runs once more first
+        # for the guard's condition
+        loop_statements = [copy.deepcopy(loop.init)] if is_for else []
+        guarded = placed(PTypes.IfStatement(copy.deepcopy(loop.condition), guard + [loop]), loop)
+        return before + loop_statements + [guarded]
+
+    def fold(self, node, operation, *operands):
+        try:
+            value = operation(*operands)
+        except (ArithmeticError, TypeError, ValueError):
+            return node
+        if not foldable(value):
+            return node
+        self.counts["expressions folded"] += 1
+        return self.literal(value)
+
+    def report(self):
+        changes = ", ".join(f"{count} {change}" for change, count in self.counts.items())
+        return f"-O{self.level}: {changes}"
+
+
+def optimize_program(ast, level=1):
+    return Optimizer(level).optimize_program(ast)
+
+
+if __name__ == "__main__":
+    import Lexer
+    import Parser
+    program = """
+    mkfunc sin(x) {
+        var result = 0
+        var n = 1
+        while (n < 10) {
+            var x2 = x^2
+            result = result + (1-2)^(n-1) * x^(2*n-1) / (2 * 3) + x2 / (x + 1)
+            n = n + 1
+        }
+        return result
+        print("unreachable")
+    }
+    if (1 < 2) {
+        print(sin(1))
+    } else {
+        print("never")
+    }
+    """
+    for level in (1, 2):
+        optimizer = Optimizer(level)
+        ast = optimizer.optimize_program(Parser.parse_program(Lexer.tokenize(program)))
+        print(ast)
+        print(optimizer.report())
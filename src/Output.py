@@ -0,0 +1,59 @@
+import sys
+
+# Output of Hoplite's print.
+#
+# Every evaluator writes through its `output`, a BufferedOutput. Printed
+# lines collect in memory and are written to the stream in one call once
+# buffer_size characters are waiting, when the program calls flush(), and
+# when an execute() call returns or fails, so output never stays behind
+# after the program that printed it. A buffer_size of 0 writes and flushes
+# every line, for interactive use.
+#
+# The stream is anything with write() and flush(). Embedders capture output
+# by giving an io.StringIO; with no stream the output goes to whatever
+# sys.stdout is at the time it is written.
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+
+class BufferedOutput:
+    def __init__(self, stream=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.lines = []
+        self.size = 0
+
+    def print(self, value):
+        line = f"{value}\n"
+        self.lines.append(line)
+        self.size += len(line)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def write(self, text):
+        """Adds text as it is, without a newline."""
+        if text:
+            self.lines.append(text)
+            self.size += len(text)
+            if self.size >= self.buffer_size:
+                self.flush()
+
+    def flush(self):
+        stream = self.stream if self.stream is not None else sys.stdout
+        if self.lines:
+            text = "".join(self.lines)
+            self.lines = []
+            self.size = 0
+            stream.write(text)
+        stream.flush()
+
+
+if __name__ == "__main__":
+    import io
+    captured = io.StringIO()
+    output = BufferedOutput(captured, buffer_size=16)
+    for value in [1, 2.5, "three", True, [4, 5]]:
+        output.print(value)
+    print(repr(captured.getvalue()))
+    output.flush()
+    print(repr(captured.getvalue()))
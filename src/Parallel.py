@@ -0,0 +1,177 @@
+import io
+import os
+import sys
+import math
+import itertools
+import contextlib
+import concurrent.futures
+import Parser_types as PTypes
+import Arrays
+import Output
+
+# Parallel map and `parallel for` over a process pool.
+#
+#   pmap(f, values)        f(value) for every value, as a list in order
+#   parallel for (...) {}  every iteration of the body
+#
+# The work is split into chunks of chunk_size items (by default enough for
+# CHUNKS_PER_WORKER chunks per worker) and the chunks are sent to a pool of
+# worker processes, each running the same backend as the parent. The
+# program's functions go to the workers once, when the pool starts; the pool
+# is kept until the functions change. The body of a parallel for and the
+# variables it reads from the enclosing scope travel with each chunk.
+#
+# Results are gathered in order, and so is printed output: workers capture
+# what they print and the parent writes it out chunk by chunk. With one
+# worker, or a single item, everything runs in the parent instead. So does a
+# limited evaluator (see Limits.py), as limits are only counted in-process.
+#
+# Iterations of a parallel for cannot see each other: the loop header alone,
+# run in the parent, decides the iterations, and whatever the body assigns is
+# private to its iteration and dropped at its end. A `return` in the body is
+# an error.
+
+CHUNKS_PER_WORKER = 4
+
+# the evaluator of a worker process and the functions it was started with
+WORKER = None
+WORKER_FUNCTIONS = {}
+
+
+def start_worker(backend, functions):
+    global WORKER, WORKER_FUNCTIONS
+    WORKER = backend()
+    WORKER.parallel.workers = 1
+    WORKER_FUNCTIONS = {func.name: func for func in functions}
+    WORKER.global_symbol_table.update(WORKER_FUNCTIONS)
+
+@contextlib.contextmanager
+def captured_output():
+    captured = io.StringIO()
+    output = WORKER.output
+    WORKER.output = Output.BufferedOutput(captured)
+    try:
+        yield captured
+    finally:
+        WORKER.output.flush()
+        WORKER.output = output
+
+def map_chunk(name, values):
+    func = WORKER_FUNCTIONS[name]
+    with captured_output() as captured:
+        results = [WORKER.call_function(func, [value]) for value in values]
+    return results, captured.getvalue()
+
+def run_chunk(body, shared, iterations):
+    symbols = WORKER.global_symbol_table
+    with captured_output() as captured:
+        for variables in iterations:
+            symbols.clear()
+            symbols.update(WORKER_FUNCTIONS)
+            symbols.update(shared)
+            symbols.update(variables)
+            WORKER.execute(body)
+    return captured.getvalue()
+
+
+def loop_variables(node):
+    """Names the header of a for loop assigns."""
+    names = []
+    for statement in (node.init, node.update):
+        if isinstance(statement, PTypes.VariableDeclaration):
+            names.append(statement.name)
+        elif isinstance(statement, (PTypes.Assignment, PTypes.AugmentedAssignment)):
+            names.append(statement.variable)
+    return names
+
+def read_names(statements):
+    return {node.name for statement in statements for node in PTypes.walk(statement)
+            if isinstance(node, PTypes.Variable)}
+
+
+class ParallelRunner:
+    """The process pool of one evaluator.
+
+    workers defaults to the number of CPUs; chunk_size None picks one from
+    the number of items."""
+
+    def __init__(self, evaluator, workers=None, chunk_size=None):
+        self.evaluator = evaluator
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.pool = None
+        self.functions = None
+
+    def declared_functions(self):
+        return [value for value in self.evaluator.global_symbol_table.values()
+                if isinstance(value, PTypes.FunctionDeclaration)]
+
+    def get_pool(self):
+        functions = self.declared_functions()
+        if self.pool is None or functions != self.functions:
+            self.close()
+            # forked workers must not inherit output waiting to be written
+            self.evaluator.output.flush()
+            sys.stdout.flush()
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                self.workers, initializer=start_worker, initargs=(type(self.evaluator), functions))
+            self.functions = functions
+        return self.pool
+
+    def chunks(self, items):
+        size = self.chunk_size or max(1, math.ceil(len(items) / (self.workers * CHUNKS_PER_WORKER)))
+        return [items[start:start + size] for start in range(0, len(items), size)]
+
+    def in_parent(self, items):
+        return self.workers <= 1 or len(items) < 2 or self.evaluator.limits is not None
+
+    def map(self, function, values):
+        func = function
+        if isinstance(function, str):
+            func = self.evaluator.global_symbol_table.get(function)
+            if not isinstance(func, PTypes.FunctionDeclaration):
+                raise Exception(f"Function '{function}' not defined")
+        elif not isinstance(func, PTypes.FunctionDeclaration):
+            raise Exception(f"pmap() needs a function or a function name, got {function!r}")
+        if len(func.parameters) != 1:
+            raise Exception(f"pmap() needs a function of one parameter, '{func.name}' takes {len(func.parameters)}")
+        values = values.tolist() if Arrays.is_array(values) else list(values)
+        if self.in_parent(values):
+            return [self.evaluator.call_function(func, [value]) for value in values]
+        pool = self.get_pool()
+        results = []
+        for chunk_results, output in pool.map(map_chunk, itertools.repeat(func.name), self.chunks(values)):
+            results.extend(chunk_results)
+            self.evaluator.output.write(output)
+        return results
+
+    def run_for(self, node, scope):
+        if any(isinstance(child, PTypes.ReturnStatement)
+               for statement in node.body for child in PTypes.walk(statement)):
+            raise Exception("A parallel for loop cannot return")
+        evaluator = self.evaluator
+        names = loop_variables(node)
+        iterations = []
+        evaluator.evaluate(node.init, scope)
+        while evaluator.evaluate(node.condition, scope):
+            if evaluator.limits is not None:
+                evaluator.limits.tick()
+            iterations.append({name: scope[name] for name in names if name in scope})
+            evaluator.evaluate(node.update, scope)
+        shared = {name: scope[name] for name in read_names(node.body)
+                  if name in scope and name not in names
+                  and not isinstance(scope[name], PTypes.FunctionDeclaration)}
+        if self.in_parent(iterations):
+            for variables in iterations:
+                evaluator.execute_block(node.body, dict(shared, **variables))
+            return
+        pool = self.get_pool()
+        chunks = self.chunks(iterations)
+        for output in pool.map(run_chunk, itertools.repeat(node.body), itertools.repeat(shared), chunks):
+            evaluator.output.write(output)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self.functions = None
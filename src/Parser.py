@@ -1,9 +1,20 @@
 import Tokens as Token
 from Parser_types import *
 class Parser:
-    def __init__(self, tokens=None):
+    def __init__(self, tokens=None, lazy=False):
         self.tokens = tokens
         self.pos = 0
+        self.literals = {}
+        self.lazy = lazy # leave function bodies unparsed, see Lazy.py
+
+    def literal(self, node_type, *values):
+        # literal nodes are never annotated or mutated, so equal literals
+        # share one node instead of allocating a copy per occurrence
+        key = (node_type, values)
+        node = self.literals.get(key)
+        if node is None:
+            node = self.literals[key] = node_type(*values)
+        return node
 
     def error(self, message="Invalid syntax"):
         raise Exception(message)
@@ -28,6 +39,25 @@ class Parser:
         
         elif self.current_token().type == Token.TOKENTYPE.FUNCTION_DECLARATION:
             return self.parse_function_declaration()
+        elif self.current_token().type == Token.TOKENTYPE.MEMO:
+            self.eat(Token.TOKENTYPE.MEMO)
+            func = self.parse_function_declaration()
+            func.memo = True
+            return func
+        elif self.current_token().type == Token.TOKENTYPE.ASYNC:
+            self.eat(Token.TOKENTYPE.ASYNC)
+            func = self.parse_function_declaration()
+            func.is_async = True
+            return func
+        elif self.current_token().type == Token.TOKENTYPE.AWAIT:
+            return self.parse_expression()
+        elif self.current_token().type == Token.TOKENTYPE.PARALLEL:
+            self.eat(Token.TOKENTYPE.PARALLEL)
+            if self.current_token().type != Token.TOKENTYPE.FOR:
+                self.error(f"Expected token: {Token.TOKENTYPE.FOR}, found: {self.current_token()}")
+            loop = self.parse_for_loop()
+            loop.parallel = True
+            return loop
         elif self.current_token().type == Token.TOKENTYPE.VAR:
             return self.parse_variable_declaration()
         elif self.current_token().type in Token.AUGMENTED_ASSIGNMENT_OPERATORS:
@@ -51,7 +81,11 @@ class Parser:
     def parse(self):
         statements = []
         while self.current_token() is not None and self.current_token().type != Token.TOKENTYPE.EOF:
-            statements.append(self.get_statement())
+            start = self.current_token()
+            statement = self.get_statement()
+            if statement is not None:
+                statement.pos = start.pos
+            statements.append(statement)
         return statements
 
     def parse_for_loop(self):
@@ -97,10 +131,36 @@ class Parser:
         parameters = self.parse_parameters()
         self.eat(Token.TOKENTYPE.RPAREN)
         self.eat(Token.TOKENTYPE.LBRACE)
+        if self.lazy:
+            return FunctionDeclaration(func_name, parameters, None, lazy_body=LazyBody(self.skip_block()))
         body = self.parse_block()
         self.eat(Token.TOKENTYPE.RBRACE)
         return FunctionDeclaration(func_name, parameters, body)
 
+    def skip_block(self):
+        # the tokens up to the `}` matching an `{` just eaten, found by
+        # counting braces alone; the closing `}` is eaten and kept
+        start = self.pos
+        depth = 1
+        while depth:
+            token = self.current_token()
+            if token is None or token.type == Token.TOKENTYPE.EOF:
+                self.error(f"Expected token: {Token.TOKENTYPE.RBRACE}, found: {token}")
+            if token.type == Token.TOKENTYPE.LBRACE:
+                depth += 1
+            elif token.type == Token.TOKENTYPE.RBRACE:
+                depth -= 1
+            self.pos += 1
+        return self.tokens[start:self.pos]
+
+    def parse_body(self):
+        # a block skipped by skip_block, from its own tokens
+        body = self.parse_block()
+        self.eat(Token.TOKENTYPE.RBRACE)
+        if self.current_token() is not None:
+            self.error(f"Unexpected token after function body: {self.current_token()}")
+        return body
+
     def parse_function_call(self):
         func_name = self.current_token().value
         self.eat(Token.TOKENTYPE.NAME)
@@ -135,17 +195,22 @@ class Parser:
     def parse_block(self):
         statements = []
         while self.current_token().type != Token.TOKENTYPE.RBRACE:
+            start = self.current_token()
+            count = len(statements)
             if self.current_token().type == Token.TOKENTYPE.COMMENT:
                 self.eat(Token.TOKENTYPE.COMMENT)
             elif self.current_token().type == Token.TOKENTYPE.WHILE:
                 statements.append(self.parse_while_statement())
             elif self.current_token().type == Token.TOKENTYPE.IF:
                 statements.append(self.parse_if_statement())
-            
+            elif self.current_token().type == Token.TOKENTYPE.FOR:
+                statements.append(self.parse_for_loop())
             elif self.current_token().type == Token.TOKENTYPE.RETURN:
                 statements.append(self.parse_return_statement())
             elif self.current_token().type == Token.TOKENTYPE.VAR:
                 statements.append(self.parse_variable_declaration())
+            elif self.current_token().type == Token.TOKENTYPE.AWAIT:
+                statements.append(self.parse_expression())
             elif self.current_token().type == Token.TOKENTYPE.NAME:
                 lookahead_token = self.tokens[self.pos + 1] if self.pos + 1 < len(self.tokens) else None
                 if lookahead_token and lookahead_token.type == Token.TOKENTYPE.LPAREN:
@@ -156,6 +221,8 @@ class Parser:
                     statements.append(self.parse_assignment())
             else:
                 self.error("Unexpected token in block " + self.current_token().type)
+            if len(statements) > count:
+                statements[-1].pos = start.pos
         return statements
     def parse_return_statement(self):
         self.eat(Token.TOKENTYPE.RETURN)
@@ -177,7 +244,6 @@ class Parser:
         operator = self.current_token().type
         self.eat(operator)
         expr = self.parse_expression()
-        print(var_name,operator,expr)
         return AugmentedAssignment(var_name, operator, expr)
     def parse_assignment(self):
         var_name = self.current_token().value
@@ -246,22 +312,24 @@ class Parser:
             operand = self.parse_atom()
             #print(UnaryOperation(operand, Token.TOKENTYPE.MINUS))
             return UnaryOperation(Token.TOKENTYPE.MINUS, operand)
+        elif token.type == Token.TOKENTYPE.AWAIT:
+            self.eat(Token.TOKENTYPE.AWAIT)
+            return Await(self.parse_atom())
         elif token.type == Token.TOKENTYPE.INTEGER:
             self.eat(Token.TOKENTYPE.INTEGER)
-            return NumberLiteral("int", token.value)
+            return self.literal(NumberLiteral, "int", token.value)
         elif token.type == Token.TOKENTYPE.STRING:
             self.eat(Token.TOKENTYPE.STRING)
-            token.value = token.value[1:-1]
-            return StringLiteral(token.value)
+            return self.literal(StringLiteral, token.value[1:-1])
         elif token.type == Token.TOKENTYPE.FLOAT:
             self.eat(Token.TOKENTYPE.FLOAT)
-            return NumberLiteral("float", token.value)
+            return self.literal(NumberLiteral, "float", token.value)
         elif token.type == Token.TOKENTYPE.TRUE:
             self.eat(Token.TOKENTYPE.TRUE)
-            return BooleanLiteral("true")
+            return self.literal(BooleanLiteral, "true")
         elif token.type == Token.TOKENTYPE.FALSE:
             self.eat(Token.TOKENTYPE.FALSE)
-            return BooleanLiteral("false")
+            return self.literal(BooleanLiteral, "false")
         elif token.type == Token.TOKENTYPE.LBRACK:
             return self.parse_array_literal()
         elif token.type == Token.TOKENTYPE.NAME:
@@ -309,9 +377,466 @@ class Parser:
         self.eat(Token.TOKENTYPE.RBRACE)
         return WhileStatement(condition, body)
 
-def parse_program(tokens):
-    parser = Parser(tokens)
-    return parser.parse()
+# Pratt parser, the one parse_program uses.
+#
+# Statements are dispatched on their first token through STATEMENTS, one
+# table for the top level and blocks alike; expressions go through PREFIX
+# (what a token means at the start of an operand) and INFIX (the binding
+# power of each operator). The powers reproduce Parser's precedence, so both
+# produce the same AST: comparisons bind loosest, then + - % ^ (one level,
+# as in parse_term), then * and /, and a prefix operator takes one operand.
+# Every level is left-associative.
+#
+# A syntax error does not end the parse. It is recorded, the parser skips to
+# the start of the next statement (a statement keyword, or a name followed by
+# `(`, `=`, `.` or an augmented assignment, outside any brackets the skipped
+# tokens open) or to the `}` closing the current block, and goes on; at the
+# end every error is raised together as one SyntaxErrors. A broken statement
+# that has a block (if, while, for, mkfunc, ...) is skipped up to the `}`
+# matching its `{`, else-blocks included, so that one mistake is one error.
+#
+# Parser stays as the reference implementation, see compare_parsers.
+
+COMPARISON_POWER = 10
+TERM_POWER = 20
+FACTOR_POWER = 30
+PREFIX_POWER = 40
+
+INFIX = {}
+INFIX.update((op, (COMPARISON_POWER, ComparisonOperation)) for op in Token.COMPARISON_OPERATORS)
+INFIX.update((op, (TERM_POWER, BinaryOperation)) for op in (
+    Token.TOKENTYPE.PLUS, Token.TOKENTYPE.MINUS, Token.TOKENTYPE.MODULO, Token.TOKENTYPE.CARAT))
+INFIX.update((op, (FACTOR_POWER, BinaryOperation)) for op in (Token.TOKENTYPE.MUL, Token.TOKENTYPE.DIV))
+
+# token type -> PrattParser method
+PREFIX = {
+    Token.TOKENTYPE.INTEGER: "integer",
+    Token.TOKENTYPE.FLOAT: "float",
+    Token.TOKENTYPE.STRING: "string",
+    Token.TOKENTYPE.TRUE: "boolean",
+    Token.TOKENTYPE.FALSE: "boolean",
+    Token.TOKENTYPE.NAME: "name",
+    Token.TOKENTYPE.LPAREN: "group",
+    Token.TOKENTYPE.LBRACK: "array_literal",
+    Token.TOKENTYPE.MINUS: "unary",
+    Token.TOKENTYPE.BANG: "unary",
+    Token.TOKENTYPE.AWAIT: "await_expression",
+}
+STATEMENTS = {
+    Token.TOKENTYPE.VAR: "variable_declaration",
+    Token.TOKENTYPE.NAME: "name_statement",
+    Token.TOKENTYPE.IF: "if_statement",
+    Token.TOKENTYPE.WHILE: "while_statement",
+    Token.TOKENTYPE.FOR: "for_statement",
+    Token.TOKENTYPE.RETURN: "return_statement",
+    Token.TOKENTYPE.AWAIT: "expression",
+    Token.TOKENTYPE.FUNCTION_DECLARATION: "function_declaration",
+    Token.TOKENTYPE.MEMO: "memo_function",
+    Token.TOKENTYPE.ASYNC: "async_function",
+    Token.TOKENTYPE.PARALLEL: "parallel_for",
+}
+TOP_LEVEL_ONLY = {Token.TOKENTYPE.FUNCTION_DECLARATION, Token.TOKENTYPE.MEMO, Token.TOKENTYPE.ASYNC,
+                  Token.TOKENTYPE.PARALLEL}
+BLOCK_ONLY = {Token.TOKENTYPE.RETURN}
+
+# where error recovery resumes
+STATEMENT_KEYWORDS = {Token.TOKENTYPE.VAR, Token.TOKENTYPE.IF, Token.TOKENTYPE.WHILE, Token.TOKENTYPE.FOR,
+                      Token.TOKENTYPE.RETURN, Token.TOKENTYPE.FUNCTION_DECLARATION, Token.TOKENTYPE.MEMO,
+                      Token.TOKENTYPE.ASYNC, Token.TOKENTYPE.PARALLEL}
+STATEMENT_FOLLOWERS = {Token.TOKENTYPE.LPAREN, Token.TOKENTYPE.EQUALS, Token.TOKENTYPE.DOT,
+                       *Token.AUGMENTED_ASSIGNMENT_OPERATORS}
+BLOCK_KEYWORDS = {Token.TOKENTYPE.IF, Token.TOKENTYPE.ELSE, Token.TOKENTYPE.WHILE, Token.TOKENTYPE.FOR,
+                  Token.TOKENTYPE.FUNCTION_DECLARATION}
+PREFIXES = {Token.TOKENTYPE.MEMO, Token.TOKENTYPE.ASYNC, Token.TOKENTYPE.PARALLEL}
+OPENING = {Token.TOKENTYPE.LPAREN, Token.TOKENTYPE.LBRACK}
+CLOSING = {Token.TOKENTYPE.RPAREN, Token.TOKENTYPE.RBRACK}
+
+
+class ParseError(Exception):
+    """One syntax error, at the source offset pos."""
+    def __init__(self, message, pos):
+        super().__init__(message)
+        self.pos = pos
+
+
+class SyntaxErrors(Exception):
+    """Every syntax error found in one parse, as (source offset, message) pairs.
+
+    Given the source, the message puts the line and column before each error."""
+    def __init__(self, errors, source=None, file_name=None):
+        if source is None:
+            lines = [message for pos, message in errors]
+        else:
+            lines = [f"{file_name or '<source>'}:{line}:{column}: {message}"
+                     for (line, column), (pos, message) in zip(locations(source, errors), errors)]
+        super().__init__("\n".join(lines))
+        self.errors = errors
+        self.statements = None # what PrattParser.parse made of the rest of the program
+
+def locations(source, errors):
+    """(line, column) of each error in source, both from 1."""
+    for pos, message in errors:
+        yield source.count("\n", 0, pos) + 1, pos - source.rfind("\n", 0, pos)
+
+
+class PrattParser:
+    def __init__(self, tokens, lazy=False):
+        # a trailing EOF lets every lookahead index the list unchecked
+        end = tokens[-1].pos + len(tokens[-1].value) if tokens else 0
+        self.tokens = tokens + [Token.Token(Token.TOKENTYPE.EOF, "", end)]
+        self.end = len(tokens)
+        self.pos = 0
+        self.literals = {}
+        self.lazy = lazy # leave function bodies unparsed, see Lazy.py
+        self.errors = []
+        self.prefix = {token_type: getattr(self, name) for token_type, name in PREFIX.items()}
+        self.statements = {token_type: getattr(self, name) for token_type, name in STATEMENTS.items()}
+
+    literal = Parser.literal
+
+    def error(self, message):
+        raise ParseError(message, self.tokens[self.pos].pos)
+
+    def expect(self, token_type):
+        token = self.tokens[self.pos]
+        if token.type != token_type:
+            self.error(f"Expected token: {token_type}, found: {token}")
+        self.pos += 1
+        return token
+
+    def recover(self, error, start, in_block):
+        self.errors.append((error.pos, str(error)))
+        tokens = self.tokens
+        if self.pos == start:
+            self.pos += 1
+            if tokens[start].type in PREFIXES and tokens[self.pos].type in BLOCK_KEYWORDS:
+                self.pos += 1
+        # until its block opens, a block statement's header (mkfunc f(x), for
+        # (...)) is not mistaken for the next statement
+        in_header = tokens[start].type in BLOCK_KEYWORDS or tokens[start].type in PREFIXES
+        depth = nesting = 0
+        while True:
+            token_type = tokens[self.pos].type
+            if token_type == Token.TOKENTYPE.EOF:
+                return
+            if depth == 0 and nesting == 0:
+                if token_type in STATEMENT_KEYWORDS:
+                    return
+                if token_type == Token.TOKENTYPE.NAME and not in_header \
+                        and tokens[self.pos + 1].type in STATEMENT_FOLLOWERS:
+                    return
+                if token_type == Token.TOKENTYPE.RBRACE and in_block:
+                    return
+            if token_type == Token.TOKENTYPE.LBRACE:
+                depth += 1
+                in_header = False
+            elif token_type == Token.TOKENTYPE.RBRACE and depth:
+                depth -= 1
+                if depth == 0 and tokens[self.pos + 1].type != Token.TOKENTYPE.ELSE:
+                    # the end of the broken statement's block
+                    self.pos += 1
+                    return
+            elif token_type in OPENING:
+                nesting += 1
+            elif token_type in CLOSING and nesting:
+                nesting -= 1
+            self.pos += 1
+
+    def parse(self):
+        statements = []
+        tokens = self.tokens
+        while True:
+            token = tokens[self.pos]
+            token_type = token.type
+            if token_type == Token.TOKENTYPE.EOF:
+                break
+            if token_type == Token.TOKENTYPE.COMMENT:
+                # Parser leaves a None in the program for a top-level comment
+                self.pos += 1
+                statements.append(None)
+                continue
+            start = self.pos
+            try:
+                handler = self.statements.get(token_type)
+                if handler is None or token_type in BLOCK_ONLY:
+                    self.error("Unexpected token " + token_type)
+                statement = handler()
+            except ParseError as error:
+                self.recover(error, start, False)
+                continue
+            statement.pos = token.pos
+            statements.append(statement)
+        if self.errors:
+            errors = SyntaxErrors(self.errors)
+            errors.statements = statements
+            raise errors
+        return statements
+
+    def parse_body(self):
+        # a block skipped by skip_block, from its own tokens
+        body = None
+        try:
+            body = self.block()
+            self.expect(Token.TOKENTYPE.RBRACE)
+            if self.pos < self.end:
+                self.error(f"Unexpected token after function body: {self.tokens[self.pos]}")
+        except ParseError as error:
+            self.errors.append((error.pos, str(error)))
+        if self.errors:
+            raise SyntaxErrors(self.errors)
+        return body
+
+    def block(self):
+        statements = []
+        tokens = self.tokens
+        while True:
+            token = tokens[self.pos]
+            token_type = token.type
+            if token_type == Token.TOKENTYPE.RBRACE or token_type == Token.TOKENTYPE.EOF:
+                # the caller expects the `}`, and reports it missing
+                return statements
+            if token_type == Token.TOKENTYPE.COMMENT:
+                self.pos += 1
+                continue
+            start = self.pos
+            try:
+                handler = self.statements.get(token_type)
+                if handler is None or token_type in TOP_LEVEL_ONLY:
+                    self.error("Unexpected token in block " + token_type)
+                statement = handler()
+            except ParseError as error:
+                self.recover(error, start, True)
+                continue
+            statement.pos = token.pos
+            statements.append(statement)
+
+    def braced_block(self):
+        self.expect(Token.TOKENTYPE.LBRACE)
+        body = self.block()
+        self.expect(Token.TOKENTYPE.RBRACE)
+        return body
+
+    def condition(self):
+        self.expect(Token.TOKENTYPE.LPAREN)
+        condition = self.expression()
+        self.expect(Token.TOKENTYPE.RPAREN)
+        return condition
+
+    # statements
+
+    def variable_declaration(self):
+        self.pos += 1
+        name = self.expect(Token.TOKENTYPE.NAME).value
+        self.expect(Token.TOKENTYPE.EQUALS)
+        return VariableDeclaration(name, self.expression())
+
+    def name_statement(self):
+        following = self.tokens[self.pos + 1].type
+        if following == Token.TOKENTYPE.LPAREN:
+            return self.function_call(self.tokens[self.pos])
+        elif following in Token.AUGMENTED_ASSIGNMENT_OPERATORS:
+            return self.augmented_assignment()
+        elif following == Token.TOKENTYPE.DOT:
+            return self.method_call(self.tokens[self.pos])
+        return self.assignment()
+
+    def assignment(self):
+        name = self.expect(Token.TOKENTYPE.NAME).value
+        self.expect(Token.TOKENTYPE.EQUALS)
+        return Assignment(name, self.expression())
+
+    def augmented_assignment(self):
+        name = self.tokens[self.pos].value
+        operator = self.tokens[self.pos + 1].type
+        self.pos += 2
+        return AugmentedAssignment(name, operator, self.expression())
+
+    def if_statement(self):
+        self.pos += 1
+        condition = self.condition()
+        if_body = self.braced_block()
+        else_body = None
+        if self.tokens[self.pos].type == Token.TOKENTYPE.ELSE:
+            self.pos += 1
+            else_body = self.braced_block()
+        return IfStatement(condition, if_body, else_body)
+
+    def while_statement(self):
+        self.pos += 1
+        condition = self.condition()
+        return WhileStatement(condition, self.braced_block())
+
+    def for_statement(self):
+        self.pos += 1
+        self.expect(Token.TOKENTYPE.LPAREN)
+        tokens = self.tokens
+        if tokens[self.pos].type == Token.TOKENTYPE.VAR:
+            init = self.variable_declaration()
+        elif tokens[self.pos].type == Token.TOKENTYPE.NAME and tokens[self.pos + 1].type == Token.TOKENTYPE.EQUALS:
+            # Parser fails on this; `i = 0` is what it was meant to accept
+            init = self.assignment()
+        else:
+            init = self.expression()
+        self.expect(Token.TOKENTYPE.SEMICOLON)
+        condition = self.expression()
+        self.expect(Token.TOKENTYPE.SEMICOLON)
+        if tokens[self.pos].type == Token.TOKENTYPE.NAME:
+            if tokens[self.pos + 1].type in Token.AUGMENTED_ASSIGNMENT_OPERATORS:
+                update = self.augmented_assignment()
+            else:
+                update = self.assignment()
+        else:
+            update = self.expression()
+        self.expect(Token.TOKENTYPE.RPAREN)
+        return ForStatement(init, condition, update, self.braced_block())
+
+    def parallel_for(self):
+        self.pos += 1
+        if self.tokens[self.pos].type != Token.TOKENTYPE.FOR:
+            self.error(f"Expected token: {Token.TOKENTYPE.FOR}, found: {self.tokens[self.pos]}")
+        loop = self.for_statement()
+        loop.parallel = True
+        return loop
+
+    def return_statement(self):
+        self.pos += 1
+        return ReturnStatement(self.expression())
+
+    def function_declaration(self):
+        self.expect(Token.TOKENTYPE.FUNCTION_DECLARATION)
+        name = self.expect(Token.TOKENTYPE.NAME).value
+        self.expect(Token.TOKENTYPE.LPAREN)
+        parameters = []
+        while self.tokens[self.pos].type != Token.TOKENTYPE.RPAREN:
+            # commas between parameters are optional, as in Parser
+            parameters.append(self.expect(Token.TOKENTYPE.NAME).value)
+            if self.tokens[self.pos].type == Token.TOKENTYPE.COMMA:
+                self.pos += 1
+        self.pos += 1
+        self.expect(Token.TOKENTYPE.LBRACE)
+        if self.lazy:
+            return FunctionDeclaration(name, parameters, None, lazy_body=LazyBody(self.skip_block()))
+        body = self.block()
+        self.expect(Token.TOKENTYPE.RBRACE)
+        return FunctionDeclaration(name, parameters, body)
+
+    def memo_function(self):
+        self.pos += 1
+        func = self.function_declaration()
+        func.memo = True
+        return func
+
+    def async_function(self):
+        self.pos += 1
+        func = self.function_declaration()
+        func.is_async = True
+        return func
+
+    def skip_block(self):
+        # the tokens up to the `}` matching an `{` just eaten, found by
+        # counting braces alone; the closing `}` is eaten and kept
+        tokens = self.tokens
+        start = self.pos
+        depth = 1
+        while depth:
+            token_type = tokens[self.pos].type
+            if token_type == Token.TOKENTYPE.EOF:
+                self.error(f"Expected token: {Token.TOKENTYPE.RBRACE}, found: {tokens[self.pos]}")
+            if token_type == Token.TOKENTYPE.LBRACE:
+                depth += 1
+            elif token_type == Token.TOKENTYPE.RBRACE:
+                depth -= 1
+            self.pos += 1
+        return tokens[start:self.pos]
+
+    # expressions
+
+    def expression(self, power=0):
+        tokens = self.tokens
+        token = tokens[self.pos]
+        prefix = self.prefix.get(token.type)
+        if prefix is None:
+            self.error(f"Unknown atom {token}")
+        node = prefix(token)
+        while True:
+            op = tokens[self.pos].type
+            infix = INFIX.get(op)
+            if infix is None or infix[0] <= power:
+                return node
+            self.pos += 1
+            node = infix[1](node, op, self.expression(infix[0]))
+
+    def arguments(self):
+        # the `(` is eaten; commas between arguments are optional, as in Parser
+        arguments = []
+        tokens = self.tokens
+        while tokens[self.pos].type != Token.TOKENTYPE.RPAREN:
+            arguments.append(self.expression())
+            if tokens[self.pos].type == Token.TOKENTYPE.COMMA:
+                self.pos += 1
+        self.pos += 1
+        return arguments
+
+    def integer(self, token):
+        self.pos += 1
+        return self.literal(NumberLiteral, "int", token.value)
+
+    def float(self, token):
+        self.pos += 1
+        return self.literal(NumberLiteral, "float", token.value)
+
+    def string(self, token):
+        self.pos += 1
+        return self.literal(StringLiteral, token.value[1:-1])
+
+    def boolean(self, token):
+        self.pos += 1
+        return self.literal(BooleanLiteral, token.value)
+
+    def name(self, token):
+        following = self.tokens[self.pos + 1].type
+        if following == Token.TOKENTYPE.LPAREN:
+            return self.function_call(token)
+        elif following == Token.TOKENTYPE.DOT:
+            return self.method_call(token)
+        self.pos += 1
+        return Variable(token.value)
+
+    def function_call(self, token):
+        self.pos += 2
+        return FunctionCall(token.value, self.arguments())
+
+    def method_call(self, token):
+        self.pos += 2
+        method = self.expect(Token.TOKENTYPE.NAME).value
+        self.expect(Token.TOKENTYPE.LPAREN)
+        return MethodCall(Variable(token.value), method, self.arguments())
+
+    def group(self, token):
+        self.pos += 1
+        node = self.expression()
+        self.expect(Token.TOKENTYPE.RPAREN)
+        return node
+
+    def array_literal(self, token):
+        self.pos += 1
+        elements = []
+        if self.tokens[self.pos].type != Token.TOKENTYPE.RBRACK:
+            elements.append(self.expression())
+            while self.tokens[self.pos].type == Token.TOKENTYPE.COMMA:
+                self.pos += 1
+                elements.append(self.expression())
+        self.expect(Token.TOKENTYPE.RBRACK)
+        return ArrayLiteral(elements)
+
+    def unary(self, token):
+        self.pos += 1
+        return UnaryOperation(token.type, self.expression(PREFIX_POWER))
+
+    def await_expression(self, token):
+        self.pos += 1
+        return Await(self.expression(PREFIX_POWER))
+
 
 def simple_ast_format(ast):
     # This function is used to format the AST for printing
@@ -330,18 +855,109 @@ def simple_ast_format(ast):
     return format_node(ast)
 
 
-def parse_program(tokens):
-    parser = Parser(tokens)
-    return parser.parse()
+def parse_program(tokens, lazy=False):
+    return PrattParser(tokens, lazy).parse()
+
+def reference_parse_program(tokens, lazy=False):
+    return Parser(tokens, lazy).parse()
+
+
+def ast_dump(node):
+    """Nested tuples of a node's syntactic fields and position, for comparing trees."""
+    if isinstance(node, list):
+        return [ast_dump(item) for item in node]
+    if isinstance(node, LazyBody):
+        return [(token.type, token.value, token.pos) for token in node.tokens]
+    if isinstance(node, (Statement, Expression)):
+        return (type(node).__name__, position(node)) + tuple(ast_dump(getattr(node, name)) for name in fields(node))
+    return node
+
+def compare_parsers(tokens, lazy=False):
+    """Differential check of PrattParser against Parser.
+
+    Returns None when both build the same AST (or both fail), otherwise a
+    message describing the first difference."""
+    def run(parse):
+        try:
+            return ast_dump(parse(tokens, lazy))
+        except Exception as ex:
+            return ex
+    expected = run(reference_parse_program)
+    actual = run(parse_program)
+    if isinstance(expected, Exception) and isinstance(actual, Exception):
+        return None
+    if isinstance(expected, Exception) or isinstance(actual, Exception):
+        return f"expected {expected!r}, got {actual!r}"
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        if want != got:
+            return f"statement {i}: expected {want}, got {got}"
+    if len(expected) != len(actual):
+        return f"expected {len(expected)} statements, got {len(actual)}"
+    return None
+
+def random_program(statements, seed=0):
+    # nested statements over every operator, literal and call form the
+    # grammar has, so precedence and associativity are exercised
+    import random
+    rng = random.Random(seed)
+    operators = ["+", "-", "*", "/", "%", "^", "<", "<=", ">", ">=", "=="]
+
+    def expression(depth):
+        choice = rng.randrange(9 if depth < 3 else 4)
+        if choice == 0:
+            return str(rng.randrange(100))
+        elif choice == 1:
+            return rng.choice(["1.5", "\"s\"", "true", "false"])
+        elif choice in (2, 3):
+            return rng.choice(["x", "y", "total"])
+        elif choice in (4, 5):
+            return f"{expression(depth + 1)} {rng.choice(operators)} {expression(depth + 1)}"
+        elif choice == 6:
+            return rng.choice(["-", "!", "await "]) + expression(depth + 1)
+        elif choice == 7:
+            return f"f({expression(depth + 1)}, {expression(depth + 1)})"
+        return f"[{expression(depth + 1)}, {expression(depth + 1)}]" if rng.randrange(2) \
+            else f"({expression(depth + 1)})"
+
+    def statement(depth, in_block):
+        choice = rng.randrange(8 if depth < 2 else 4)
+        if choice == 0:
+            return f"var {rng.choice(['x', 'y'])} = {expression(0)}"
+        elif choice == 1:
+            return f"total {rng.choice(['=', '+=', '*=', '-='])} {expression(0)}"
+        elif choice == 2:
+            return f"print({expression(0)})"
+        elif choice == 3:
+            return f"return {expression(0)}" if in_block else "// note"
+        body = " ".join(statement(depth + 1, True) for _ in range(rng.randrange(1, 4)))
+        if choice == 4:
+            return f"if ({expression(0)}) {{ {body} }}" + (f" else {{ {body} }}" if rng.randrange(2) else "")
+        elif choice == 5:
+            return f"while ({expression(0)}) {{ {body} }}"
+        elif choice == 6:
+            return f"for (var i = 0; i < {expression(0)}; i += 1) {{ {body} }}"
+        return f"{rng.choice(['mkfunc', 'memo mkfunc'])} g{depth}(a, b) {{ {body} }}" if depth == 0 \
+            else f"if (x) {{ {body} }}"
+
+    return "\n".join(statement(0, False) for _ in range(statements))
+
+def parse_throughput(tokens, parse=parse_program, repeat=3):
+    """Best-of-`repeat` parsing speed in tokens per second."""
+    import time
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(tokens)
+        best = min(best, time.perf_counter() - start)
+    return len(tokens) / best if best > 0 else float("inf")
 
 
 if __name__ == "__main__":
-    import Lexer, json
-    program =  """
-    var x = [1,2,3,4,5,6,7,8,9,10]
-    print(x.sort())
-
-    """
-    tokens = Lexer.tokenize(program)
-    print(tokens)
-    print(simple_ast_format(parse_program(tokens)))
+    # the differential check against Parser is in tests/test_parser.py
+    import os
+    import Lexer
+    examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+    with open(os.path.join(examples, "stdlib.hpl"), "r") as f:
+        tokens = Lexer.tokenize(f.read() * 200)
+    print(f"Parser:       {parse_throughput(tokens, reference_parse_program, 1):10.0f} tokens/s")
+    print(f"PrattParser:  {parse_throughput(tokens):10.0f} tokens/s")
@@ -1,12 +1,61 @@
+# Nodes are slotted: no per-instance __dict__, and every field is listed in
+# __slots__ in source order so passes can walk the tree generically.
+
 class Statement:
+    # pos: source offset of the first token, set by the parser; awaits and
+    # event_loop: set by Async.py
+    __slots__ = ("pos", "awaits", "event_loop")
     def __repr__(self):
         return "Statement()"
 
 class Expression:
+    __slots__ = ("pos", "awaits", "event_loop")
     def __repr__(self):
         return "Expression()"
 
+_FIELDS = {}
+
+# slots filled in by later passes rather than the parser; they can point
+# back into the tree (FunctionCall.callee), so they are never walked
+ANNOTATIONS = {"pos", "slot", "resolved", "local_names", "callee", "pure", "site", "counted", "awaits",
+               "event_loop"}
+
+def fields(node):
+    """Names of the syntactic fields of a node, base class fields first."""
+    cls = type(node)
+    names = _FIELDS.get(cls)
+    if names is None:
+        names = _FIELDS[cls] = tuple(
+            name for klass in reversed(cls.__mro__) for name in getattr(klass, "__slots__", ())
+            if name not in ANNOTATIONS
+        )
+    return names
+
+def position(node):
+    """Source offset of a statement, None for nodes the parser left unplaced."""
+    return getattr(node, "pos", None)
+
+def child_nodes(node):
+    """Direct sub-nodes of an AST node (statement lists flattened), in source order."""
+    children = []
+    for name in fields(node):
+        value = getattr(node, name)
+        if isinstance(value, list):
+            children.extend(item for item in value if isinstance(item, (Statement, Expression)))
+        elif isinstance(value, (Statement, Expression)):
+            children.append(value)
+    return children
+
+def walk(node):
+    """Every node in the tree rooted at `node`, parents before children."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(child_nodes(node)))
+
 class Block(Statement):
+    __slots__ = ("statements",)
     def __init__(self, statements):
         self.statements = statements
 
@@ -14,6 +63,7 @@ class Block(Statement):
         return f"Block({self.statements})"
 
 class ReturnStatement(Statement):
+    __slots__ = ("value",)
     def __init__(self, value):
         self.value = value
 
@@ -22,6 +72,7 @@ class ReturnStatement(Statement):
     
 
 class NumberLiteral(Expression):
+    __slots__ = ("type", "value")
     def __init__(self, type, value):
         self.type = type
         self.value = value
@@ -30,6 +81,7 @@ class NumberLiteral(Expression):
         return f"NumberLiteral({self.type}, {self.value})"
 
 class MethodCall(Expression):
+    __slots__ = ("variable", "method", "arguments")
     def __init__(self, variable, method_name, arguments):
         self.variable = variable
         self.method = method_name
@@ -40,6 +92,7 @@ class MethodCall(Expression):
         return f"MethodCall({self.variable}, {self.method}, [{arguments_str}])"
 
 class StringLiteral(Expression):
+    __slots__ = ("value",)
     def __init__(self, value):
         self.value = value
 
@@ -47,19 +100,15 @@ class StringLiteral(Expression):
         return f"StringLiteral({self.value})"
 
 class ArrayLiteral(Expression):
+    __slots__ = ("elements",)
     def __init__(self, elements):
         self.elements = elements
-        self.methods = {
-            "append": lambda item: self.elements.append(item),
-            "pop": lambda: self.elements.pop(),
-            "at": lambda index: self.elements[index],
-        }
-        
 
     def __repr__(self):
         return f"ArrayLiteral({self.elements})"
 
 class BooleanLiteral(Expression):
+    __slots__ = ("value",)
     def __init__(self, value):
         self.value = value
 
@@ -67,67 +116,105 @@ class BooleanLiteral(Expression):
         return f"BooleanLiteral({self.value})"
 
 class Variable(Expression):
+    __slots__ = ("name", "slot")
     def __init__(self, name):
         self.name = name
+        self.slot = None # frame slot inside a function, set by Resolver
 
     def __repr__(self):
         return f"Variable({self.name})"
     
 
+class LazyBody:
+    """The tokens of a function body not parsed yet, see Lazy.py."""
+    __slots__ = ("tokens", "level", "source", "file_name")
+    def __init__(self, tokens):
+        self.tokens = tokens # from after the `{` to the closing `}`
+        self.level = None # optimization level, set by the optimizer
+        self.source = None # where the tokens came from, set by Lazy.locate
+        self.file_name = None
+
 class FunctionDeclaration(Statement):
-    def __init__(self, name, parameters, body):
+    __slots__ = ("name", "parameters", "body", "lazy_body", "memo", "is_async", "resolved", "local_names", "pure")
+    def __init__(self, name, parameters, body, memo=False, is_async=False, lazy_body=None):
         self.name = name
         self.parameters = parameters
-        self.body = body
+        self.body = body # None until a lazy_body is parsed
+        self.lazy_body = lazy_body
+        self.memo = memo # declared with `memo mkfunc`
+        self.is_async = is_async # declared with `async mkfunc`, see Async.py
+        self.resolved = False
+        self.local_names = None # names by frame slot, set by Resolver
+        self.pure = False # set by Memo's purity analysis
 
     def __repr__(self):
         return f"FunctionDeclaration({self.name}, {self.parameters}, {self.body})"
 
 class FunctionCall(Expression):
+    __slots__ = ("name", "arguments", "callee")
     def __init__(self, name, arguments):
         self.name = name
         self.arguments = arguments
+        self.callee = None # last function bound to this call site, set by Eval
 
     def __repr__(self):
         return f"FunctionCall({self.name}, {self.arguments})"
 
+class Await(Expression):
+    __slots__ = ("value",)
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return f"Await({self.value})"
+
 class Assignment(Statement):
+    __slots__ = ("variable", "value", "slot")
     def __init__(self, variable, value):
         self.variable = variable
         self.value = value
+        self.slot = None
 
     def __repr__(self):
         return f"Assignment({self.variable}, {self.value})"
 
 class AugmentedAssignment(Statement):
     """Examples: x += 2, x -= 2, x *= 2 , x /= 2, x ^= 2, etc"""
+    __slots__ = ("variable", "op", "value", "slot", "site")
     def __init__(self, variable, op, value):
         self.variable = variable # E.g: x
         self.op = op # E.g: +=, -=, *=, /=, ^=, etc
         self.value = value # E.g: 5
+        self.slot = None
+        self.site = None # operand types seen, see Quicken.py
 
     def __repr__(self):
         return f"AugmentedAssignment({self.variable} {self.op}  {self.value})"
 
 class BinaryOperation(Expression):
+    __slots__ = ("left", "op", "right", "site")
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
+        self.site = None # operand types seen, see Quicken.py
 
     def __repr__(self):
         return f"BinaryOperation({self.left}, {self.op}, {self.right})"
 
 class ComparisonOperation(Expression):
+    __slots__ = ("left", "op", "right", "site")
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
+        self.site = None # operand types seen, see Quicken.py
 
     def __repr__(self):
         return f"ComparisonOperation({self.left}, {self.op}, {self.right})"
 
 class Literal(Expression):
+    __slots__ = ("value",)
     def __init__(self, value):
         self.value = value
 
@@ -135,6 +222,7 @@ class Literal(Expression):
         return f"Literal({self.value})"
 
 class UnaryOperation(Expression):
+    __slots__ = ("op", "operand")
     def __init__(self, op, operand):
         self.op = op
         self.operand = operand
@@ -143,14 +231,17 @@ class UnaryOperation(Expression):
         return f"UnaryOperation({self.op}, {self.operand})"
 
 class VariableDeclaration(Statement):
+    __slots__ = ("name", "value", "slot")
     def __init__(self, name, value):
         self.name = name
         self.value = value
+        self.slot = None
 
     def __repr__(self):
         return f"VariableDeclaration({self.name}, {self.value})"
 
 class IfStatement(Statement):
+    __slots__ = ("condition", "if_body", "else_body")
     def __init__(self, condition, if_body, else_body=None):
         self.condition = condition
         self.if_body = if_body
@@ -160,6 +251,7 @@ class IfStatement(Statement):
         return f"IfStatement({self.condition}, {self.if_body}, {self.else_body})"
 
 class WhileStatement(Statement):
+    __slots__ = ("condition", "body")
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
@@ -168,11 +260,14 @@ class WhileStatement(Statement):
         return f"WhileStatement({self.condition}, {self.body})"
 
 class ForStatement(Statement):
-    def __init__(self, init, condition, update, body):
+    __slots__ = ("init", "condition", "update", "body", "parallel", "counted")
+    def __init__(self, init, condition, update, body, parallel=False):
         self.init = init
         self.condition = condition
         self.update = update
         self.body = body
+        self.parallel = parallel # written `parallel for`, see Parallel.py
+        self.counted = None # set when first run, see Counted.py
 
     def __repr__(self):
         return f"ForStatement({self.init}, {self.condition}, {self.update}, {self.body})"
\ No newline at end of file
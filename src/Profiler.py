@@ -0,0 +1,189 @@
+import re
+import sys
+import time
+import types
+import bisect
+import signal
+import threading
+from collections import Counter
+import Parser_types as PTypes
+import Eval
+import ClosureEval
+import VM
+
+# Sampling profiler for Hoplite programs.
+#
+# A timer (SIGPROF where available, a sampling thread otherwise) interrupts
+# the interpreter every `interval` seconds. Each sample walks the Python stack
+# and rebuilds the Hoplite call stack from the backends' own frames: the
+# tree-walker's run_function/execute_statement/evaluate, the closure
+# backend's call closures, the VM's frame list and the transpiler's f_<name>
+# functions. Nothing is added to the evaluators, so programs run at full
+# speed when not profiling.
+#
+# Only the tree-walker knows the statement it is running; the other backends
+# report the line of the function's declaration.
+
+RUN_FUNCTION = Eval.Evaluator.run_function.__code__
+STATEMENT_CODES = (Eval.Evaluator.execute_statement.__code__, Eval.Evaluator.evaluate.__code__)
+CLOSURE_CALL = next(const for const in ClosureEval.ClosureEvaluator.compile_user_call.__code__.co_consts
+                    if isinstance(const, types.CodeType) and const.co_name == "call")
+VM_RUN = VM.VirtualMachine.run.__code__
+
+NEWLINE = re.compile("\n")
+
+
+class Profiler:
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = Counter()
+        self.newlines = {}
+        self.function_files = {}
+        self.functions = {}
+        self.current_file = "<unknown>"
+        self.thread = None
+        self.running = False
+        self.previous_handler = None
+
+    def add_program(self, file_name, source, ast):
+        """Registers a program about to run, so its positions map to lines."""
+        self.newlines[file_name] = [match.start() for match in NEWLINE.finditer(source)]
+        self.current_file = file_name
+        for node in ast:
+            if isinstance(node, PTypes.FunctionDeclaration):
+                self.function_files[node] = file_name
+                self.functions[node.name] = node
+
+    def line(self, file_name, pos):
+        if pos is None or file_name not in self.newlines:
+            return None
+        return bisect.bisect_right(self.newlines[file_name], pos) + 1
+
+    def function_entry(self, func):
+        return [func.name, self.function_files.get(func, self.current_file), PTypes.position(func)]
+
+    def named_entry(self, name):
+        func = self.functions.get(name)
+        if func is None:
+            return [name, self.current_file, None]
+        return self.function_entry(func)
+
+    def hoplite_stack(self, frame):
+        """The Hoplite call stack of a Python stack, as [name, file, pos] entries, outermost first."""
+        python_frames = []
+        while frame is not None:
+            python_frames.append(frame)
+            frame = frame.f_back
+        stack = [["<module>", self.current_file, None]]
+        for frame in reversed(python_frames):
+            code = frame.f_code
+            if code is RUN_FUNCTION or code is CLOSURE_CALL:
+                func = frame.f_locals.get("func")
+                if isinstance(func, PTypes.FunctionDeclaration):
+                    stack.append(self.function_entry(func))
+            elif code in STATEMENT_CODES:
+                pos = PTypes.position(frame.f_locals.get("node"))
+                if pos is not None:
+                    stack[-1][2] = pos
+            elif code is VM_RUN:
+                # the saved frames hold each caller's code object
+                variables = frame.f_locals
+                code_objects = [saved[0] for saved in variables["frames"]] + [variables["code_object"]]
+                for code_object in code_objects:
+                    if code_object.name != "<module>":
+                        stack.append(self.named_entry(code_object.name))
+            elif code.co_filename.startswith("<hoplite ") and code.co_name.startswith("f_"):
+                stack.append(self.named_entry(code.co_name[2:]))
+        return tuple(tuple(entry) for entry in stack)
+
+    def sample(self, frame):
+        self.samples[self.hoplite_stack(frame)] += 1
+
+    def handle_signal(self, signum, frame):
+        self.sample(frame)
+
+    def sample_thread(self, thread_id):
+        while self.running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self.sample(frame)
+
+    def start(self):
+        self.running = True
+        if hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread():
+            self.previous_handler = signal.signal(signal.SIGPROF, self.handle_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self.thread = threading.Thread(target=self.sample_thread, args=(threading.get_ident(),), daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self.previous_handler or signal.SIG_DFL)
+
+    def frame_name(self, entry):
+        name, file_name, pos = entry
+        line = self.line(file_name, pos)
+        if line is None:
+            return f"{name} ({file_name})"
+        return f"{name} ({file_name}:{line})"
+
+    def report(self, limit=15):
+        """Ranked text report: functions by self and total samples, then hot lines."""
+        total = sum(self.samples.values())
+        if not total:
+            return "profile: no samples (the program ran for less than one interval)"
+        self_counts = Counter()
+        total_counts = Counter()
+        line_counts = Counter()
+        for stack, count in self.samples.items():
+            name, file_name, pos = stack[-1]
+            function = self.frame_name((name, file_name, None))
+            self_counts[function] += count
+            line_counts[(file_name, self.line(file_name, pos), name)] += count
+            for entry in set((name, file_name) for name, file_name, pos in stack):
+                total_counts[self.frame_name(entry + (None,))] += count
+        lines = [f"profile: {total} samples every {self.interval * 1000:g} ms", "",
+                 "   self%  total%  function"]
+        for function, count in self_counts.most_common(limit):
+            lines.append(f"  {count / total:6.1%}  {total_counts[function] / total:6.1%}  {function}")
+        lines += ["", "   self%  line"]
+        for (file_name, line, name), count in line_counts.most_common(limit):
+            where = f"{file_name}:{line}" if line is not None else file_name
+            lines.append(f"  {count / total:6.1%}  {where} in {name}")
+        return "\n".join(lines)
+
+    def collapsed(self):
+        """Samples as collapsed stacks ("frame;frame;frame count"), as read by flamegraph.pl."""
+        return "\n".join(
+            ";".join(self.frame_name(entry).replace(";", ",") for entry in stack) + f" {count}"
+            for stack, count in sorted(self.samples.items(), key=lambda item: -item[1])
+        )
+
+
+if __name__ == "__main__":
+    import Lexer
+    import Parser
+    program = """mkfunc fib(n) {
+    if (n < 2) {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+print(fib(20))
+"""
+    ast = Parser.parse_program(Lexer.tokenize(program))
+    profiler = Profiler()
+    profiler.add_program("<demo>", program, ast)
+    profiler.start()
+    try:
+        Eval.Evaluator().execute(ast)
+    finally:
+        profiler.stop()
+    print(profiler.report())
@@ -0,0 +1,156 @@
+import operator
+import Parser_types as PTypes
+import Tokens as Token
+
+# Quickening of the tree-walker's operator nodes (--quicken).
+#
+# Every BinaryOperation, ComparisonOperation and AugmentedAssignment the
+# tree-walker evaluates gets a Site (in node.site) that records the operand
+# types it sees. Once a site has seen the same pair of types WARMUP times in
+# a row it specializes to them: its fast handler is the one operator function
+# for that pair (operator.add for int + int, operator.lt for float < float,
+# ...), and as long as both operands have exactly those types the evaluator
+# calls it straight away instead of going through its chain of operators.
+#
+# Operands of other types are a miss: the site deoptimizes, the operation
+# takes the generic path and the site starts watching again. A site that has
+# deoptimized MAX_DEOPTS times stays generic.
+#
+# Only numbers are specialized for arithmetic, and numbers and strings for
+# comparisons. Two ints can build a huge value with ^, and with * and *= when
+# squared over and over, which limited mode refuses (see Limits.py): ^ never
+# specializes for them, and neither do * and *= while the quickening
+# evaluator has limits. Every other fast path builds nothing the generic one
+# would check.
+#
+# Only a quickening evaluator adds sites and counts misses, but sites live on
+# the AST, so any evaluator running the same nodes takes their fast paths.
+# --quicken-stats prints the hits and misses of each site at exit.
+
+WARMUP = 2
+MAX_DEOPTS = 4
+
+NUMBERS = (int, float)
+COMPARABLE = (int, float, str)
+INT_PAIR = (int, int)
+POWERS = (Token.TOKENTYPE.CARAT, Token.TOKENTYPE.CARAT_EQUAL)
+PRODUCTS = (Token.TOKENTYPE.MUL, Token.TOKENTYPE.TIMES_EQUAL)
+
+OPERATIONS = {
+    Token.TOKENTYPE.PLUS: operator.add,
+    Token.TOKENTYPE.MINUS: operator.sub,
+    Token.TOKENTYPE.MUL: operator.mul,
+    Token.TOKENTYPE.DIV: operator.truediv,
+    Token.TOKENTYPE.MODULO: operator.mod,
+    Token.TOKENTYPE.CARAT: operator.pow,
+    Token.TOKENTYPE.PLUS_EQUAL: operator.iadd,
+    Token.TOKENTYPE.MINUS_EQUAL: operator.isub,
+    Token.TOKENTYPE.TIMES_EQUAL: operator.imul,
+    Token.TOKENTYPE.DIVIDE_EQUAL: operator.itruediv,
+    Token.TOKENTYPE.MODULO_EQUAL: operator.imod,
+    Token.TOKENTYPE.CARAT_EQUAL: operator.ipow,
+    Token.TOKENTYPE.IS_EQUAL: operator.eq,
+    Token.TOKENTYPE.NOT_EQUAL: operator.ne,
+    Token.TOKENTYPE.GREATER_THAN: operator.gt,
+    Token.TOKENTYPE.GREATER_THAN_OR_EQUAL: operator.ge,
+    Token.TOKENTYPE.LESS_THAN: operator.lt,
+    Token.TOKENTYPE.LESS_THAN_OR_EQUAL: operator.le,
+}
+
+
+class Site:
+    """The operand types seen at one operator node.
+
+    left and right are the types the site is specialized to (None while
+    it is not), fast the operator function it then runs."""
+
+    __slots__ = ("op", "label", "operation", "types", "left", "right", "fast",
+                 "seen", "streak", "hits", "misses", "deopts", "limited")
+
+    def __init__(self, node, limited=False):
+        self.op = node.op
+        self.label = repr(node)
+        self.operation = OPERATIONS.get(node.op)
+        self.types = COMPARABLE if isinstance(node, PTypes.ComparisonOperation) else NUMBERS
+        self.left = self.right = self.fast = None
+        self.seen = None
+        self.streak = 0
+        self.hits = 0
+        self.misses = 0
+        self.deopts = 0
+        self.limited = limited # int products stay generic, see above
+
+    def unchecked(self, types):
+        """Whether the fast handler for types would skip a check of limited mode."""
+        return types == INT_PAIR and (self.op in POWERS or self.limited and self.op in PRODUCTS)
+
+    def miss(self, left, right):
+        """Records operands the fast handler could not take."""
+        self.misses += 1
+        if self.fast is not None:
+            self.left = self.right = self.fast = None
+            self.deopts += 1
+        if self.operation is None or self.deopts >= MAX_DEOPTS:
+            return
+        seen = (type(left), type(right))
+        if seen[0] not in self.types or seen[1] not in self.types or self.unchecked(seen):
+            self.seen = None
+            self.streak = 0
+            return
+        if seen == self.seen:
+            self.streak += 1
+        else:
+            self.seen = seen
+            self.streak = 1
+        if self.streak >= WARMUP:
+            self.left, self.right = seen
+            self.fast = self.operation
+            self.streak = 0
+
+    def state(self):
+        if self.fast is not None:
+            return f"{self.left.__name__} {self.op} {self.right.__name__}"
+        return "generic" if self.deopts >= MAX_DEOPTS or self.operation is None else "watching"
+
+
+class Quickener:
+    """The sites of one evaluator."""
+
+    def __init__(self):
+        self.sites = []
+        self.limited = False
+
+    def site(self, node):
+        site = node.site
+        if site is None:
+            site = node.site = Site(node, self.limited)
+            self.sites.append(site)
+        return site
+
+    def set_limited(self, limited):
+        """Follows the evaluator into or out of limited mode."""
+        self.limited = limited
+        for site in self.sites:
+            site.limited = limited
+            if site.fast is not None and site.unchecked((site.left, site.right)):
+                site.left = site.right = site.fast = None
+
+    def stats(self):
+        lines = []
+        for site in sorted(self.sites, key=lambda site: -(site.hits + site.misses)):
+            total = site.hits + site.misses
+            lines.append(f"site {site.label}: {site.hits} hits, {site.misses} misses "
+                         f"({site.hits / total if total else 0:.1%}), {site.deopts} deopts, {site.state()}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    node = PTypes.BinaryOperation(PTypes.Variable("a"), Token.TOKENTYPE.PLUS, PTypes.Variable("b"))
+    quickener = Quickener()
+    site = quickener.site(node)
+    for left, right in [(1, 2), (3, 4), (5, 6), (1.5, 2), ("a", "b"), (7, 8), (9, 10), (11, 12)]:
+        if type(left) is site.left and type(right) is site.right:
+            site.hits += 1
+        else:
+            site.miss(left, right)
+    print(quickener.stats())
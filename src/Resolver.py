@@ -0,0 +1,93 @@
+import Parser_types as PTypes
+import Builtins
+
+# Scope analysis.
+#
+# A Hoplite function only ever sees its own parameters and the variables it
+# assigns, so every name inside a FunctionDeclaration can be given a fixed
+# slot in a list-based frame. The resolver annotates:
+#   FunctionDeclaration.local_names  names by slot (parameters first)
+#   Variable / Assignment / VariableDeclaration / AugmentedAssignment .slot
+# Top-level code keeps using the global symbol table, so its nodes keep
+# slot = None. Backends that understand slots (closure, vm) build frames as
+# [UNBOUND] * len(local_names) instead of dicts.
+
+
+class Unbound:
+    """Marker for a frame slot whose variable has not been assigned yet."""
+    def __repr__(self):
+        return "<unbound>"
+
+UNBOUND = Unbound()
+
+
+class Resolver:
+    def __init__(self):
+        self.diagnostics = []
+
+    def resolve_program(self, ast):
+        for node in ast:
+            if isinstance(node, PTypes.FunctionDeclaration):
+                if node.name in Builtins.COMPILED:
+                    self.diagnostics.append(f"Function '{node.name}' is shadowed by the builtin of the same name")
+                elif node.name in Builtins.CALLABLE:
+                    self.diagnostics.append(f"Function '{node.name}' replaces the builtin of the same name "
+                                            f"once it is declared")
+                if node.lazy_body is None:
+                    self.resolve_function(node)
+        return self.diagnostics
+
+    def resolve_function(self, func):
+        func.resolved = True
+        if len(set(func.parameters)) != len(func.parameters):
+            # repeated parameter names keep the dict frame's "last one wins"
+            func.local_names = None
+            return func
+        slots = {name: index for index, name in enumerate(func.parameters)}
+        nodes = [node for statement in func.body for node in PTypes.walk(statement)]
+        if not func.is_async and any(isinstance(node, PTypes.Await) for node in nodes):
+            self.diagnostics.append(f"'await' in function '{func.name}', which is not async")
+        for node in nodes:
+            if isinstance(node, PTypes.VariableDeclaration):
+                node.slot = slots.setdefault(node.name, len(slots))
+            elif isinstance(node, (PTypes.Assignment, PTypes.AugmentedAssignment)):
+                node.slot = slots.setdefault(node.variable, len(slots))
+        for node in nodes:
+            if isinstance(node, PTypes.Variable):
+                if node.name not in slots:
+                    # never assigned in the function, and functions cannot see
+                    # globals, so this read can only fail. It still gets a
+                    # slot, one that stays UNBOUND and raises when read.
+                    self.diagnostics.append(f"Undefined variable '{node.name}' in function '{func.name}'")
+                node.slot = slots.setdefault(node.name, len(slots))
+        func.local_names = list(slots)
+        return func
+
+
+def resolve_program(ast):
+    return Resolver().resolve_program(ast)
+
+def resolve_function(func):
+    """Resolve a function the first time a slot-aware backend runs it."""
+    if not func.resolved:
+        Resolver().resolve_function(func)
+    return func
+
+
+if __name__ == "__main__":
+    import Lexer
+    import Parser
+    program = """
+    mkfunc sqrt(x) {
+        var tolerance = 0.000001
+        var estimate = x / 2
+        while (abs(estimate * estimate - x) > tolerance) {
+            estimate = (estimate + x / estimate) / 2
+        }
+        return estimat
+    }
+    """
+    ast = Parser.parse_program(Lexer.tokenize(program))
+    for diagnostic in resolve_program(ast):
+        print(diagnostic)
+    print(ast[0].local_names)
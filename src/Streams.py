@@ -0,0 +1,219 @@
+import mmap
+import itertools
+
+# Streaming and memory-mapped file I/O.
+#
+#   read_lines(path)               a stream of the lines of a text file
+#   read_chunks(path, size)        a stream of bytes, size bytes at a time
+#   has_next(stream)               whether the stream has another line or chunk
+#   next(stream)                   the next line or chunk, false at the end
+#   close(stream)                  closes a stream (or a mapped file) early
+#   mmap_file(path)                the bytes of a file, mapped into memory
+#   byte_slice(bytes, start, stop) bytes start..stop of a mapped file or bytes
+#   find_bytes(bytes, text, start) where text next occurs from start, or -1
+#   decode(bytes)                  bytes as text (UTF-8)
+#   length(value)                  the length of a string, array, bytes or mapped file
+#   write_lines(path, lines)       writes a list (or a stream) of lines
+#
+# Streams read through a buffer of BUFFER_SIZE bytes and hold one line or
+# chunk at a time, so a file of any size is processed in constant memory:
+#
+#   var lines = read_lines("server.log")
+#   while (has_next(lines)) {
+#       var line = next(lines)
+#       ...
+#   }
+#
+# A program's own mkfunc named next, close, length or any other of these is
+# called instead of the builtin once it is declared (see Builtins.py).
+#
+# Lines come without their newline.
+# A stream closes its file when it reaches the end. A mapped file is paged in
+# by the OS as it is read, and find_bytes searches it without copying it.
+
+BUFFER_SIZE = 1024 * 1024
+ENCODING = "utf-8"
+WRITE_BATCH = 4096
+
+
+class LineStream:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "r", encoding=ENCODING, errors="replace", buffering=BUFFER_SIZE)
+        self.pending = None
+
+    def __iter__(self):
+        while self.has_next():
+            yield self.next()
+            if self.file is not None:
+                # the rest of the file, without a has_next() per line
+                for line in self.file:
+                    yield line[:-1] if line[-1] == "\n" else line
+                self.close()
+
+    def read(self):
+        line = self.file.readline()
+        if not line:
+            return None
+        if line[-1] == "\n":
+            return line[:-1]
+        return line
+
+    def has_next(self):
+        if self.pending is None and self.file is not None:
+            self.pending = self.read()
+            if self.pending is None:
+                self.close()
+        return self.pending is not None
+
+    def next(self):
+        if not self.has_next():
+            return False
+        item = self.pending
+        self.pending = None
+        return item
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __repr__(self):
+        return f"<lines of {self.path}>"
+
+
+class ChunkStream(LineStream):
+    def __init__(self, path, size):
+        if size < 1:
+            raise Exception(f"read_chunks() needs a chunk size of at least 1, got {size}")
+        self.path = path
+        self.size = size
+        self.file = open(path, "rb", buffering=BUFFER_SIZE)
+        self.pending = None
+
+    def __iter__(self):
+        while self.has_next():
+            yield self.next()
+
+    def read(self):
+        return self.file.read(self.size) or None
+
+    def __repr__(self):
+        return f"<chunks of {self.path}>"
+
+
+class MappedFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file cannot be mapped
+                self.map = b""
+
+    def __len__(self):
+        return len(self.map)
+
+    def __getitem__(self, index):
+        return self.map[index]
+
+    def find(self, needle, start):
+        return self.map.find(needle, start)
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+    def __repr__(self):
+        return f"<mapped {self.path}, {len(self.map)} bytes>"
+
+
+def as_bytes(value):
+    if isinstance(value, str):
+        return value.encode(ENCODING)
+    return value
+
+def require_stream(name, stream, types=LineStream):
+    if not isinstance(stream, types):
+        raise Exception(f"{name}() needs a stream from read_lines() or read_chunks(), got {stream!r}")
+
+
+def read_lines(path):
+    return LineStream(path)
+
+def read_chunks(path, size):
+    return ChunkStream(path, size)
+
+def has_next(stream):
+    require_stream("has_next", stream)
+    return stream.has_next()
+
+def next_item(stream):
+    require_stream("next", stream)
+    return stream.next()
+
+def close(stream):
+    require_stream("close", stream, (LineStream, MappedFile))
+    stream.close()
+
+def mmap_file(path):
+    return MappedFile(path)
+
+def byte_slice(data, start, stop):
+    if not isinstance(data, (MappedFile, bytes)):
+        raise Exception(f"byte_slice() needs a mapped file or bytes, got {data!r}")
+    return data[start:stop]
+
+def find_bytes(data, needle, start):
+    if not isinstance(data, (MappedFile, bytes)):
+        raise Exception(f"find_bytes() needs a mapped file or bytes, got {data!r}")
+    return data.find(as_bytes(needle), start)
+
+def decode(data):
+    return bytes(data).decode(ENCODING, errors="replace")
+
+def length(value):
+    return len(value)
+
+def write_lines(path, lines):
+    count = 0
+    lines = iter(lines)
+    with open(path, "w", encoding=ENCODING, buffering=BUFFER_SIZE) as f:
+        # joined a batch at a time rather than written line by line
+        batch = list(itertools.islice(lines, WRITE_BATCH))
+        while batch:
+            f.write("\n".join(map(str, batch)))
+            f.write("\n")
+            count += len(batch)
+            batch = list(itertools.islice(lines, WRITE_BATCH))
+    return count
+
+
+BUILTINS = {
+    "read_lines": read_lines,
+    "read_chunks": read_chunks,
+    "has_next": has_next,
+    "next": next_item,
+    "close": close,
+    "mmap_file": mmap_file,
+    "byte_slice": byte_slice,
+    "find_bytes": find_bytes,
+    "decode": decode,
+    "length": length,
+    "write_lines": write_lines,
+}
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "demo.log")
+        print(write_lines(path, ["INFO start", "", "ERROR disk full", "INFO done"]))
+        print(list(read_lines(path)))
+        print(list(read_chunks(path, 16)))
+        mapped = mmap_file(path)
+        at = find_bytes(mapped, "ERROR", 0)
+        print(length(mapped), at, decode(byte_slice(mapped, at, at + 15)))
+        close(mapped)
@@ -35,6 +35,10 @@ class TOKENTYPE:
     LBRACE = "LBRACE"
     COMMA = "COMMA"
     FUNCTION_DECLARATION = "FUNCTION_DECLARATION"
+    MEMO = "MEMO"
+    PARALLEL = "PARALLEL"
+    ASYNC = "ASYNC"
+    AWAIT = "AWAIT"
     SEMICOLON = "SEMICOLON"
     INTEGER = "INTEGER"
     FLOAT = "FLOAT"
@@ -48,6 +52,7 @@ class TOKENTYPE:
     MINUS = "MINUS"
     MUL = "MUL"
     DIV = "DIV"
+    SQUARE = "SQUARE" # no token: the unary operator -O2 makes of x ^ 2, see Optimizer.py
 
 COMPARISON_OPERATORS = (
     TOKENTYPE.NOT_EQUAL,
@@ -112,6 +117,10 @@ TOKEN_RULES = {
     TOKENTYPE.RETURN: r"return",
     TOKENTYPE.COMMA: r",",
     TOKENTYPE.FUNCTION_DECLARATION: r"mkfunc",
+    TOKENTYPE.MEMO: r"memo\b",
+    TOKENTYPE.PARALLEL: r"parallel\b",
+    TOKENTYPE.ASYNC: r"async\b",
+    TOKENTYPE.AWAIT: r"await\b",
     TOKENTYPE.SEMICOLON: r";",
     TOKENTYPE.INTEGER: r"(\d+)",
     TOKENTYPE.FLOAT: r"(\d+\.\d+)",
@@ -146,6 +155,10 @@ TOKEN_PRIORITY = [
     TOKENTYPE.WHILE,
     TOKENTYPE.RETURN,
     TOKENTYPE.FUNCTION_DECLARATION,
+    TOKENTYPE.MEMO,
+    TOKENTYPE.PARALLEL,
+    TOKENTYPE.ASYNC,
+    TOKENTYPE.AWAIT,
     TOKENTYPE.VAR,
     TOKENTYPE.IF,
     # ----- symbols -----
@@ -189,9 +202,12 @@ for key, value in TOKEN_RULES.items():
     TOKEN_RULES[key] = re.compile(value)
 
 class Token:
-    def __init__(self, type, value):
+    __slots__ = ("type", "value", "pos")
+
+    def __init__(self, type, value, pos=None):
         self.type = type
         self.value = value
+        self.pos = pos # offset of the token in the source text
 
     def __repr__(self):
         return f"Token({self.type}, \"{self.value}\")"
@@ -0,0 +1,427 @@
+import re
+import time
+import Parser_types as PTypes
+import Tokens as Token
+import Eval
+import Lazy
+import Builtins
+import Counted
+
+# Python transpiler backend.
+#
+# Each mkfunc becomes a real Python function whose Hoplite locals are Python
+# locals, and loops become native while loops (counted for loops, see
+# Counted.py, native for loops over their values). Hoplite names are prefixed
+# with `v_` so they can never clash with Python keywords or the helpers in
+# the generated module's namespace.
+#
+# A function body that contains anything the transpiler does not handle runs
+# on the tree-walker instead; at the top level the same is done per statement.
+#
+# For a limited evaluator (see Limits.py) loop bodies start with _tick(),
+# functions are wrapped to count as calls, and + * ^ (plain and augmented)
+# call the checked versions.
+
+BINARY_OPERATORS = {
+    Token.TOKENTYPE.PLUS: "+",
+    Token.TOKENTYPE.MINUS: "-",
+    Token.TOKENTYPE.MUL: "*",
+    Token.TOKENTYPE.DIV: "/",
+    Token.TOKENTYPE.MODULO: "%",
+    Token.TOKENTYPE.CARAT: "**",
+    Token.TOKENTYPE.IS_EQUAL: "==",
+    Token.TOKENTYPE.NOT_EQUAL: "!=",
+    Token.TOKENTYPE.GREATER_THAN: ">",
+    Token.TOKENTYPE.GREATER_THAN_OR_EQUAL: ">=",
+    Token.TOKENTYPE.LESS_THAN: "<",
+    Token.TOKENTYPE.LESS_THAN_OR_EQUAL: "<=",
+}
+AUGMENTED_OPERATORS = {
+    Token.TOKENTYPE.PLUS_EQUAL: "+=",
+    Token.TOKENTYPE.MINUS_EQUAL: "-=",
+    Token.TOKENTYPE.TIMES_EQUAL: "*=",
+    Token.TOKENTYPE.DIVIDE_EQUAL: "/=",
+    Token.TOKENTYPE.MODULO_EQUAL: "%=",
+    Token.TOKENTYPE.CARAT_EQUAL: "**=",
+}
+CHECKED_OPERATORS = {
+    Token.TOKENTYPE.PLUS: "_add",
+    Token.TOKENTYPE.MUL: "_multiply",
+    Token.TOKENTYPE.CARAT: "_power",
+    Token.TOKENTYPE.PLUS_EQUAL: "_iadd",
+    Token.TOKENTYPE.TIMES_EQUAL: "_imultiply",
+    Token.TOKENTYPE.CARAT_EQUAL: "_ipower",
+}
+UNBOUND_NAME = re.compile(r"'v_(\w+)'")
+
+
+class Uncompilable(Exception):
+    pass
+
+
+class Transpiler:
+    """Generates Python source for one function or top-level chunk.
+
+    `global_names` are accessed through the global symbol table instead of
+    Python locals; the top level uses it for names that are also functions."""
+
+    def __init__(self, in_function=False, global_names=(), declarations=None, limited=False):
+        self.in_function = in_function
+        self.global_names = global_names
+        self.declarations = declarations
+        self.limited = limited
+        self.lines = []
+        self.loops = 0
+
+    def emit(self, line, indent):
+        self.lines.append("    " * indent + line)
+
+    def local(self, name):
+        return "v_" + name
+
+    def block(self, statements, indent):
+        start = len(self.lines)
+        for statement in statements:
+            self.statement(statement, indent)
+        if len(self.lines) == start:
+            self.emit("pass", indent)
+
+    def loop_body(self, statements, indent):
+        if self.limited:
+            self.emit("_tick()", indent)
+        self.block(statements, indent)
+
+    def store(self, name, value, indent):
+        if name in self.global_names:
+            self.emit(f"_G[{name!r}] = {value}", indent)
+        else:
+            self.emit(f"{self.local(name)} = {value}", indent)
+
+    def statement(self, node, indent, collect_result=False):
+        if isinstance(node, PTypes.VariableDeclaration):
+            self.store(node.name, self.expression(node.value), indent)
+        elif isinstance(node, PTypes.Assignment):
+            self.store(node.variable, self.expression(node.value), indent)
+        elif isinstance(node, PTypes.AugmentedAssignment):
+            operator = AUGMENTED_OPERATORS.get(node.op)
+            if operator is None or node.variable in self.global_names:
+                raise Uncompilable(node)
+            variable = self.local(node.variable)
+            if self.limited and node.op in CHECKED_OPERATORS:
+                self.emit(f"{variable} = {CHECKED_OPERATORS[node.op]}({variable}, {self.expression(node.value)})",
+                          indent)
+            else:
+                self.emit(f"{variable} {operator} {self.expression(node.value)}", indent)
+        elif isinstance(node, PTypes.FunctionDeclaration) and self.declarations is not None:
+            if node not in self.declarations:
+                self.declarations.append(node)
+            self.emit(f"_declare({self.declarations.index(node)})", indent)
+        elif isinstance(node, PTypes.ReturnStatement):
+            if self.in_function:
+                self.emit(f"return {self.expression(node.value)}", indent)
+            else:
+                self.emit(f"raise _ReturnValue({self.expression(node.value)})", indent)
+        elif isinstance(node, PTypes.IfStatement):
+            self.emit(f"if {self.expression(node.condition)}:", indent)
+            self.block(node.if_body, indent + 1)
+            if node.else_body is not None:
+                self.emit("else:", indent)
+                self.block(node.else_body, indent + 1)
+        elif isinstance(node, PTypes.WhileStatement):
+            self.emit(f"while {self.expression(node.condition)}:", indent)
+            self.loop_body(node.body, indent + 1)
+        elif isinstance(node, PTypes.ForStatement) and not node.parallel:
+            counted = Counted.counted_loop(node)
+            if counted is not None and counted.name not in self.global_names:
+                self.counted_loop(node, counted, indent)
+            else:
+                self.statement(node.init, indent)
+                self.emit(f"while {self.expression(node.condition)}:", indent)
+                self.loop_body(node.body, indent + 1)
+                self.statement(node.update, indent + 1)
+        elif isinstance(node, PTypes.Expression):
+            expression = self.expression(node)
+            if collect_result:
+                self.emit(f"_collect({expression})", indent)
+            else:
+                self.emit(expression, indent)
+        else:
+            raise Uncompilable(node)
+
+    def counted_loop(self, node, counted, indent):
+        # for/else: the counter only gets its final value if the loop ran out
+        counter = self.local(counted.name)
+        values = f"_values{self.loops}"
+        self.loops += 1
+        self.statement(node.init, indent)
+        self.emit(f"{values} = _count({counter}, {self.expression(counted.bound)}, {counted.op!r}, "
+                  f"{counted.update!r}, {counted.amount!r})", indent)
+        self.emit(f"for {counter} in {values}:", indent)
+        self.loop_body(node.body, indent + 1)
+        self.emit("else:", indent)
+        self.emit(f"{counter} = _final({values})", indent + 1)
+
+    def expression(self, node):
+        if isinstance(node, PTypes.Literal):
+            # folded values can be negative: (-1) ** n, not -1 ** n
+            return f"({node.value!r})"
+        elif isinstance(node, PTypes.NumberLiteral):
+            return repr(int(node.value) if node.type == 'int' else float(node.value))
+        elif isinstance(node, PTypes.StringLiteral):
+            return repr(node.value)
+        elif isinstance(node, PTypes.BooleanLiteral):
+            return repr(node.value == 'true')
+        elif isinstance(node, PTypes.Variable):
+            if node.name in self.global_names:
+                return f"_load({node.name!r})"
+            return self.local(node.name)
+        elif isinstance(node, (PTypes.BinaryOperation, PTypes.ComparisonOperation)):
+            operator = BINARY_OPERATORS.get(node.op)
+            if operator is None:
+                raise Uncompilable(node)
+            if self.limited and node.op in CHECKED_OPERATORS:
+                return f"{CHECKED_OPERATORS[node.op]}({self.expression(node.left)}, {self.expression(node.right)})"
+            # fully parenthesised: Hoplite comparisons never chain the way
+            # Python's do, and its precedence differs from Python's
+            return f"({self.expression(node.left)} {operator} {self.expression(node.right)})"
+        elif isinstance(node, PTypes.UnaryOperation):
+            if node.op == Token.TOKENTYPE.MINUS:
+                return f"(-{self.expression(node.operand)})"
+            elif node.op == Token.TOKENTYPE.BANG:
+                return f"(not {self.expression(node.operand)})"
+            elif node.op == Token.TOKENTYPE.SQUARE:
+                # compiled Python squares no faster with a type check in front
+                if self.limited:
+                    return f"_power({self.expression(node.operand)}, 2)"
+                return f"({self.expression(node.operand)} ** 2)"
+            raise Uncompilable(node)
+        elif isinstance(node, PTypes.ArrayLiteral):
+            return "[" + ", ".join(self.expression(element) for element in node.elements) + "]"
+        elif isinstance(node, PTypes.FunctionCall):
+            if node.name == "print":
+                if not node.arguments:
+                    raise Uncompilable(node)
+                return f"_print({self.expression(node.arguments[0])})"
+            elif node.name == "time":
+                return "_time()"
+            elif node.name in Builtins.CALLABLE and Builtins.arity_error(node.name, len(node.arguments)) is None:
+                arguments = ", ".join(self.expression(argument) for argument in node.arguments)
+                return f"_builtin({node.name!r}, {len(node.arguments)})({arguments})"
+            arguments = ", ".join(self.expression(argument) for argument in node.arguments)
+            return f"_function({node.name!r}, {len(node.arguments)})({arguments})"
+        raise Uncompilable(node)
+
+
+def variable_names(node):
+    """Names a top-level chunk reads or writes, not counting function bodies."""
+    if isinstance(node, list):
+        names = set()
+        for item in node:
+            names |= variable_names(item)
+        return names
+    names = set()
+    if isinstance(node, PTypes.FunctionDeclaration):
+        return names
+    if isinstance(node, (PTypes.Variable, PTypes.VariableDeclaration)):
+        names.add(node.name)
+    elif isinstance(node, (PTypes.Assignment, PTypes.AugmentedAssignment)):
+        names.add(node.variable)
+    for child in PTypes.child_nodes(node):
+        names |= variable_names(child)
+    return names
+
+def function_names(node):
+    """Names a program calls or declares as functions."""
+    if isinstance(node, list):
+        names = set()
+        for item in node:
+            names |= function_names(item)
+        return names
+    names = set()
+    if isinstance(node, (PTypes.FunctionCall, PTypes.FunctionDeclaration)):
+        names.add(node.name)
+    if isinstance(node, (PTypes.Statement, PTypes.Expression)):
+        for child in PTypes.child_nodes(node):
+            names |= function_names(child)
+    return names
+
+
+class PythonEvaluator(Eval.Evaluator):
+    def __init__(self):
+        super().__init__()
+        self.python_functions = {}
+        self.declarations = []
+        self.namespace = {
+            "_G": self.global_symbol_table,
+            "_print": self.print_value,
+            "_time": time.time,
+            "_builtin": self.bind_builtin,
+            "_function": self.bind_function,
+            "_declare": self.declared_function,
+            "_load": self.load_global,
+            "_sync": self.sync_globals,
+            "_ReturnValue": Eval.ReturnValue,
+            "_count": Counted.values,
+            "_final": Counted.final,
+        }
+
+    def set_limits(self, limits):
+        super().set_limits(limits)
+        self.python_functions.clear()
+        if limits is not None:
+            self.namespace.update(_tick=limits.tick, _add=limits.add, _multiply=limits.multiply,
+                                  _power=limits.power, _iadd=limits.iadd, _imultiply=limits.imultiply,
+                                  _ipower=limits.ipower)
+
+    def print_value(self, value):
+        self.output.print(value)
+
+    def load_global(self, name):
+        if name in self.global_symbol_table:
+            return self.global_symbol_table[name]
+        raise Exception(f"Undefined variable '{name}'")
+
+    def declared_function(self, index):
+        self.declare_function(self.declarations[index])
+
+    def sync_globals(self, local_variables):
+        for name, value in local_variables.items():
+            if name.startswith("v_"):
+                self.global_symbol_table[name[2:]] = value
+
+    def bind_builtin(self, name, argument_count):
+        if Builtins.calls_builtin(self.global_symbol_table, name):
+            return self.builtins[name]
+        return self.bind_function(name, argument_count)
+
+    def bind_function(self, name, argument_count):
+        func = self.global_symbol_table.get(name)
+        if not func:
+            if name in Builtins.CALLABLE:
+                # a builtin name with arguments the builtin does not take
+                raise Builtins.arity_error(name, argument_count)
+            raise Exception(f"Function '{name}' not defined")
+        if argument_count != len(func.parameters):
+            raise Exception(f"Expected {len(func.parameters)} arguments, got {argument_count}")
+        python_function = self.python_functions.get(func)
+        if python_function is None:
+            python_function = self.compile_function(func)
+            python_function = self.python_functions[func] = self.memo.wrap(func, python_function)
+        return python_function
+
+    def call_function(self, func, arguments):
+        return self.bind_function(func.name, len(arguments))(*arguments)
+
+    def compile_source(self, source, name):
+        namespace = dict(self.namespace)
+        exec(compile(source, f"<hoplite {name}>", "exec"), namespace)
+        return namespace
+
+    def compile_function(self, func):
+        Lazy.load_body(func)
+        if func.is_async:
+            start = self.async_runner.start
+            return lambda *arguments: start(func, dict(zip(func.parameters, arguments)))
+        transpiler = Transpiler(in_function=True, limited=self.limits is not None)
+        try:
+            transpiler.block(func.body, 1)
+        except Uncompilable:
+            return self.tree_walker_function(func)
+        parameters = ", ".join(transpiler.local(param) for param in func.parameters)
+        source = "\n".join([f"def f_{func.name}({parameters}):"] + transpiler.lines)
+        try:
+            function = self.compile_source(source, func.name)[f"f_{func.name}"]
+        except SyntaxError:
+            # e.g. a parameter list naming the same variable twice
+            return self.tree_walker_function(func)
+        if self.limits is not None:
+            function = self.limits.calling(function)
+        return function
+
+    def tree_walker_function(self, func):
+        def call(*arguments):
+            return self.run_function(func, dict(zip(func.parameters, arguments)))
+        return call
+
+    def compile_chunk(self, statements, lines, global_names):
+        # top-level variables live in Python locals while the chunk runs and
+        # are written back to the global symbol table when it ends
+        header = ["def chunk(_collect):"]
+        for name in sorted(variable_names(statements) - global_names):
+            header.append(f"    if {name!r} in _G: v_{name} = _G[{name!r}]")
+        header.append("    try:")
+        footer = ["    finally:", "        _sync(locals())"]
+        return self.compile_source("\n".join(header + lines + footer), "<module>")["chunk"]
+
+    def execute(self, ast):
+        if self.async_runner.needed(ast):
+            return self.async_runner.execute(ast)
+        results = []
+
+        def collect(value):
+            if value is not None:
+                results.append(value)
+
+        # names that are also called or declared as functions stay in the
+        # global symbol table so lookups by name see every update
+        global_names = function_names(ast) | set(self.global_symbol_table_functions())
+        chunk, lines = [], []
+        if self.limits is not None:
+            self.limits.start()
+        try:
+            for node in ast:
+                transpiler = Transpiler(global_names=global_names, declarations=self.declarations,
+                                        limited=self.limits is not None)
+                try:
+                    transpiler.statement(node, 2, collect_result=True)
+                except Uncompilable:
+                    if chunk:
+                        self.compile_chunk(chunk, lines, global_names)(collect)
+                        chunk, lines = [], []
+                    result = self.evaluate(node)
+                    if result is not None:
+                        results.append(result)
+                    continue
+                chunk.append(node)
+                lines += transpiler.lines
+            if chunk:
+                self.compile_chunk(chunk, lines, global_names)(collect)
+        except NameError as ex:
+            name = UNBOUND_NAME.search(str(ex))
+            if name is None:
+                raise
+            raise Exception(f"Undefined variable '{name.group(1)}'") from None
+        except RecursionError:
+            if self.limits is None:
+                raise
+            raise self.limits.too_deep() from None
+        finally:
+            if self.limits is not None:
+                self.limits.stop()
+            self.output.flush()
+        return results
+
+    def global_symbol_table_functions(self):
+        return [name for name, value in self.global_symbol_table.items()
+                if isinstance(value, PTypes.FunctionDeclaration)]
+
+
+if __name__ == "__main__":
+    import Lexer
+    import Parser
+    program = """
+    mkfunc factorial(n) {
+        var result = 1
+        while (n > 0) {
+            result = result * n
+            n = n - 1
+        }
+        return result
+    }
+    var i = 0
+    while (i < 5) {
+        print(factorial(i))
+        i = i + 1
+    }
+    """
+    PythonEvaluator().execute(Parser.parse_program(Lexer.tokenize(program)))
@@ -0,0 +1,379 @@
+import time
+import operator
+import Eval
+import Bytecode
+import Memo
+import Builtins
+import Counted
+import Parser_types as PTypes
+from Bytecode import *
+from Resolver import UNBOUND
+from Memo import MISSING
+
+# deepest chain of active Hoplite calls before the VM gives up
+MAX_DEPTH = 1000000
+
+
+class VirtualMachine(Eval.Evaluator):
+    """Runs Bytecode code objects on an operand stack.
+
+    Hoplite calls push a frame onto self.frames instead of recursing in
+    Python, so the dispatch loop in run() handles the whole program and
+    recursion depth is only bounded by max_depth. Tail calls replace the
+    calling frame, so tail recursion runs in constant space.
+
+    A call to a memoized function that misses its cache records the cache
+    and key in `pending`, kept with the frame; RETURN_VALUE stores the
+    returned value under it."""
+
+    def __init__(self, max_depth=MAX_DEPTH):
+        super().__init__()
+        self.compiled_functions = {}
+        self.frames = []
+        self.results = []
+        self.max_depth = max_depth
+
+    def function_code(self, func):
+        code_object = self.compiled_functions.get(func)
+        if code_object is None:
+            code_object = self.compiled_functions[func] = Bytecode.compile_function(func, self.limits is not None)
+            if code_object.local_names is not None:
+                code_object.padding = [UNBOUND] * (len(code_object.local_names) - len(func.parameters))
+        return code_object
+
+    def set_limits(self, limits):
+        super().set_limits(limits)
+        self.compiled_functions.clear()
+
+    def bound(self, frame, slot, code_object):
+        # augmented assignment to an unassigned variable fails like the
+        # tree-walker's dict lookup does
+        value = frame[slot]
+        if value is UNBOUND:
+            raise KeyError(code_object.local_names[slot])
+        return value
+
+    def execute(self, ast):
+        if self.async_runner.needed(ast):
+            return self.async_runner.execute(ast)
+        self.results = []
+        if self.limits is not None:
+            self.limits.start()
+        try:
+            self.run(Bytecode.compile_program(ast, self.limits is not None), self.global_symbol_table)
+        except RecursionError:
+            if self.limits is None:
+                raise
+            raise self.limits.too_deep() from None
+        finally:
+            if self.limits is not None:
+                self.limits.stop()
+            # drop the frames of a call chain an error unwound through
+            del self.frames[:]
+            self.output.flush()
+        return self.results
+
+    def call_function(self, func, arguments):
+        code_object = self.function_code(func)
+        if code_object.local_names is None:
+            scope = dict(zip(func.parameters, arguments))
+        else:
+            scope = list(arguments) + code_object.padding
+        base = len(self.frames)
+        try:
+            return self.run(code_object, scope)
+        finally:
+            del self.frames[base:]
+
+    def call_declared(self, func, arguments):
+        # a mkfunc named like a builtin, called where the builtin was compiled
+        if len(arguments) != len(func.parameters):
+            raise Exception(f"Expected {len(func.parameters)} arguments, got {len(arguments)}")
+        cache = self.memo.cache(func)
+        if cache is not None:
+            return self.memo.call(cache, arguments, lambda arguments: self.call_function(func, arguments))
+        return self.call_function(func, arguments)
+
+    def run(self, code_object, scope):
+        symbols = self.global_symbol_table
+        frames = self.frames
+        memo = self.memo
+        limits = self.limits
+        base = len(frames)
+        depth_limit = base + self.max_depth
+        if limits is not None and limits.max_depth is not None and limits.max_depth < self.max_depth:
+            depth_limit = base + limits.max_depth
+        pending = None
+        code = code_object.code
+        consts = code_object.consts
+        names = code_object.names
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        while True:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+            if op == LOAD_FAST:
+                value = scope[arg]
+                if value is UNBOUND:
+                    raise Exception(f"Undefined variable '{code_object.local_names[arg]}'")
+                push(value)
+            elif op == STORE_FAST:
+                scope[arg] = pop()
+            elif op == LOAD_NAME:
+                try:
+                    push(scope[names[arg]])
+                except KeyError:
+                    raise Exception(f"Undefined variable '{names[arg]}'") from None
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == STORE_NAME:
+                scope[names[arg]] = pop()
+            elif op == POP_JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == FOR_COUNTED:
+                value = next(stack[-1], MISSING)
+                if value is MISSING:
+                    pop()
+                    stack[-1] = Counted.final(stack[-1])
+                    pc = arg
+                else:
+                    push(value)
+            elif op == ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif op == SUBTRACT:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == MULTIPLY:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == DIVIDE:
+                right = pop()
+                stack[-1] = stack[-1] / right
+            elif op == LESS_THAN:
+                right = pop()
+                stack[-1] = stack[-1] < right
+            elif op == GREATER_THAN:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == PREPARE_CALL:
+                name, argument_count = consts[arg]
+                func = symbols.get(name)
+                if not func:
+                    if name in Builtins.CALLABLE:
+                        # compiled as a call because the builtin takes other arguments
+                        raise Builtins.arity_error(name, argument_count)
+                    raise Exception(f"Function '{name}' not defined")
+                if argument_count != len(func.parameters):
+                    raise Exception(f"Expected {len(func.parameters)} arguments, got {argument_count}")
+                push(func)
+            elif op == CALL:
+                arguments = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                func = pop()
+                cache = memo.cache(func)
+                key = None
+                if cache is not None:
+                    try:
+                        key = Memo.memo_key(arguments)
+                    except TypeError:
+                        cache = None
+                    else:
+                        value = cache.lookup(key)
+                        if value is not MISSING:
+                            push(value)
+                            continue
+                if len(frames) >= depth_limit:
+                    if depth_limit - base < self.max_depth:
+                        raise limits.too_deep()
+                    raise Exception(f"Maximum call depth ({self.max_depth}) exceeded calling '{func.name}'")
+                frames.append((code_object, code, consts, names, pc, scope, stack, pending))
+                pending = (cache, key) if cache is not None else None
+                code_object = self.function_code(func)
+                code = code_object.code
+                consts = code_object.consts
+                names = code_object.names
+                if code_object.local_names is None:
+                    scope = dict(zip(func.parameters, arguments))
+                else:
+                    scope = arguments
+                    scope.extend(code_object.padding)
+                stack = []
+                push = stack.append
+                pop = stack.pop
+                pc = 0
+            elif op == TAIL_CALL:
+                # `pending` stays: the callee's value is this frame's value
+                arguments = stack[len(stack) - arg:]
+                func = stack[len(stack) - arg - 1]
+                code_object = self.function_code(func)
+                code = code_object.code
+                consts = code_object.consts
+                names = code_object.names
+                if code_object.local_names is None:
+                    scope = dict(zip(func.parameters, arguments))
+                else:
+                    scope = arguments
+                    scope.extend(code_object.padding)
+                stack = []
+                push = stack.append
+                pop = stack.pop
+                pc = 0
+            elif op == RETURN_VALUE:
+                value = pop()
+                if pending is not None:
+                    pending[0].store(pending[1], value)
+                if len(frames) == base:
+                    return value
+                code_object, code, consts, names, pc, scope, stack, pending = frames.pop()
+                push = stack.append
+                pop = stack.pop
+                push(value)
+            elif op == MODULO:
+                right = pop()
+                stack[-1] = stack[-1] % right
+            elif op == POWER:
+                right = pop()
+                stack[-1] = stack[-1] ** right
+            elif op == LESS_THAN_OR_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] <= right
+            elif op == GREATER_THAN_OR_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] >= right
+            elif op == IS_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == NOT_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == NEGATE:
+                stack[-1] = -stack[-1]
+            elif op == NOT:
+                stack[-1] = not stack[-1]
+            elif op == SQUARE:
+                value = stack[-1]
+                stack[-1] = value * value if type(value) is int else value ** 2
+            elif op == POP:
+                pop()
+            elif op == POP_RESULT:
+                value = pop()
+                if value is not None:
+                    self.results.append(value)
+            elif op == PRINT:
+                self.output.print(stack[-1])
+                stack[-1] = None
+            elif op == TIME:
+                push(time.time())
+            elif op == START_TASK:
+                push(self.async_runner.start(consts[arg], scope))
+            elif op == CALL_BUILTIN:
+                name, argument_count = consts[arg]
+                if argument_count:
+                    arguments = stack[-argument_count:]
+                    del stack[-argument_count:]
+                else:
+                    arguments = []
+                func = symbols.get(name)
+                if type(func) is PTypes.FunctionDeclaration:
+                    push(self.call_declared(func, arguments))
+                else:
+                    push(self.builtins[name](*arguments))
+            elif op == BUILD_LIST:
+                if arg:
+                    elements = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    elements = []
+                push(elements)
+            elif op == AUG_ADD:
+                right = pop()
+                scope[names[arg]] = operator.iadd(scope[names[arg]], right)
+            elif op == AUG_SUBTRACT:
+                right = pop()
+                scope[names[arg]] = operator.isub(scope[names[arg]], right)
+            elif op == AUG_MULTIPLY:
+                right = pop()
+                scope[names[arg]] = operator.imul(scope[names[arg]], right)
+            elif op == AUG_DIVIDE:
+                right = pop()
+                scope[names[arg]] = operator.itruediv(scope[names[arg]], right)
+            elif op == AUG_MODULO:
+                right = pop()
+                scope[names[arg]] = operator.imod(scope[names[arg]], right)
+            elif op == AUG_POWER:
+                right = pop()
+                scope[names[arg]] = operator.ipow(scope[names[arg]], right)
+            elif op == AUG_ADD_FAST:
+                right = pop()
+                scope[arg] = operator.iadd(self.bound(scope, arg, code_object), right)
+            elif op == AUG_SUBTRACT_FAST:
+                right = pop()
+                scope[arg] = operator.isub(self.bound(scope, arg, code_object), right)
+            elif op == AUG_MULTIPLY_FAST:
+                right = pop()
+                scope[arg] = operator.imul(self.bound(scope, arg, code_object), right)
+            elif op == AUG_DIVIDE_FAST:
+                right = pop()
+                scope[arg] = operator.itruediv(self.bound(scope, arg, code_object), right)
+            elif op == AUG_MODULO_FAST:
+                right = pop()
+                scope[arg] = operator.imod(self.bound(scope, arg, code_object), right)
+            elif op == AUG_POWER_FAST:
+                right = pop()
+                scope[arg] = operator.ipow(self.bound(scope, arg, code_object), right)
+            elif op == DECLARE_FUNCTION:
+                self.declare_function(consts[arg])
+            elif op == EVALUATE:
+                push(self.evaluate(consts[arg], scope))
+            elif op == RAISE_RETURN:
+                raise Eval.ReturnValue(pop())
+            elif op == TICK:
+                limits.tick()
+            elif op == COUNTED_VALUES:
+                bound = pop()
+                values = stack[-1] = consts[arg].values(stack[-1], bound)
+                push(iter(values))
+            elif op == CHECKED_ADD:
+                right = pop()
+                stack[-1] = limits.add(stack[-1], right)
+            elif op == CHECKED_MULTIPLY:
+                right = pop()
+                stack[-1] = limits.multiply(stack[-1], right)
+            elif op == CHECKED_IADD:
+                right = pop()
+                stack[-1] = limits.iadd(stack[-1], right)
+            elif op == CHECKED_IMULTIPLY:
+                right = pop()
+                stack[-1] = limits.imultiply(stack[-1], right)
+            elif op == CHECKED_POWER:
+                right = pop()
+                stack[-1] = limits.power(stack[-1], right)
+            elif op == CHECKED_IPOWER:
+                right = pop()
+                stack[-1] = limits.ipower(stack[-1], right)
+            elif op == CHECKED_SQUARE:
+                stack[-1] = limits.power(stack[-1], 2)
+            else:
+                raise Exception(f"Unknown opcode {op}")
+
+
+if __name__ == "__main__":
+    import Lexer
+    import Parser
+    program = """
+    mkfunc factorial(n) {
+        if (n < 2) {
+            return 1
+        }
+        return n * factorial(n - 1)
+    }
+    print(factorial(20))
+    """
+    VirtualMachine().execute(Parser.parse_program(Lexer.tokenize(program)))
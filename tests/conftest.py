@@ -0,0 +1,29 @@
+import os
+import sys
+
+# the interpreter's modules import each other by bare name from src/
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+sys.path.insert(0, SRC)
+
+
+def example_sources():
+    """(file name, source) of every example program."""
+    sources = []
+    for name in sorted(os.listdir(EXAMPLES)):
+        if name.endswith(".hpl"):
+            with open(os.path.join(EXAMPLES, name), "r") as f:
+                sources.append((name, f.read()))
+    return sources
+
+
+def run_programs(evaluator, *programs, args=()):
+    """The lines evaluator prints running each program in turn, like -i files."""
+    import io
+    import Lexer
+    import Parser
+    import Hoplite1
+    evaluator.output.stream = io.StringIO()
+    for program in programs:
+        evaluator.execute(Hoplite1.prepare_program(Parser.parse_program(Lexer.tokenize(program)), list(args)))
+    return evaluator.output.stream.getvalue().splitlines()
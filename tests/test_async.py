@@ -0,0 +1,73 @@
+import io
+import pytest
+from conftest import run_programs
+import Hoplite1
+import Lexer
+import Parser
+
+PROGRAM = """
+async mkfunc twice(x) {
+    await sleep(0)
+    return x * 2
+}
+mkfunc plain(x) {
+    return x + 1
+}
+print(plain(1))
+var t = twice(20)
+print(await t)
+"""
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_async_program_runs(backend):
+    assert run_programs(Hoplite1.BACKENDS[backend](), PROGRAM) == ["2", "40"]
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_later_program_runs_after_async_one(backend):
+    evaluator = Hoplite1.BACKENDS[backend]()
+    assert run_programs(evaluator, PROGRAM, "print(plain(2))", "print(await twice(1))") == ["2", "40", "3", "2"]
+
+
+class Greeter:
+    methods = {"greet": lambda arguments: "hi " + str(arguments[0].value)}
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_awaited_method_argument(backend):
+    evaluator = Hoplite1.BACKENDS[backend]()
+    evaluator.global_symbol_table["g"] = Greeter()
+    program = "async mkfunc work(x) {\n    return x\n}\nprint(g.greet(3))\nprint(g.greet(await work(3)))"
+    assert run_programs(evaluator, program) == ["hi 3", "hi 3"]
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_awaited_method_argument_fails_like_a_plain_one(backend):
+    program = 'async mkfunc work(x) {\n    return x\n}\nvar s = "ab"\nprint(s.upper(ARG))'
+    messages = []
+    for argument in ("1", "await work(1)"):
+        with pytest.raises(Exception) as info:
+            run_programs(Hoplite1.BACKENDS[backend](), program.replace("ARG", argument))
+        messages.append(str(info.value))
+    assert messages[0] == messages[1] == "Variable 's' does not have method 'upper'"
+
+
+def test_preparing_marks_top_level_statements():
+    ast = Hoplite1.prepare_program(Parser.parse_program(Lexer.tokenize(PROGRAM)), [])
+    assert [statement.event_loop for statement in ast] == [True, False, False, False, True]
+    assert [statement.awaits for statement in ast] == [False, False, False, False, True]
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_same_ast_runs_on_two_evaluators(backend):
+    ast = Hoplite1.prepare_program(Parser.parse_program(Lexer.tokenize(PROGRAM)), [])
+    outputs = []
+    for _ in range(2):
+        evaluator = Hoplite1.BACKENDS[backend]()
+        evaluator.output.stream = io.StringIO()
+        evaluator.execute(ast)
+        evaluator.execute(ast)
+        evaluator.output.flush()
+        outputs.append(evaluator.output.stream.getvalue().split())
+    assert outputs == [["2", "40", "2", "40"]] * 2
@@ -0,0 +1,23 @@
+import pytest
+from conftest import example_sources
+import Lexer
+
+
+@pytest.mark.parametrize("name, source", example_sources())
+def test_examples_lex_like_reference(name, source):
+    assert Lexer.compare_lexers(source) is None
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_sources_lex_like_reference(seed):
+    assert Lexer.compare_lexers(Lexer.random_source(200, seed)) is None
+
+
+def test_keyword_prefix_quirk_is_kept():
+    tokens = Lexer.tokenize("format = 1")
+    assert [token.type for token in tokens[:2]] == ["FOR", "NAME"]
+
+
+def test_trailing_whitespace_ends_in_eof():
+    assert Lexer.tokenize("x ")[-1].type == "EOF"
+    assert Lexer.tokenize("x")[-1].type == "NAME"
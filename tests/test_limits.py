@@ -0,0 +1,96 @@
+import os
+import pytest
+from conftest import run_programs
+import Hoplite1
+import Limits
+import Quicken
+
+RUNAWAY_RECURSION = """
+mkfunc f(n) {
+    return f(n + 1) + 1
+}
+print(f(0))
+"""
+
+
+def limited(backend, **limits):
+    evaluator = Hoplite1.BACKENDS[backend]()
+    evaluator.set_limits(Limits.Limits(**limits))
+    return evaluator
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_runaway_recursion_is_a_limit(backend):
+    with pytest.raises(Limits.LimitExceeded):
+        run_programs(limited(backend, max_steps=5000), RUNAWAY_RECURSION)
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_call_depth_limit(backend):
+    with pytest.raises(Limits.LimitExceeded, match="Call depth limit of 50"):
+        run_programs(limited(backend, max_depth=50), RUNAWAY_RECURSION)
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+@pytest.mark.parametrize("program", [
+    "var x = 9\nvar y = 99999999\nprint(x ^ y)",
+    "mkfunc p(x, y) {\n var z = x\n z ^= y\n return z\n}\nprint(p(9, 99999999))",
+])
+def test_huge_integer_power_is_refused(backend, program):
+    with pytest.raises(Limits.LimitExceeded, match="digits"):
+        run_programs(limited(backend, timeout=5), program, args=["-O0"])
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+@pytest.mark.parametrize("program", [
+    "var x = 3\nvar n = 0\nwhile (n < 27) {\n x = x * x\n n = n + 1\n}\nprint(n)",
+    "var x = 3\nvar n = 0\nwhile (n < 27) {\n x *= x\n n += 1\n}\nprint(n)",
+    "async mkfunc same(v) {\n return v\n}\nvar x = 3\nvar n = 0\n"
+    "while (n < 27) {\n x *= await same(x)\n n += 1\n}\nprint(n)",
+])
+def test_huge_integer_product_is_refused(backend, program):
+    with pytest.raises(Limits.LimitExceeded, match="product"):
+        run_programs(limited(backend, timeout=0.05, max_size=1000), program)
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_squaring_at_o2_is_refused(backend):
+    program = "mkfunc square(x) {\n return x ^ 2\n}\nvar x = 3\nvar n = 0\n" \
+              "while (n < 27) {\n x = square(x)\n n += 1\n}\nprint(n)"
+    with pytest.raises(Limits.LimitExceeded, match="power"):
+        run_programs(limited(backend, timeout=0.05), program, args=["-O2"])
+
+
+@pytest.mark.parametrize("body", ["return x * x", "var y = x\n y *= x\n return y"])
+@pytest.mark.parametrize("limit_first", [False, True])
+def test_quickened_product_is_still_refused(body, limit_first):
+    library = f"mkfunc square(x) {{\n {body}\n}}\n"
+    warm = "var n = 0\nwhile (n < 5) {\n print(square(n))\n n += 1\n}"
+    runaway = "var x = 3\nvar n = 0\nwhile (n < 27) {\n x = square(x)\n n += 1\n}\nprint(n)"
+    evaluator = Hoplite1.BACKENDS["tree"]()
+    evaluator.quickener = Quicken.Quickener()
+    limits = Limits.Limits(timeout=0.05, max_size=1000)
+    if limit_first:
+        evaluator.set_limits(limits)
+    run_programs(evaluator, library, warm)
+    # the sites in square have seen int * int by now
+    evaluator.set_limits(limits)
+    with pytest.raises(Limits.LimitExceeded, match="product"):
+        run_programs(evaluator, runaway)
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_small_powers_still_run(backend):
+    program = "var x = 2\nprint(x ^ 10)\nprint(x ^ 0.5)\nx ^= 3\nprint(x)"
+    assert run_programs(limited(backend, timeout=5), program) == ["1024", "1.4142135623730951", "8"]
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_file_builtins_are_refused(backend, tmp_path):
+    path = tmp_path / "out.txt"
+    program = f'write_lines("{path}", ["x"])'
+    with pytest.raises(Limits.LimitExceeded, match="write_lines"):
+        run_programs(limited(backend, timeout=5), program)
+    assert not os.path.exists(path)
+    run_programs(limited(backend, timeout=5, allow_files=True), program)
+    assert path.read_text() == "x\n"
@@ -0,0 +1,55 @@
+import pytest
+from conftest import run_programs
+import Hoplite1
+
+LIBRARY = """
+mkfunc g(x) {
+    return 1
+}
+mkfunc f(x) {
+    return g(x)
+}
+print(f(0))
+"""
+
+PURE_REDEFINITION = """
+print(f(0))
+mkfunc g(x) {
+    return 2
+}
+print(f(0))
+"""
+
+IMPURE_REDEFINITION = """
+mkfunc g(x) {
+    print("g")
+    return 3
+}
+print(f(0))
+print(f(0))
+"""
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_redeclared_callee_is_not_served_from_cache(backend):
+    lines = run_programs(Hoplite1.BACKENDS[backend](), LIBRARY, PURE_REDEFINITION)
+    assert lines == ["1", "1", "2"]
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_caller_of_impure_redeclaration_is_no_longer_memoized(backend):
+    lines = run_programs(Hoplite1.BACKENDS[backend](), LIBRARY, IMPURE_REDEFINITION)
+    assert lines == ["1", "g", "3", "g", "3"]
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_explicit_memo_cache_is_emptied(backend):
+    library = LIBRARY.replace("mkfunc f", "memo mkfunc f")
+    lines = run_programs(Hoplite1.BACKENDS[backend](), library, PURE_REDEFINITION)
+    assert lines == ["1", "1", "2"]
+
+
+def test_pure_function_is_memoized():
+    evaluator = Hoplite1.BACKENDS["tree"]()
+    run_programs(evaluator, LIBRARY, "print(f(0))")
+    assert any(cache.hits for cache in evaluator.memo.caches.values() if cache is not None)
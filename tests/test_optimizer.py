@@ -0,0 +1,76 @@
+import io
+import time
+import pytest
+from conftest import run_programs
+import Counted
+import Hoplite1
+import Lexer
+import Optimizer
+import Parser
+import Parser_types as PTypes
+
+
+def optimized(source, level=2):
+    optimizer = Optimizer.Optimizer(level)
+    ast = optimizer.optimize_program(Parser.parse_program(Lexer.tokenize(source)))
+    return ast, optimizer.counts
+
+
+def test_square_of_a_variable_is_a_square_operation():
+    ast, counts = optimized("mkfunc f(x) {\n    return x ^ 2\n}\n")
+    square = ast[0].body[0].value
+    assert isinstance(square, PTypes.UnaryOperation) and square.op == "SQUARE"
+    assert counts["powers reduced"] == 1
+
+
+def test_square_is_kept_below_o2():
+    ast, counts = optimized("mkfunc f(x) {\n    return x ^ 2\n}\n", level=1)
+    assert ast[0].body[0].value.op == "CARAT"
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+@pytest.mark.parametrize("value", ["7", "-7", "2 ^ 100", "1.5", "true", '"ab"', "1.0e200", "[1, 2]"])
+def test_square_of_any_value_matches_unoptimized(backend, value):
+    program = f"mkfunc f(x) {{\n    return x ^ 2 + (x ^ 2) ^ 2\n}}\nprint(f({value}))\n"
+    outcomes = []
+    for level in ("-O0", "-O2"):
+        evaluator = Hoplite1.BACKENDS[backend]()
+        try:
+            outcomes.append(run_programs(evaluator, program, args=[level]))
+        except Exception as ex:
+            outcomes.append(str(ex))
+    assert outcomes[0] == outcomes[1]
+
+
+COUNTED_LOOP = """var t = 0
+var a = 3
+var b = 4
+for (var i = 0; i < 40000; i += 1) {
+    t = t + i * (a * b)
+}
+print(t)
+"""
+
+
+def test_hoisting_keeps_a_counted_for_loop():
+    ast, counts = optimized(COUNTED_LOOP)
+    assert counts["invariants hoisted"] == 1
+    guard = ast[-2]
+    assert isinstance(guard, PTypes.IfStatement) and isinstance(guard.if_body[-1], PTypes.ForStatement)
+    assert Counted.counted_loop(guard.if_body[-1]) is not None
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_hoisting_does_not_slow_down_a_counted_loop(backend):
+    def best(level):
+        times = []
+        for _ in range(3):
+            evaluator = Hoplite1.BACKENDS[backend]()
+            evaluator.output.stream = io.StringIO()
+            ast = Hoplite1.prepare_program(Parser.parse_program(Lexer.tokenize(COUNTED_LOOP)), [level])
+            start = time.perf_counter()
+            evaluator.execute(ast)
+            times.append(time.perf_counter() - start)
+            assert evaluator.global_symbol_table["t"] == 9599760000
+        return min(times)
+    assert best("-O2") < best("-O1") * 1.25
@@ -0,0 +1,79 @@
+import pytest
+from conftest import example_sources
+import io
+import Lexer
+import Parser
+import Hoplite1
+
+
+def errors_in(source):
+    with pytest.raises(Parser.SyntaxErrors) as info:
+        Parser.parse_program(Lexer.tokenize(source))
+    return [message for pos, message in info.value.errors]
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("name, source", example_sources())
+def test_examples_parse_like_reference(name, source, lazy):
+    assert Parser.compare_parsers(Lexer.tokenize(source), lazy) is None
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("seed", range(200))
+def test_random_programs_parse_like_reference(seed, lazy):
+    tokens = Lexer.tokenize(Parser.random_program(20, seed))
+    assert Parser.compare_parsers(tokens, lazy) is None
+
+
+@pytest.mark.parametrize("statement", [
+    "mkfunc inner(x) { return x }",
+    "memo mkfunc inner(x) { return x }",
+    "async mkfunc inner(x) { return x }",
+])
+def test_function_in_block_is_one_error(statement):
+    source = f"var a = 1\nif (a > 0) {{\n    {statement}\n    print(a)\n}}\nprint(a)\n"
+    assert len(errors_in(source)) == 1
+
+
+def test_each_mistake_is_one_error():
+    source = ("var a = 1\n"
+              "if (a > 0) {\n    mkfunc inner(x) {\n        return x\n    }\n    print(a)\n}\n"
+              "while () { a = 1 }\n"
+              "print(a +)\n")
+    assert len(errors_in(source)) == 3
+
+
+def test_statements_after_an_error_are_kept():
+    with pytest.raises(Parser.SyntaxErrors) as info:
+        Parser.parse_program(Lexer.tokenize("print(1 +)\nvar b = 2\nprint(b)\n"))
+    assert len(info.value.errors) == 1
+    assert len(info.value.statements) == 2
+
+
+LAZY_PROGRAM = """mkfunc ok(x) {
+    return x
+}
+mkfunc broken(x) {
+    return x +
+}
+print(ok(1))
+print(broken(2))
+"""
+
+
+@pytest.mark.parametrize("backend", Hoplite1.BACKENDS)
+def test_lazy_body_error_has_location(backend):
+    evaluator = Hoplite1.BACKENDS[backend]()
+    evaluator.output.stream = io.StringIO()
+    ast = Hoplite1.load_program(LAZY_PROGRAM, ["--lazy"], "lazy.hpl")
+    with pytest.raises(Parser.SyntaxErrors) as info:
+        evaluator.execute(ast)
+    assert str(info.value) == "lazy.hpl:6:1: In function 'broken': Unknown atom Token(RBRACE, \"}\")"
+
+
+def test_lazy_body_error_matches_eager_location():
+    with pytest.raises(Parser.SyntaxErrors) as eager:
+        Hoplite1.load_program(LAZY_PROGRAM, [], "lazy.hpl")
+    with pytest.raises(Parser.SyntaxErrors) as checked:
+        Hoplite1.load_program(LAZY_PROGRAM, ["--lazy", "--check-syntax"], "lazy.hpl")
+    assert str(eager.value).split(": ")[0] == str(checked.value).split(": ")[0] == "lazy.hpl:6:1"